@@ -1,37 +1,90 @@
 import os
 import sys
+import math
+import time
 import types
+import atexit
+import random
 import hashlib
 import inspect
+import marshal
+import logging
 import binascii
 import functools
+import threading
+from multiprocessing.pool import ThreadPool
 
 try:
   import cPickle as pickle
 except ImportError:
   import pickle
 
-from .backend import AbstractBackend
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from . import codec, metrics
+from .backend import AbstractBackend, AbstractLock, layered
 
 
-__all__ = 'Hermes', 'Mangler'
+__all__ = 'Hermes', 'Mangler', 'Revalidator', 'Writer'
+
+logger = logging.getLogger(__name__)
 
 
 class Mangler(object):
-  '''Key manager responsible for creating keys, hashing and serialisation'''
+  '''Key manager responsible for creating keys, hashing and serialisation. Values are
+  serialised with pickle, unless already encoded by a codec from ``hermes.codec``. On load
+  the codec is chosen by value format marker.'''
 
   prefix = 'cache'
   '''Prefix for cache and tag entries'''
 
+  _primitives = frozenset((type(None), bool, int, float, str, bytes))
+  try:
+    # Python 2
+    _primitives |= frozenset((long, unicode))  # @UndefinedVariable
+  except NameError:
+    pass
+  '''Argument types that are encoded with ``marshal``'''
+
+  _memoTypes = _primitives - frozenset((float,))
+  '''Argument types, hashes of which are memoised. ``float`` is excluded, because
+  ``0.0 == -0.0`` but their encoding differs.'''
 
-  def hash(self, value):
-    return hashlib.md5(value).hexdigest()[::2] # full md5 seems too long
+  memoSize = 4096
+  '''Maximum number of memoised argument hashes, and of memoised entry key prefixes'''
+
+  _prefixes = None
+  '''Memo of entry key prefixes, dictionary of ``(function, class)`` to prefix'''
+
+  _hashes = None
+  '''Memo of argument hashes, dictionary of ``(args, argument types)`` to hash'''
+
+  _marshals = None
+  '''Flag defining if primitive arguments are encoded with ``marshal``, which is the case
+  unless ``dumps`` is overridden, see ``packArguments``'''
+
+
+  if hasattr(hashlib, 'blake2b'):
+    def hash(self, value):
+      return hashlib.blake2b(value, digest_size = 8).hexdigest()
+  else:
+    # Python < 3.6
+    def hash(self, value):
+      return hashlib.md5(value).hexdigest()[::2] # full md5 seems too long
 
   def dumps(self, value):
+    if isinstance(value, codec.Encoded):
+      return value
     return pickle.dumps(value, protocol = pickle.HIGHEST_PROTOCOL)
 
   def loads(self, value):
-    return pickle.loads(value)
+    if value[:1] == b'\x80':
+      # fast path for pickle, the most common case
+      return pickle.loads(value)
+    return codec.decode(value)
 
   def nameEntry(self, fn, *args, **kwargs):
     '''Return cache key for given callable and its positional and keyword arguments.
@@ -69,6 +122,17 @@ class Mangler(object):
     process restart the cache can still be valid and usable).
     '''
 
+    return self._namePrefix(fn) + self.hashArguments(args, kwargs)
+
+  def _namePrefix(self, fn):
+    '''Return memoised ``prefix:entry:module:[class:]name:`` part of callable's entry key'''
+
+    memoKey = getattr(fn, '__func__', fn), type(getattr(fn, '__self__', None))
+    try:
+      return self._prefixes[memoKey]
+    except (KeyError, TypeError):
+      pass
+
     result = [self.prefix, 'entry']
     if callable(fn):
       try:
@@ -84,10 +148,70 @@ class Mangler(object):
     else:
       raise TypeError('Fn is expected to be callable')
 
-    arguments = args, tuple(sorted(kwargs.items()))
-    result.append(self.hash(self.dumps(arguments)))
+    result.append('')
+    prefix = ':'.join(result)
+
+    if self._prefixes is None or len(self._prefixes) >= self.memoSize:
+      self._prefixes = {}
+    try:
+      self._prefixes[memoKey] = prefix
+    except TypeError:
+      # unhashable callable
+      pass
+
+    return prefix
 
-    return ':'.join(result)
+  def hashArguments(self, args, kwargs):
+    '''Return hash of positional and keyword arguments. Hashes of positional-only arguments
+    of primitive types, except ``float``, are memoised, as their calculation is the most
+    expensive part of entry key creation. Argument types are part of memo key because
+    ``1 == 1.0 == True``.'''
+
+    if not kwargs:
+      # only arguments of memoised types are put into memo, so validation is needed on miss
+      memoKey = args, tuple(map(type, args))
+      try:
+        return self._hashes[memoKey]
+      except (KeyError, TypeError):
+        pass
+
+      if self._memoTypes.issuperset(memoKey[1]):
+        result = self.hash(self.packArguments(args, kwargs))
+        if self._hashes is None or len(self._hashes) >= self.memoSize:
+          self._hashes = {}
+        self._hashes[memoKey] = result
+        return result
+
+    return self.hash(self.packArguments(args, kwargs))
+
+  def packArguments(self, args, kwargs):
+    '''Return bytes representation of positional and keyword arguments, which is hashed into
+    entry key. When all arguments are of primitive types, ``None``, ``bool``, ``int``,
+    ``float``, ``str`` and ``bytes``, they are encoded with ``marshal``, which is several
+    times faster than pickling. Version 0 of its format is used because it doesn't depend on
+    string interning and reference counts. Otherwise, or when ``dumps`` is overridden,
+    arguments are serialised with ``dumps``.'''
+
+    kwargs = tuple(sorted(kwargs.items())) if kwargs else ()
+
+    marshals = self._marshals
+    if marshals is None:
+      dumps    = type(self).dumps
+      marshals = self._marshals = getattr(dumps, '__func__', dumps) is _dumps
+
+    if marshals:
+      primitives = self._primitives
+      for v in args:
+        if type(v) not in primitives:
+          break
+      else:
+        for _, v in kwargs:
+          if type(v) not in primitives:
+            break
+        else:
+          return marshal.dumps((args, kwargs), 0)
+
+    return self.dumps((args, kwargs))
 
   def nameTag(self, tag):
     return u':'.join([self.prefix, 'tag', tag])
@@ -107,6 +231,219 @@ class Mangler(object):
     return ':'.join([self.prefix, 'lock', entryKey])
 
 
+_dumps = getattr(Mangler.dumps, '__func__', Mangler.dumps) # Python 2 unbound
+'''Function of ``Mangler.dumps``, to tell if a mangler overrides it'''
+
+
+class _None(object):
+  '''Type of the sentinel saved in place of ``None`` result, see ``cacheNone`` of ``Cached``'''
+
+  def __reduce__(self):
+    # unpickled as the same object
+    return '_none'
+
+_none = _None()
+
+
+class _Raised(object):
+  '''Exception raised by cached callable, saved in place of its result, see ``errorTtl`` of
+  ``Cached``'''
+
+  __slots__ = 'error',
+
+
+  def __init__(self, error):
+    self.error = error
+
+  def __reduce__(self):
+    # the exception is pickled separately, so its failure to unpickle is a cache miss
+    return _restoreRaised, (pickle.dumps(self.error, protocol = pickle.HIGHEST_PROTOCOL),)
+
+def _restoreRaised(data):
+  '''Return ``_Raised`` of pickled exception, or ``None`` if it can't be unpickled, e.g. when
+  its constructor has required arguments other than ``args``'''
+
+  try:
+    return _Raised(pickle.loads(data))
+  except Exception:
+    logger.warning('Cached exception cannot be unpickled', exc_info = True)
+
+_sentinels = _None, _Raised
+'''Types of the values saved in place of the callable's result'''
+
+
+class _Flight(object):
+  '''In-process computation of an entry, which other threads wait for, see ``singleFlight``
+  of ``Cached``'''
+
+  __slots__ = 'event', 'value', 'error'
+
+
+  def __init__(self):
+    self.event = threading.Event()
+    self.value = None
+    self.error = None
+
+
+class Revalidator(object):
+  '''Background worker that refreshes stale cache entries, see ``softTtl`` of ``Cached``.
+  Refreshes are run one at a time in a daemon thread, which is started on first submit. A
+  refresh of an entry key which is already queued is ignored.'''
+
+  _queue = None
+  '''Queue of ``(key, function)`` tuples'''
+
+  _pending = None
+  '''Set of queued entry keys'''
+
+  _mutex = None
+  '''Lock guarding the pending set and the thread start'''
+
+  _thread = None
+  '''Worker thread'''
+
+  _pid = None
+  '''Process id the worker was started in, the state is reset in a forked child'''
+
+
+  def __init__(self):
+    self._mutex = threading.Lock()
+    self._reset()
+
+  def _reset(self):
+    self._queue   = queue.Queue()
+    self._pending = set()
+    self._thread  = None
+    self._pid     = os.getpid()
+
+  def submit(self, key, fn):
+    '''Queue the refresh function of the entry key, unless the key is already queued'''
+
+    with self._mutex:
+      if self._pid != os.getpid():
+        self._reset()
+      if key in self._pending:
+        return
+      self._pending.add(key)
+
+      if not self._thread:
+        self._thread = threading.Thread(target = self._run, name = 'hermes-revalidator')
+        self._thread.daemon = True
+        self._thread.start()
+
+    self._queue.put((key, fn))
+
+  def join(self):
+    '''Block until all queued refreshes are done'''
+
+    self._queue.join()
+
+  def _run(self):
+    while True:
+      key, fn = self._queue.get()
+      try:
+        fn()
+      except Exception:
+        logger.exception('Refresh of %s has failed', key)
+      finally:
+        with self._mutex:
+          self._pending.discard(key)
+        self._queue.task_done()
+
+
+class Writer(object):
+  '''Background worker that saves computed entries, see ``writeBehind`` of ``Cached``. Saves
+  are run in a daemon thread, which is started on first submit. Saves queued by the time the
+  worker wakes up are coalesced into one bulk save per backend, tags, codec, metrics and TTL.
+  Entry lock is released after its entry is saved, so concurrent callers wait for the entry
+  instead of recomputing it. Queue is flushed on interpreter shutdown.'''
+
+  maxsize = 1024
+  '''Maximum number of queued saves, when the queue is full entries are saved synchronously'''
+
+  _queue = None
+  '''Queue of ``(cached, key, entry, ttl, lock)`` tuples'''
+
+  _mutex = None
+  '''Lock guarding the thread start'''
+
+  _thread = None
+  '''Worker thread'''
+
+  _pid = None
+  '''Process id the worker was started in, the state is reset in a forked child'''
+
+
+  def __init__(self, maxsize = None):
+    self.maxsize = maxsize or self.maxsize
+    self._mutex  = threading.Lock()
+    self._reset()
+
+  def _reset(self):
+    self._queue  = queue.Queue(self.maxsize)
+    self._thread = None
+    self._pid    = os.getpid()
+
+  def submit(self, cached, key, entry, ttl, lock):
+    '''Queue the entry save of the cached callable. The lock, if any, is released after the
+    save. Return ``False`` if the queue is full, then the caller should save the entry.'''
+
+    with self._mutex:
+      if self._pid != os.getpid():
+        self._reset()
+      if not self._thread:
+        self._thread = threading.Thread(target = self._run, name = 'hermes-writer')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.flush)
+
+    try:
+      self._queue.put_nowait((cached, key, entry, ttl, lock))
+    except queue.Full:
+      return False
+    else:
+      return True
+
+  def flush(self):
+    '''Block until all queued saves are done'''
+
+    if self._thread and self._pid == os.getpid():
+      self._queue.join()
+
+  def _run(self):
+    while True:
+      items = [self._queue.get()]
+      while True:
+        try:
+          items.append(self._queue.get_nowait())
+        except queue.Empty:
+          break
+
+      groups = {}
+      for item in items:
+        cached, _, _, ttl, _ = item
+        # metrics and serialisation mode are of the callable, so callables sharing backend
+        # and tags aren't coalesced unless they share these too
+        groupKey = (cached._backend, cached._tagKeys, cached._codec, cached._metrics,
+          cached._preserialise, ttl)
+        groups.setdefault(groupKey, []).append(item)
+
+      for group in groups.values():
+        try:
+          group[0][0]._save(mapping = {k : e for _, k, e, _, _ in group}, ttl = group[0][3])
+        except Exception:
+          logger.exception('Write-behind save of %d entries has failed', len(group))
+        finally:
+          for _, key, _, _, lock in group:
+            try:
+              if lock:
+                lock.release()
+            except Exception:
+              logger.exception('Lock release of %s has failed', key)
+            finally:
+              self._queue.task_done()
+
+
 class Cached(object):
   '''A wrapper for cached function or method'''
 
@@ -134,9 +471,86 @@ class Cached(object):
   _keyFunc  = None
   '''Key creation function'''
 
+  _prefix = None
+  '''Precomputed entry key prefix of the callable, see ``Mangler.nameEntry``. It's ``None``
+  when a custom key function or ``Mangler.nameEntry`` override is in use, then entry key is
+  created by ``_keyFunc``.'''
+
   _tags = None
   '''Cache entry tags for decorated callable'''
 
+  _boundPrefixes = None
+  '''Dictionary of class of bound callable's ``__self__`` to entry key prefix of bound
+  callable'''
+
+  _boundClasses = {}
+  '''Dictionary of ``Cached`` class to its bound wrapper class, see ``_bind``'''
+
+  _tagKeys = None
+  '''Sorted tuple of tag entry keys'''
+
+  _codec = None
+  '''Value codec, ``hermes.codec.Codec`` instance, or ``None`` for mangler's serialisation'''
+
+  _softTtl = None
+  '''Seconds after which cache entry is stale. Stale value is returned while the entry is
+  refreshed in background.'''
+
+  _beta = None
+  '''Parameter of probabilistic early recomputation, XFetch. Greater values make it earlier.'''
+
+  _jitter = None
+  '''Maximum fraction by which entry TTL is randomly shortened'''
+
+  _envelope = False
+  '''Flag defining if values are stored in ``(value, expireAt, delta)`` envelopes, where
+  ``expireAt`` is the time the entry becomes stale, or ``ttl`` expiry when ``softTtl`` is not
+  set, and ``delta`` is the duration of the entry's computation'''
+
+  _envelopeKey = 'envelope'
+  '''Entry key segment of envelope entries. Plain and envelope entries of a callable have
+  different keys, so enabling or disabling ``softTtl`` or ``beta`` for a callable with
+  entries in the cache doesn't make it load entries of the other shape.'''
+
+  _revalidator = None
+  '''Background worker refreshing stale entries, ``Revalidator`` instance'''
+
+  _cacheNone = False
+  '''Flag defining if ``None`` result is cached. It's saved as a sentinel, unless envelopes
+  are used.'''
+
+  _errorTtl = None
+  '''Seconds to cache exceptions of ``_errors`` types raised by the callable'''
+
+  _errors = ()
+  '''Tuple of exception classes, instances of which are cached'''
+
+  _special = False
+  '''Flag defining if results are saved as sentinels, ``None`` or exception. A loaded sentinel
+  is unwrapped regardless, as it may have been saved by the callable with other options.'''
+
+  _writer = None
+  '''Background worker saving computed entries, ``Writer`` instance, or ``hermes.aio.Writer``
+  for a coroutine function, when write-behind is enabled'''
+
+  _metrics = None
+  '''Counters and latency histograms of the callable, ``hermes.metrics.Metrics`` instance,
+  when metrics are enabled'''
+
+  _preserialise = False
+  '''Flag defining if values are serialised in advance, when metrics are enabled, which is
+  the case for ``Mangler.dumps`` that passes serialised values through'''
+
+  _lock = True
+  '''Flag defining if missing entry is computed under backend lock'''
+
+  _flights = None
+  '''Dictionary of entry key to ``_Flight`` of its leader thread, when single-flight is
+  enabled'''
+
+  _flightMutex = None
+  '''Lock guarding the flight dictionary'''
+
 
   def __init__(self, backend, mangler, ttl, callable, **kwargs):
     self._backend  = backend
@@ -144,10 +558,39 @@ class Cached(object):
     self._ttl      = ttl
     self._keyFunc  = kwargs.get('key', self._mangler.nameEntry)
     self._tags     = kwargs.get('tags', None)
+    if self._tags:
+      self._tagKeys = tuple(sorted(map(self._mangler.nameTag, self._tags)))
+    if kwargs.get('codec'):
+      self._codec = codec.get(kwargs['codec'])
+    self._softTtl  = kwargs.get('softTtl', None)
+    self._beta     = kwargs.get('beta', None)
+    self._jitter   = kwargs.get('jitter', None)
+    self._envelope = bool(self._softTtl or self._beta)
+    if self._beta and not (self._softTtl or self._ttl):
+      raise ValueError('Early recomputation requires ttl or softTtl')
+    if self._softTtl:
+      self._revalidator = kwargs.get('revalidator') or Revalidator()
+    self._cacheNone = kwargs.get('cacheNone', False)
+    self._errorTtl  = kwargs.get('errorTtl', None)
+    if self._errorTtl:
+      self._errors = tuple(kwargs.get('errors', (Exception,)))
+    self._special = bool(self._cacheNone or self._errorTtl)
+    if kwargs.get('writeBehind'):
+      self._writer = kwargs.get('writer') or Writer()
+    self._lock = kwargs.get('lock', True)
+    if kwargs.get('singleFlight'):
+      self._flights     = {}
+      self._flightMutex = threading.Lock()
 
     self._callable = callable
     self._isDescriptor = inspect.ismethoddescriptor(callable)
     self._isMethod = inspect.ismethod(callable)
+    self._prefix   = self._getPrefix(callable)
+    self._boundPrefixes = {}
+    if kwargs.get('metrics'):
+      self._metrics = kwargs['metrics'].get(self._getName(callable))
+      dumps = type(self._mangler).dumps
+      self._preserialise = getattr(dumps, '__func__', dumps) is _dumps # Python 2 unbound
 
     # preserve ``__name__``, ``__doc__``, etc
     try:
@@ -156,56 +599,378 @@ class Cached(object):
       # Python 2 doesn't skip missing attributes
       pass
 
-  def _load(self, key):
-    if self._tags:
-      tagMap = self._backend.load(map(self._mangler.nameTag, self._tags))
-      if len(tagMap) != len(self._tags):
-        return None
+  def _getPrefix(self, callable):
+    '''Return entry key prefix of the callable, unless key function is custom'''
+
+    nameEntry = getattr(Mangler.nameEntry, '__func__', Mangler.nameEntry) # Python 2 unbound
+    keyFunc   = self._keyFunc
+    if getattr(keyFunc, '__self__', None) is self._mangler and keyFunc.__func__ is nameEntry:
+      try:
+        prefix = self._mangler._namePrefix(callable)
+      except TypeError:
+        # ``nameEntry`` will raise it on call
+        pass
       else:
-        key += ':' + self._mangler.hashTags(tagMap)
+        return prefix + self._envelopeKey + ':' if self._envelope else prefix
+
+  @staticmethod
+  def _getName(callable):
+    '''Return dotted name of the callable, which identifies its metrics. Python 2 doesn't
+    have ``__qualname__``, so the class of a method is taken from the method, when it's
+    bound, otherwise the line the function is defined at is appended, as it may be decorated
+    in a class body, like same-named methods of other classes of the module.'''
+
+    fn   = getattr(callable, '__func__', callable)
+    name = getattr(fn, '__qualname__', None)
+    if name:
+      name = name.replace('<locals>.', '')
+    else:
+      name = getattr(fn, '__name__', None) or repr(fn)
+      cls  = getattr(callable, 'im_class', None)
+      if cls:
+        name = '{0}.{1}'.format(cls.__name__, name)
+      elif hasattr(fn, '__code__'):
+        name = '{0}:{1}'.format(name, fn.__code__.co_firstlineno)
+    return '{0}.{1}'.format(getattr(fn, '__module__', None), name)
+
+  def _key(self, args, kwargs):
+    if self._prefix:
+      return self._prefix + self._mangler.hashArguments(args, kwargs)
+    elif self._envelope:
+      return self._keyFunc(self._callable, *args, **kwargs) + ':' + self._envelopeKey
+    else:
+      return self._keyFunc(self._callable, *args, **kwargs)
 
-    return self._backend.load(key)
+  def _load(self, keys):
+    if self._metrics:
+      start = metrics.timer()
+    if self._tagKeys:
+      result = self._backend.loadTagged(self._tagKeys, keys)
+    else:
+      result = self._backend.load(keys)
+    if self._metrics:
+      self._metrics.load.observe(metrics.timer() - start)
+    return self._decode(keys, result)
+
+  @staticmethod
+  def _decode(keys, result):
+    '''Return the loaded result with values, that are still encoded by a codec, decoded.
+    ``Cached`` encodes values, so it decodes them as well. ``Mangler`` passes encoded value
+    through on dump and decodes it by format marker on load, but a custom mangler, e.g. one
+    compressing pickles, returns ``codec.Encoded`` as it was dumped. Multi-key loads are
+    made with a tuple of keys.'''
+
+    if type(result) is codec.Encoded:
+      return codec.decode(result)
+    elif type(keys) is tuple and result:
+      return {k : codec.decode(v) if type(v) is codec.Encoded else v for k, v in result.items()}
+    return result
+
+  def _encode(self, key, value, mapping):
+    if not mapping:
+      mapping = {key : value}
+    if self._codec:
+      # sentinels are left to the mangler to pickle
+      mapping = {
+        k : v if type(v) in (_None, _Raised) else self._codec.encode(v)
+        for k, v in mapping.items()}
+    if self._metrics:
+      mapping = self._serialise(mapping)
+    return mapping
+
+  def _serialise(self, mapping):
+    '''Count saves and serialised size of the mapping values, and return the mapping to
+    save. ``Mangler.dumps`` passes encoded values through, so with it the values are
+    serialised in advance, and aren't serialised twice. What another mangler's ``dumps``
+    receives isn't changed, so the values are serialised once more to measure them.'''
+
+    size = 0
+    if self._preserialise:
+      dumps  = self._mangler.dumps
+      result = {}
+      for k, v in mapping.items():
+        result[k] = data = codec.Encoded(dumps(v))
+        size += len(data)
+    else:
+      result = mapping
+      for v in mapping.values():
+        size += len(self._mangler.dumps(v))
+
+    self._metrics.saves      += len(result)
+    self._metrics.savedBytes += size
+    return result
+
+  def _save(self, key = None, value = None, mapping = None, ttl = None):
+    mapping = self._encode(key, value, mapping)
+    ttl     = self._ttl if ttl is None else ttl
+    if self._metrics:
+      start = metrics.timer()
+    if self._tagKeys:
+      self._backend.saveTagged(self._tagKeys, mapping = mapping, ttl = ttl)
+    else:
+      self._backend.save(mapping = mapping, ttl = ttl)
+    if self._metrics:
+      self._metrics.save.observe(metrics.timer() - start)
 
-  def _save(self, key, value):
-    if self._tags:
-      namedTags   = tuple(map(self._mangler.nameTag, self._tags))
-      tagMap      = self._backend.load(namedTags)
-      missingTags = set(namedTags) - set(tagMap.keys())
-      if missingTags:
-        missingTagMap = self._mangler.mapTags(missingTags)
-        self._backend.save(mapping = missingTagMap, ttl = None)
-        tagMap.update(missingTagMap)
-        assert len(self._tags) == len(tagMap)
+  def _remove(self, key):
+    if self._tagKeys:
+      self._backend.removeTagged(self._tagKeys, key)
+    else:
+      self._backend.remove(key)
 
-      key += ':' + self._mangler.hashTags(tagMap)
+  def invalidate(self, *args, **kwargs):
+    self._remove(self._key(args, kwargs))
+
+  def _expiry(self):
+    '''Return entry TTL and seconds until envelope expiry, both shortened by the same random
+    fraction, when jitter is set, so entries saved at once don't expire at once'''
+
+    ttl, envelopeTtl = self._ttl, self._softTtl or self._ttl
+    if self._jitter:
+      factor = 1 - self._jitter * random.random()
+      # backends expect whole seconds
+      ttl = ttl and max(1, int(ttl * factor))
+      envelopeTtl = self._softTtl * factor if self._softTtl else ttl
+    return ttl, envelopeTtl
+
+  def _wrap(self, value, delta, envelopeTtl):
+    '''Return envelope of the value, if envelopes are used, otherwise the value'''
+
+    if self._envelope:
+      return value, time.time() + envelopeTtl, delta
+    elif value is None and self._cacheNone:
+      return _none
+    return value
 
-    return self._backend.save(key, value, ttl = self._ttl)
+  def _result(self, entry):
+    '''Return result of the callable kept in the entry, or raise kept exception'''
 
-  def _remove(self, key):
-    if self._tags:
-      tagMap = self._backend.load(map(self._mangler.nameTag, self._tags))
-      if len(tagMap) != len(self._tags):
-        return
-      else:
-        key += ':' + self._mangler.hashTags(tagMap)
+    if type(entry) is _Raised:
+      raise entry.error
+    elif self._envelope:
+      return entry[0]
+    elif entry is _none:
+      return None
+    return entry
 
-    self._backend.remove(key)
+  def _compute(self, key, args, kwargs, lock = None):
+    '''Call the callable, save and return the entry. When the callable raises an exception
+    of one of ``_errors`` types, it's saved for ``_errorTtl`` seconds and re-raised.
 
-  def invalidate(self, *args, **kwargs):
-    self._remove(self._keyFunc(self._callable, *args, **kwargs))
+    The entry lock, if given, is released after the entry is saved. With write-behind the
+    save is queued to the writer, which then releases the lock. When an exception is raised
+    the lock is left to the caller.'''
+
+    start = time.time()
+    try:
+      value = self._callable(*args, **kwargs)
+    except self._errors as ex:
+      self._saveError(key, ex)
+      raise
+    delta = time.time() - start
+    if self._metrics:
+      self._metrics.misses      += 1
+      self._metrics.computeTime += delta
+    ttl, envelopeTtl = self._expiry()
+    entry = self._wrap(value, delta, envelopeTtl)
+    if not (self._writer and self._writer.submit(self, key, entry, ttl, lock)):
+      self._save(key, entry, ttl = ttl)
+      if lock:
+        lock.release()
+    return entry
+
+  def _saveError(self, key, error):
+    '''Save the exception raised by the callable. Failure of the save, e.g. when the exception
+    can't be pickled, is logged, so the caller gets the callable's exception.'''
+
+    try:
+      self._save(key, _Raised(error), ttl = self._errorTtl)
+    except Exception:
+      logger.exception('Save of exception of %s has failed', key)
+
+  def _isExpired(self, entry):
+    '''Tell if the entry envelope has expired. With ``beta`` the expiry is moved earlier by
+    random amount, proportional to entry computation time, XFetch. Thus, it's likely that
+    one of concurrent callers recomputes the entry before it expires for everyone.'''
+
+    now = time.time()
+    if self._beta:
+      now -= entry[2] * self._beta * math.log(1 - random.random())
+    return entry[1] <= now
+
+  def _unwrap(self, key, entry, args, kwargs):
+    '''Return value of the entry envelope. Expired entry is refreshed in background, when
+    ``softTtl`` is set, otherwise it's recomputed by this caller unless it's already being
+    recomputed.'''
+
+    if type(entry) is _Raised:
+      raise entry.error
+    elif not self._isExpired(entry):
+      return entry[0]
+    elif self._softTtl:
+      self._revalidator.submit(
+        key, functools.partial(self._revalidate, key, args, kwargs, entry[1]))
+      return entry[0]
+    else:
+      return (self._revalidate(key, args, kwargs, entry[1]) or entry)[0]
+
+  def _revalidate(self, key, args, kwargs, expireAt):
+    '''Recompute the entry, unless its lock is held, which means it's being computed, or it
+    has been recomputed after given envelope expiry. Return the entry on success.'''
+
+    lock = self._getLock(key)
+    if lock.acquire(False):
+      try:
+        entry = self._load(key)
+        if entry is None or type(entry) is _Raised or entry[1] <= expireAt:
+          entry = self._compute(key, args, kwargs)
+        return entry
+      finally:
+        lock.release()
+
+  def _getLock(self, key):
+    '''Return backend lock of the entry key, or no-op lock when backend locking is off'''
+
+    return self._backend.lock(key) if self._lock else AbstractLock(key)
+
+  def _acquire(self, lock):
+    if self._metrics:
+      start = metrics.timer()
+      lock.acquire()
+      self._metrics.lockWaits    += 1
+      self._metrics.lockWaitTime += metrics.timer() - start
+    else:
+      lock.acquire()
+
+  def _miss(self, key, args, kwargs):
+    '''Return result of the call whose entry is missing. The entry is computed under its
+    backend lock, unless backend locking is off.'''
+
+    lock = self._getLock(key)
+    if self._lock:
+      self._acquire(lock)
+    try:
+      # it's better to read twice than lock every read
+      value = self._load(key) if self._lock else None
+      if value is None:
+        entry = self._compute(key, args, kwargs, lock)
+        lock  = None # released by ``_compute``
+        return self._result(entry)
+    finally:
+      if lock:
+        lock.release()
+    return self._hit(key, value, args, kwargs)
+
+  def _fly(self, key, args, kwargs):
+    '''Return result of the call whose entry is missing. Only one thread per process, the
+    leader, goes to the backend for the entry key. Other threads wait for the leader and
+    receive the same result object, or exception.'''
+
+    with self._flightMutex:
+      flight = self._flights.get(key)
+      leader = flight is None
+      if leader:
+        flight = self._flights[key] = _Flight()
+
+    if not leader:
+      flight.event.wait()
+      if flight.error is not None:
+        raise flight.error
+      return flight.value
+
+    try:
+      flight.value = self._miss(key, args, kwargs)
+      return flight.value
+    except BaseException as ex:
+      flight.error = ex
+      raise
+    finally:
+      with self._flightMutex:
+        del self._flights[key]
+      flight.event.set()
+
+  def _hit(self, key, value, args, kwargs):
+    '''Return result of the call of the loaded entry'''
+
+    if self._metrics:
+      self._metrics.hits += 1
+    if self._envelope:
+      value = self._unwrap(key, value, args, kwargs)
+    elif self._special or type(value) in _sentinels:
+      # a sentinel may have been saved by the callable with ``cacheNone`` or ``errorTtl``
+      value = self._result(value)
+    return value
 
   def __call__(self, *args, **kwargs):
-    key   = self._keyFunc(self._callable, *args, **kwargs)
+    key   = self._key(args, kwargs)
     value = self._load(key)
     if value is None:
-      with self._backend.lock(key):
-        # it's better to read twice than lock every read
-        value = self._load(key)
-        if value is None:
-          value = self._callable(*args, **kwargs)
-          self._save(key, value)
+      if self._flights is None:
+        return self._miss(key, args, kwargs)
+      else:
+        return self._fly(key, args, kwargs)
+
+    # ``_hit`` inlined, as it's the hot path
+    if self._metrics:
+      self._metrics.hits += 1
+    if self._envelope:
+      value = self._unwrap(key, value, args, kwargs)
+    elif self._special or type(value) in _sentinels:
+      # a sentinel may have been saved by the callable with ``cacheNone`` or ``errorTtl``
+      value = self._result(value)
     return value
 
+  def _prepareBatch(self, arguments):
+    '''Return entry keys of positional argument tuples and a dictionary of unique keys to
+    argument tuples'''
+
+    arguments = [tuple(a) for a in arguments]
+    keys      = [self._key(a, {}) for a in arguments]
+    return keys, dict(zip(keys, arguments))
+
+  def batch(self, arguments, threads = None):
+    '''Return list of results for given list of positional argument tuples. Makes at most two
+    backend calls, no matter how long the list is. Entries are loaded with one multi-key
+    call, then only missing entries are computed, in a pool of ``threads`` threads if
+    provided, and saved with one bulk call.
+
+    Note that unlike ordinary call, there's no dogpile effect prevention for a batch.'''
+
+    keys, argumentMap = self._prepareBatch(arguments)
+    values  = self._load(tuple(argumentMap.keys()))
+    missing = [(k, a) for k, a in argumentMap.items() if values.get(k) is None]
+    if self._metrics:
+      self._metrics.hits += len(argumentMap) - len(missing)
+    if self._envelope:
+      values = {k : self._unwrap(k, v, argumentMap[k], {}) for k, v in values.items()}
+    elif self._special or any(type(v) in _sentinels for v in values.values()):
+      values = {k : self._result(v) for k, v in values.items()}
+    if missing:
+      def compute(item):
+        start = time.time()
+        return self._callable(*item[1]), time.time() - start
+
+      if threads:
+        pool = ThreadPool(threads)
+        try:
+          results = pool.map(compute, missing)
+        finally:
+          pool.close()
+      else:
+        results = list(map(compute, missing))
+      if self._metrics:
+        self._metrics.misses      += len(results)
+        self._metrics.computeTime += sum(d for _, d in results)
+
+      ttl, envelopeTtl = self._expiry()
+      computed = {k : self._wrap(v, d, envelopeTtl) for (k, _), (v, d) in zip(missing, results)}
+      self._save(mapping = computed, ttl = ttl)
+      if self._envelope or self._special:
+        computed = {k : self._result(v) for k, v in computed.items()}
+      values.update(computed)
+
+    return [values[k] for k in keys]
+
   def __get__(self, instance, type):
     '''Implements non-data descriptor protocol.
 
@@ -232,24 +997,45 @@ class Cached(object):
 
     Note, initially ``hermes.Cached`` is created on decoration per class method, when class
     type is created by the interpreter, and is shared among all instances. Later, on attribute
-    access, a copy is returned with bound ``_callable``, just like ordinary Python method
-    descriptor works.
+    access, a bound wrapper is returned with bound ``_callable``, just like ordinary Python
+    method descriptor works.
 
     For more details, http://docs.python.org/2/howto/descriptor.html#descriptor-protocol.
     '''
 
     if self._isDescriptor:
-      return self._copy(self._callable.__get__(instance, type))
+      return self._bind(self._callable.__get__(instance, type))
     elif not self._isMethod:
-      return self._copy(self._create_method(self._callable, instance, type))
+      return self._bind(self._create_method(self._callable, instance, type))
     else:
       return self
 
-  def _copy(self, callable):
-      bound           = object.__new__(self.__class__)
-      bound.__dict__  = self.__dict__.copy()
-      bound._callable = callable
-      return bound
+  def _bind(self, callable):
+    '''Return bound wrapper of the callable. Its class is a slotted subclass of the class of
+    this object, and it shares this object's ``__dict__``, so binding doesn't copy anything.
+    Only ``_callable`` and ``_prefix``, which differ, are stored in its slots.'''
+
+    cls = self.__class__
+    try:
+      boundClass = Cached._boundClasses[cls]
+    except KeyError:
+      boundClass = Cached._boundClasses[cls] = type(cls.__name__, (cls,), {
+        '__slots__' : ('_callable', '_prefix'),
+        '__module__' : cls.__module__,
+        '__doc__' : cls.__doc__
+      })
+
+    bound = object.__new__(boundClass)
+    bound.__dict__  = self.__dict__
+    bound._callable = callable
+
+    selfClass = type(getattr(callable, '__self__', None))
+    try:
+      bound._prefix = self._boundPrefixes[selfClass]
+    except KeyError:
+      bound._prefix = self._boundPrefixes[selfClass] = self._getPrefix(callable)
+
+    return bound
 
   if sys.version_info >= (3, 0):
     def _create_method(self, callable, instance, type):
@@ -306,30 +1092,92 @@ class Hermes(object):
   cachedClass = None
   '''Class of cache-point callable object'''
 
+  cachedCoroClass = None
+  '''Class of cache-point coroutine function object'''
+
   ttl = 3600
   '''Default cache entry Time To Live'''
 
+  localTtl = None
+  '''Time To Live of in-process front store entry, when set the backend is wrapped into
+  ``hermes.backend.layered.Backend``, which is synchronous, so the backend can't be
+  asynchronous'''
+
+  localMaxsize = 4096
+  '''Maximum number of in-process front store entries'''
+
+  tagTtl = None
+  '''Seconds to cache tag hashes in process, ``localTtl`` by default. When set the backend is
+  wrapped into ``hermes.backend.layered.Backend``, even without front store'''
+
+  codec = None
+  '''Name of default value codec from ``hermes.codec``, otherwise values are serialised by
+  the mangler'''
+
+  revalidator = None
+  '''Background worker refreshing stale entries of cached callables with ``softTtl``'''
+
+  writer = None
+  '''Background worker saving entries of cached callables with ``writeBehind``'''
+
+  aioWriter = None
+  '''Background worker saving entries of cached coroutine functions with ``writeBehind``,
+  ``hermes.aio.Writer`` instance, on Python 3.5+'''
+
+  metrics = None
+  '''Metrics of cached callables, ``hermes.metrics.Registry`` instance, when enabled'''
+
 
   def __init__(self, backendClass = AbstractBackend, manglerClass = Mangler, cachedClass = Cached,
-    **kwargs):
+    cachedCoroClass = None, **kwargs):
     '''Initialises the cache decorator factory.
 
     Positional arguments are backend class and mangler class. If omitted noop-backend
-    and built-in mangler will be be used.
-
-    Keyword arguments comprise of ``ttl`` and backend parameters.
+    and built-in mangler will be be used. Coroutine functions are wrapped into
+    ``cachedCoroClass``, which is ``hermes.aio.CachedCoro`` by default on Python 3.5+.
+
+    Keyword arguments comprise of ``ttl``, ``localTtl``, ``localMaxsize``, ``tagTtl``,
+    ``codec``, ``metrics`` and backend parameters. ``localTtl`` enables in-process front
+    store, which answers repeated reads without going to the backend, for at most given number
+    of seconds. ``tagTtl`` enables in-process tag hash cache, shared by all cached callables
+    of the instance, which saves tag entry lookup on tagged calls. ``codec`` is the name of
+    default value codec, see ``hermes.codec``. ``metrics`` enables per callable counters and
+    latency histograms, see ``hermes.metrics.Registry``.
     '''
 
-    self.ttl = kwargs.pop('ttl', self.ttl)
+    self.ttl          = kwargs.pop('ttl',          self.ttl)
+    self.localTtl     = kwargs.pop('localTtl',     self.localTtl)
+    self.localMaxsize = kwargs.pop('localMaxsize', self.localMaxsize)
+    self.tagTtl       = kwargs.pop('tagTtl',       self.tagTtl)
+    self.codec        = kwargs.pop('codec',        self.codec)
 
     assert issubclass(manglerClass, Mangler)
     self.mangler = manglerClass()
+    self.revalidator = Revalidator()
+    self.writer      = Writer()
+    if kwargs.pop('metrics', False):
+      self.metrics = metrics.Registry()
 
     assert issubclass(cachedClass, Cached)
     self.cachedClass = cachedClass
 
+    if sys.version_info >= (3, 5):
+      from . import aio
+      self.aioWriter = aio.Writer()
+      if cachedCoroClass is None:
+        cachedCoroClass = aio.CachedCoro
+    assert cachedCoroClass is None or issubclass(cachedCoroClass, Cached)
+    self.cachedCoroClass = cachedCoroClass
+
     assert issubclass(backendClass, AbstractBackend)
+    layer = bool(self.localTtl or self.tagTtl)
+    if layer and cachedCoroClass and inspect.iscoroutinefunction(backendClass.load):
+      raise ValueError('localTtl and tagTtl are not supported for asynchronous backend')
+
     self.backend = backendClass(self.mangler, **kwargs)
+    if layer:
+      self.backend = layered.Backend(self.mangler, self.backend,
+        ttl = self.localTtl, maxsize = self.localMaxsize, tagTtl = self.tagTtl)
 
   def __call__(self, *args, **kwargs):
     '''Decorator that caches method or function result. The following key arguments are optional:
@@ -337,6 +1185,22 @@ class Hermes(object):
       :key:   Lambda that provides custom key, otherwise ``Mangler.nameEntry`` is used.
       :ttl:   Seconds until entry expiration, otherwise instance default is used.
       :tags:  Cache entry tag list.
+      :codec: Name of value codec from ``hermes.codec``, otherwise instance default is used.
+      :softTtl: Seconds until entry is stale. A stale value is returned immediately, while
+        the entry is refreshed in background. ``ttl`` remains the hard limit.
+      :beta:  Enables probabilistic early recomputation, XFetch, before entry expiry, or
+        staleness with ``softTtl``. ``1`` is a good default, greater values make it earlier.
+      :jitter: Maximum fraction, like ``0.1``, by which entry TTL is randomly shortened.
+      :cacheNone: Cache ``None`` result, otherwise it's recomputed on every call.
+      :errorTtl: Seconds to cache exceptions raised by the callable. Cached exception is
+        re-raised on call.
+      :errors: Tuple of exception classes to cache with ``errorTtl``, ``Exception`` by default.
+      :writeBehind: Return computed value without waiting for its save, which is queued to
+        ``writer`` and done in background. ``batch`` saves synchronously regardless.
+      :singleFlight: Coalesce concurrent misses of an entry in the process. Only one caller
+        goes to the backend, others wait for it and receive the same result object.
+      :lock:  Compute missing entry under backend lock, ``True`` by default. With
+        ``singleFlight`` and without ``lock`` a miss is coalesced only in process.
 
     ``@cache`` decoration is supported as well as
     ``@cache(ttl = 7200, tags = ('tag1', 'tag2'), key = lambda fn, *args, **kwargs: 'mykey')``.
@@ -345,19 +1209,35 @@ class Hermes(object):
     if args:
       # @cache
       if callable(args[0]) or inspect.ismethoddescriptor(args[0]):
-        return self.cachedClass(self.backend, self.mangler, self.ttl, args[0])
+        return self._getCachedClass(args[0])(self.backend, self.mangler, self.ttl, args[0],
+          codec = self.codec, revalidator = self.revalidator, writer = self.writer,
+          aioWriter = self.aioWriter, metrics = self.metrics)
       else:
         raise TypeError('First positional argument must be callable or method descriptor')
     else:
       # @cache()
-      return lambda fn: self.cachedClass(
+      kwargs.setdefault('codec', self.codec)
+      kwargs.setdefault('revalidator', self.revalidator)
+      kwargs.setdefault('writer', self.writer)
+      kwargs.setdefault('aioWriter', self.aioWriter)
+      kwargs.setdefault('metrics', self.metrics)
+      return lambda fn: self._getCachedClass(fn)(
         self.backend, self.mangler, kwargs.pop('ttl', self.ttl), fn, **kwargs)
 
+  def _getCachedClass(self, fn):
+    # unwrap ``staticmethod`` and ``classmethod``
+    fn = getattr(fn, '__func__', fn)
+    if self.cachedCoroClass and inspect.iscoroutinefunction(fn):
+      return self.cachedCoroClass
+    else:
+      return self.cachedClass
+
   def clean(self, tags = None):
-    '''If tags argument is omitted flushes all entries, otherwise removes provided tag entries'''
+    '''If tags argument is omitted flushes all entries, otherwise removes provided tag entries.
+    With asynchronous backend returned awaitable should be awaited.'''
 
     if tags:
-      self.backend.remove(map(self.mangler.nameTag, tags))
+      return self.backend.remove(map(self.mangler.nameTag, tags))
     else:
-      self.backend.clean()
+      return self.backend.clean()
 
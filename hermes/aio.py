@@ -0,0 +1,300 @@
+import time
+import asyncio
+import inspect
+
+from . import Cached, logger, metrics, _Raised, _sentinels
+
+
+__all__ = 'CachedCoro', 'Writer'
+
+
+class Writer(object):
+  '''Asynchronous counterpart of ``hermes.Writer``, which saves computed entries of cached
+  coroutine functions, see ``writeBehind`` of ``Cached``. Saves are queued per event loop, and
+  the loop's worker task, which is started on submit and finishes when the queue is drained,
+  coalesces queued saves into one bulk save per backend, tags, codec, metrics and TTL. Entry
+  lock is released after its entry is saved.'''
+
+  maxsize = 1024
+  '''Maximum number of saves queued on an event loop, when the queue is full entries are saved
+  by the caller'''
+
+  _loops = None
+  '''Dictionary of event loop to ``[queue, worker task]`` list'''
+
+
+  def __init__(self, maxsize = None):
+    self.maxsize = maxsize or self.maxsize
+    self._loops  = {}
+
+  def submit(self, cached, key, entry, ttl, lock):
+    '''Queue the entry save of the cached coroutine function on the running event loop. The
+    lock, if any, is released after the save. Return ``False`` if the queue is full, then the
+    caller should save the entry.'''
+
+    loop  = asyncio.get_event_loop()
+    state = self._loops.get(loop)
+    if state is None:
+      for closed in [l for l in self._loops if l.is_closed()]:
+        del self._loops[closed]
+      state = self._loops[loop] = [asyncio.Queue(self.maxsize), None]
+
+    try:
+      state[0].put_nowait((cached, key, entry, ttl, lock))
+    except asyncio.QueueFull:
+      return False
+
+    if state[1] is None or state[1].done():
+      state[1] = asyncio.ensure_future(self._run(state[0]))
+    return True
+
+  async def flush(self):
+    '''Wait until all saves queued on the running event loop are done'''
+
+    state = self._loops.get(asyncio.get_event_loop())
+    if state:
+      await state[0].join()
+
+  async def _run(self, queue):
+    while True:
+      # let computations completing on this iteration of the loop queue their saves
+      await asyncio.sleep(0)
+
+      items = []
+      while True:
+        try:
+          items.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+          break
+      if not items:
+        return
+
+      groups = {}
+      for item in items:
+        cached, _, _, ttl, _ = item
+        # metrics and serialisation mode are of the callable, so callables sharing backend
+        # and tags aren't coalesced unless they share these too
+        groupKey = (cached._backend, cached._tagKeys, cached._codec, cached._metrics,
+          cached._preserialise, ttl)
+        groups.setdefault(groupKey, []).append(item)
+
+      for group in groups.values():
+        try:
+          await group[0][0]._save(mapping = {k : e for _, k, e, _, _ in group}, ttl = group[0][3])
+        except Exception:
+          logger.exception('Write-behind save of %d entries has failed', len(group))
+        finally:
+          for _, key, _, _, lock in group:
+            try:
+              if lock:
+                await CachedCoro._resolve(lock.release())
+            except Exception:
+              logger.exception('Lock release of %s has failed', key)
+            finally:
+              queue.task_done()
+
+
+class CachedCoro(Cached):
+  '''A wrapper for cached coroutine function or method. Backend calls are awaited when the
+  backend is asynchronous, like ``hermes.backend.aioredis.Backend``, and are made directly
+  otherwise, like with ``hermes.backend.dict.Backend``, which doesn't do I/O.
+
+  Dogpile effect prevention relies on backend lock. When it's asynchronous, waiting for it
+  doesn't block the event loop.
+
+  Stale entries of ``softTtl`` mode are refreshed in tasks on the running event loop. Entries
+  of ``writeBehind`` mode are saved by ``Writer``. With ``singleFlight`` concurrent misses of
+  an entry are coalesced in a task on the event loop.'''
+
+  _refreshes = None
+  '''Dictionary of entry key to its refresh task'''
+
+
+  def __init__(self, *args, **kwargs):
+    super(CachedCoro, self).__init__(*args, **kwargs)
+    self._refreshes = {}
+    if self._writer:
+      self._writer = kwargs.get('aioWriter') or Writer()
+
+  @staticmethod
+  async def _resolve(value):
+    if inspect.isawaitable(value):
+      value = await value
+    return value
+
+  async def _load(self, keys):
+    if self._metrics:
+      start = metrics.timer()
+    if self._tagKeys:
+      result = self._backend.loadTagged(self._tagKeys, keys)
+    else:
+      result = self._backend.load(keys)
+    result = await self._resolve(result)
+    if self._metrics:
+      self._metrics.load.observe(metrics.timer() - start)
+    return self._decode(keys, result)
+
+  async def _save(self, key = None, value = None, mapping = None, ttl = None):
+    mapping = self._encode(key, value, mapping)
+    ttl     = self._ttl if ttl is None else ttl
+    if self._metrics:
+      start = metrics.timer()
+    if self._tagKeys:
+      result = self._backend.saveTagged(self._tagKeys, mapping = mapping, ttl = ttl)
+    else:
+      result = self._backend.save(mapping = mapping, ttl = ttl)
+    await self._resolve(result)
+    if self._metrics:
+      self._metrics.save.observe(metrics.timer() - start)
+
+  async def _remove(self, key):
+    if self._tagKeys:
+      result = self._backend.removeTagged(self._tagKeys, key)
+    else:
+      result = self._backend.remove(key)
+    await self._resolve(result)
+
+  async def _compute(self, key, args, kwargs, lock = None):
+    start = time.time()
+    try:
+      value = await self._callable(*args, **kwargs)
+    except self._errors as ex:
+      await self._saveError(key, ex)
+      raise
+    delta = time.time() - start
+    if self._metrics:
+      self._metrics.misses      += 1
+      self._metrics.computeTime += delta
+    ttl, envelopeTtl = self._expiry()
+    entry = self._wrap(value, delta, envelopeTtl)
+    if not (self._writer and self._writer.submit(self, key, entry, ttl, lock)):
+      await self._save(key, entry, ttl = ttl)
+      if lock:
+        await self._resolve(lock.release())
+    return entry
+
+  async def _saveError(self, key, error):
+    try:
+      await self._save(key, _Raised(error), ttl = self._errorTtl)
+    except Exception:
+      logger.exception('Save of exception of %s has failed', key)
+
+  async def _unwrap(self, key, entry, args, kwargs):
+    if type(entry) is _Raised:
+      raise entry.error
+    elif not self._isExpired(entry):
+      return entry[0]
+    elif self._softTtl:
+      if key not in self._refreshes:
+        task = asyncio.ensure_future(self._revalidate(key, args, kwargs, entry[1]))
+        task.add_done_callback(lambda t: self._onRefreshed(key, t))
+        self._refreshes[key] = task
+      return entry[0]
+    else:
+      return (await self._revalidate(key, args, kwargs, entry[1]) or entry)[0]
+
+  def _onRefreshed(self, key, task):
+    self._refreshes.pop(key, None)
+    if not task.cancelled() and task.exception():
+      logger.error('Refresh of %s has failed', key, exc_info = task.exception())
+
+  async def _revalidate(self, key, args, kwargs, expireAt):
+    lock = self._getLock(key)
+    if await self._resolve(lock.acquire(False)):
+      try:
+        entry = await self._load(key)
+        if entry is None or type(entry) is _Raised or entry[1] <= expireAt:
+          entry = await self._compute(key, args, kwargs)
+        return entry
+      finally:
+        await self._resolve(lock.release())
+
+  async def batch(self, arguments):
+    '''Coroutine counterpart of ``Cached.batch``. Missing entries are computed concurrently.'''
+
+    async def compute(args):
+      start = time.time()
+      return await self._callable(*args), time.time() - start
+
+    keys, argumentMap = self._prepareBatch(arguments)
+    values  = await self._load(tuple(argumentMap.keys()))
+    missing = [(k, a) for k, a in argumentMap.items() if values.get(k) is None]
+    if self._metrics:
+      self._metrics.hits += len(argumentMap) - len(missing)
+    if self._envelope:
+      for k, v in values.items():
+        values[k] = await self._unwrap(k, v, argumentMap[k], {})
+    elif self._special or any(type(v) in _sentinels for v in values.values()):
+      values = {k : self._result(v) for k, v in values.items()}
+    if missing:
+      results  = await asyncio.gather(*[compute(a) for _, a in missing])
+      if self._metrics:
+        self._metrics.misses      += len(results)
+        self._metrics.computeTime += sum(d for _, d in results)
+      ttl, envelopeTtl = self._expiry()
+      computed = {k : self._wrap(v, d, envelopeTtl) for (k, _), (v, d) in zip(missing, results)}
+      await self._save(mapping = computed, ttl = ttl)
+      if self._envelope or self._special:
+        computed = {k : self._result(v) for k, v in computed.items()}
+      values.update(computed)
+
+    return [values[k] for k in keys]
+
+  async def invalidate(self, *args, **kwargs):
+    await self._remove(self._key(args, kwargs))
+
+  async def _acquire(self, lock):
+    if self._metrics:
+      start = metrics.timer()
+      await self._resolve(lock.acquire())
+      self._metrics.lockWaits    += 1
+      self._metrics.lockWaitTime += metrics.timer() - start
+    else:
+      await self._resolve(lock.acquire())
+
+  async def _miss(self, key, args, kwargs):
+    lock = self._getLock(key)
+    if self._lock:
+      await self._acquire(lock)
+    try:
+      # it's better to read twice than lock every read
+      value = await self._load(key) if self._lock else None
+      if value is None:
+        entry = await self._compute(key, args, kwargs, lock)
+        lock  = None # released by ``_compute``
+        return self._result(entry)
+    finally:
+      if lock:
+        await self._resolve(lock.release())
+    return await self._hit(key, value, args, kwargs)
+
+  async def _fly(self, key, args, kwargs):
+    '''Return result of the call whose entry is missing. The entry is loaded or computed in
+    a task, which concurrent callers of the entry key await. Cancellation of a caller doesn't
+    cancel the task.'''
+
+    task = self._flights.get(key)
+    if task is None:
+      task = asyncio.ensure_future(self._miss(key, args, kwargs))
+      task.add_done_callback(lambda t: self._flights.pop(key, None))
+      self._flights[key] = task
+    return await asyncio.shield(task)
+
+  async def _hit(self, key, value, args, kwargs):
+    if self._metrics:
+      self._metrics.hits += 1
+    if self._envelope:
+      value = await self._unwrap(key, value, args, kwargs)
+    elif self._special or type(value) in _sentinels:
+      value = self._result(value)
+    return value
+
+  async def __call__(self, *args, **kwargs):
+    key   = self._key(args, kwargs)
+    value = await self._load(key)
+    if value is not None:
+      return await self._hit(key, value, args, kwargs)
+    elif self._flights is None:
+      return await self._miss(key, args, kwargs)
+    else:
+      return await self._fly(key, args, kwargs)
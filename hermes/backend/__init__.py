@@ -1,4 +1,16 @@
-import collections
+import os
+import time
+import atexit
+import logging
+import threading
+
+try:
+  from collections.abc import Iterable
+except ImportError:
+  from collections import Iterable
+
+
+logger = logging.getLogger(__name__)
 
 
 class AbstractLock(object):
@@ -25,6 +37,154 @@ class AbstractLock(object):
     pass
 
 
+class PollingLock(AbstractLock):
+  '''Base class of a lock whose backend has no notification mechanism, so waiters poll with
+  exponential backoff, from ``minSleep`` up to ``sleep``. A waiter waits at most ``wait``
+  seconds, if set, then ``acquire`` returns ``False`` and the caller proceeds without the
+  lock. Subclass implements single acquire attempt, ``_tryAcquire``.'''
+
+  sleep = 0.1
+  '''Maximum amount of time to sleep between acquire attempts when waiting'''
+
+  minSleep = 0.005
+  '''Amount of time to sleep after first failed acquire attempt when waiting'''
+
+  wait = None
+  '''Maximum amount of time to wait for the lock, unlimited by default'''
+
+
+  def __init__(self, key, **kwargs):
+    super(PollingLock, self).__init__(key)
+
+    self.sleep    = kwargs.get('lockSleep',    self.sleep)
+    self.minSleep = kwargs.get('lockMinSleep', self.minSleep)
+    self.wait     = kwargs.get('lockWait',     self.wait)
+
+  def _tryAcquire(self):
+    '''Make an attempt to acquire the lock without waiting. Return whether it's acquired.'''
+
+    raise NotImplementedError()
+
+  def _pause(self, timeout):
+    '''Wait ``timeout`` seconds before the next acquire attempt'''
+
+    time.sleep(timeout)
+
+  def _poll(self):
+    '''Repeat acquire attempts with backoff until the lock is acquired or ``wait`` is over'''
+
+    sleep    = min(self.minSleep, self.sleep)
+    deadline = time.time() + self.wait if self.wait else None
+    while True:
+      if deadline is not None:
+        timeout = min(sleep, deadline - time.time())
+        if timeout <= 0:
+          return False
+      else:
+        timeout = sleep
+      self._pause(timeout)
+      sleep = min(sleep * 2, self.sleep)
+      if self._tryAcquire():
+        return True
+
+  def acquire(self, wait = True):
+    if self._tryAcquire():
+      return True
+    elif not wait:
+      return False
+    return self._poll()
+
+
+class Renewer(object):
+  '''Background worker that prolongs TTL of held locks, see ``renew`` of
+  ``hermes.backend.redis.Lock``. Locks are renewed every ``renew`` seconds in one daemon
+  thread, which is started on first added lock. A lock which is lost, i.e. its ``extend``
+  returns ``False``, isn't renewed anymore. The worker is stopped on interpreter shutdown, as
+  on Python 2 a thread waiting with timeout runs during module teardown and may crash it.'''
+
+  _due = None
+  '''Dictionary of lock to the time of its next renewal'''
+
+  _condition = None
+  '''Condition guarding the dictionary and waking up the worker'''
+
+  _thread = None
+  '''Worker thread'''
+
+  _pid = None
+  '''Process id the worker was started in, the state is reset in a forked child'''
+
+  _stopped = False
+  '''Whether the worker is stopped'''
+
+
+  def __init__(self):
+    self._condition = threading.Condition()
+    self._reset()
+
+  def _reset(self):
+    self._due     = {}
+    self._thread  = None
+    self._stopped = False
+    self._pid     = os.getpid()
+
+  def add(self, lock):
+    with self._condition:
+      if self._pid != os.getpid():
+        self._reset()
+      if not self._thread:
+        self._thread = threading.Thread(target = self._run, name = 'hermes-lock-renewer')
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.stop)
+
+      self._due[lock] = time.time() + lock.renew
+      self._condition.notify()
+
+  def remove(self, lock):
+    with self._condition:
+      self._due.pop(lock, None)
+
+  def stop(self):
+    '''Stop the worker, the held locks aren't renewed anymore'''
+
+    with self._condition:
+      thread = self._thread if self._pid == os.getpid() else None
+      self._stopped = True
+      self._condition.notify()
+    if thread:
+      thread.join(1)
+
+  def _run(self):
+    while True:
+      with self._condition:
+        while True:
+          if self._stopped:
+            return
+          now = time.time()
+          due = [lock for lock, at in self._due.items() if at <= now]
+          if due:
+            break
+          self._condition.wait(min(self._due.values()) - now if self._due else None)
+        for lock in due:
+          self._due[lock] = now + lock.renew
+
+      for lock in due:
+        try:
+          extended = lock.extend()
+        except Exception:
+          logger.exception('Renewal of lock %s has failed', lock.key)
+          continue
+        if not extended:
+          with self._condition:
+            # a released lock is removed, and can't be extended either
+            if self._due.pop(lock, None) is not None:
+              logger.warning('Lock %s is lost', lock.key)
+
+renewer = Renewer()
+'''Process-wide lock renewer'''
+
+
 class AbstractBackend(object):
   '''Abstract backend'''
 
@@ -43,7 +203,8 @@ class AbstractBackend(object):
 
   @classmethod
   def _isScalar(cls, value):
-    return not isinstance(value, collections.Iterable) or isinstance(value, cls.__str)
+    # string check goes first as ABC check is relatively slow
+    return isinstance(value, cls.__str) or not isinstance(value, Iterable)
 
   def lock(self, key):
     return AbstractLock(self.mangler.nameLock(key))
@@ -63,3 +224,52 @@ class AbstractBackend(object):
   def clean(self):
     pass
 
+  def loadTagHash(self, tagKeys, create = False):
+    '''Return composite hash of tag entries, which is appended to tagged entry key. If
+    some of tag entries are absent ``None`` is returned, unless ``create`` is true, then the
+    absent tag entries are created.'''
+
+    tagKeys = tuple(tagKeys)
+    tagMap  = self.load(tagKeys)
+    if len(tagMap) != len(tagKeys):
+      if not create:
+        return None
+
+      missingTagMap = self.mangler.mapTags(set(tagKeys) - set(tagMap.keys()))
+      self.save(mapping = missingTagMap, ttl = None)
+      tagMap.update(missingTagMap)
+
+    return self.mangler.hashTags(tagMap)
+
+  def saveTagged(self, tagKeys, key = None, value = None, mapping = None, ttl = None):
+    '''Same as ``save`` for entries tagged with given tag entry keys'''
+
+    if not mapping:
+      mapping = {key : value}
+
+    tagHash = self.loadTagHash(tagKeys, create = True)
+    self.save(mapping = {k + ':' + tagHash : v for k, v in mapping.items()}, ttl = ttl)
+
+  def loadTagged(self, tagKeys, keys):
+    '''Same as ``load`` for entries tagged with given tag entry keys'''
+
+    scalar  = self._isScalar(keys)
+    tagHash = self.loadTagHash(tagKeys)
+    if tagHash is None:
+      return None if scalar else {}
+    elif scalar:
+      return self.load(keys + ':' + tagHash)
+    else:
+      keyMap = {k + ':' + tagHash : k for k in keys}
+      return {keyMap[k] : v for k, v in self.load(tuple(keyMap.keys())).items()}
+
+  def removeTagged(self, tagKeys, keys):
+    '''Same as ``remove`` for entries tagged with given tag entry keys'''
+
+    if self._isScalar(keys):
+      keys = (keys,)
+
+    tagHash = self.loadTagHash(tagKeys)
+    if tagHash is not None:
+      self.remove(tuple(k + ':' + tagHash for k in keys))
+
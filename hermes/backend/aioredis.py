@@ -0,0 +1,172 @@
+import time
+import asyncio
+
+from redis import asyncio as aioredis
+
+from . import redis, logger
+
+
+__all__ = 'Lock', 'Backend'
+
+
+def _close(closeable):
+  '''Close the client or pub/sub. ``aclose`` has superseded ``close`` since redis-py 5.0.1,
+  which doesn't support Python 3.6.'''
+
+  return (getattr(closeable, 'aclose', None) or closeable.close)()
+
+
+class Lock(redis.Lock):
+  '''Asynchronous counterpart of ``hermes.backend.redis.Lock``. Waiting for the lock
+  doesn't block the event loop, and the lock is renewed in a task on the event loop.'''
+
+  _renewal = None
+  '''Task renewing the lock while it's held'''
+
+
+  async def __aenter__(self):
+    await self.acquire()
+
+  async def __aexit__(self, type, value, traceback):
+    await self.release()
+
+  async def _set(self, token):
+    return await self.client.set(self.key, token, nx = True, ex = self.timeout)
+
+  def _acquired(self, token):
+    self.token = token
+    if self.renew:
+      self._renewal = asyncio.ensure_future(self._keepAlive())
+    return True
+
+  async def _keepAlive(self):
+    while True:
+      await asyncio.sleep(self.renew)
+      try:
+        if not await self.extend():
+          logger.warning('Lock %s is lost', self.key)
+          return
+      except Exception:
+        logger.exception('Renewal of lock %s has failed', self.key)
+
+  async def acquire(self, wait = True):
+    token = self._createToken()
+    if await self._set(token):
+      return self._acquired(token)
+    elif not wait:
+      return False
+
+    deadline = time.time() + self.wait if self.wait else None
+    pubsub   = self.subscriber.pubsub(ignore_subscribe_messages = True)
+    await pubsub.subscribe(self.key)
+    try:
+      while not await self._set(token):
+        timeout = self._remaining(deadline)
+        if not timeout:
+          return False
+        await pubsub.get_message(timeout = timeout)
+      return self._acquired(token)
+    finally:
+      await _close(pubsub)
+
+  async def release(self):
+    token, self.token = self.token, None
+    if token is not None:
+      if self._renewal:
+        self._renewal.cancel()
+        self._renewal = None
+      await self.client.register_script(self.releaseLua)(keys = [self.key], args = [token])
+
+  async def extend(self):
+    token = self.token
+    return token is not None and bool(await self.client.register_script(self.extendLua)(
+      keys = [self.key], args = [token, self.timeout]))
+
+
+class Backend(redis.Backend):
+  '''Asynchronous Redis backend implementation, based on ``redis.asyncio`` client of redis-py
+  4.2+. All methods except ``lock`` are coroutines. It's intended to be used with cached
+  coroutine functions, ``hermes.aio.CachedCoro``.'''
+
+  _redis = aioredis
+  '''Redis client library module'''
+
+  def lock(self, key):
+    return Lock(
+      self.mangler.nameLock(key), self.client, subscriber = self.subscriber, **self._options)
+
+  async def save(self, key = None, value = None, mapping = None, ttl = None):
+    if not mapping:
+      mapping = {key : value}
+    mapping = {k : self.mangler.dumps(v) for k, v in mapping.items()}
+
+    if not ttl:
+      await self.client.mset(mapping)
+    else:
+      pipeline = self.client.pipeline()
+      for k, v in mapping.items():
+        pipeline.setex(k, ttl, v)
+      await pipeline.execute()
+
+  async def load(self, keys):
+    if self._isScalar(keys):
+      value = await self.client.get(keys)
+      if value is not None:
+        value = self.mangler.loads(value)
+      return value
+    else:
+      keys = tuple(keys)
+      return {k : self.mangler.loads(v)
+        for k, v in zip(keys, await self.client.mget(keys)) if v is not None}
+
+  async def remove(self, keys):
+    if self._isScalar(keys):
+      keys = (keys,)
+
+    await self.client.delete(*keys)
+
+  async def clean(self):
+    await self.client.flushdb()
+
+  async def loadTagHash(self, tagKeys, create = False):
+    tagKeys = sorted(tagKeys)
+    values  = await self.client.mget(tagKeys)
+    if None in values:
+      if not create:
+        return None
+
+      missing  = [k for k, v in zip(tagKeys, values) if v is None]
+      pipeline = self.client.pipeline()
+      for k, v in self.mangler.mapTags(missing).items():
+        pipeline.set(k, self.mangler.dumps(v), nx = True)
+      pipeline.mget(tagKeys)
+      values = (await pipeline.execute())[-1]
+
+    return self._hashTags(values)
+
+  async def saveTagged(self, tagKeys, key = None, value = None, mapping = None, ttl = None):
+    if not mapping:
+      mapping = {key : value}
+
+    keys, args = self._saveTaggedArgs(sorted(tagKeys), mapping, ttl)
+    await self.saveTaggedScript(keys = keys, args = args)
+
+  async def loadTagged(self, tagKeys, keys):
+    tagKeys = sorted(tagKeys)
+    if self._isScalar(keys):
+      values = await self.loadTaggedScript(keys = tagKeys, args = (keys,))
+      if values and values[0] is not None:
+        return self.mangler.loads(values[0])
+      return None
+    else:
+      keys   = tuple(keys)
+      values = await self.loadTaggedScript(keys = tagKeys, args = keys)
+      return {k : self.mangler.loads(v) for k, v in zip(keys, values or ()) if v is not None}
+
+  async def removeTagged(self, tagKeys, keys):
+    if self._isScalar(keys):
+      keys = (keys,)
+
+    tagHash = await self.loadTagHash(tagKeys)
+    if tagHash is not None:
+      await self.remove(tuple(k + ':' + tagHash for k in keys))
@@ -1,3 +1,8 @@
+import time
+import heapq
+import threading
+import collections
+
 from . import AbstractBackend, AbstractLock
 
 
@@ -5,24 +10,199 @@ __all__ = 'Lock', 'Backend'
 
 Lock = AbstractLock
 
+
+class Lru(object):
+  '''Least recently used eviction policy. All operations are O(1).'''
+
+  _order = None
+  '''``OrderedDict`` of keys, least recently used first'''
+
+
+  def __init__(self):
+    self._order = collections.OrderedDict()
+
+  def add(self, key):
+    self._order[key] = None
+
+  if hasattr(collections.OrderedDict, 'move_to_end'):
+    def touch(self, key):
+      self._order.move_to_end(key)
+  else:
+    # Python 2
+    def touch(self, key):
+      self._order[key] = self._order.pop(key)
+
+  def discard(self, key):
+    self._order.pop(key, None)
+
+  def victim(self):
+    return next(iter(self._order))
+
+  def clear(self):
+    self._order.clear()
+
+
+class Lfu(object):
+  '''Least frequently used eviction policy, ties are resolved by recency. All operations
+  are O(1), see `An O(1) algorithm for implementing the LFU cache eviction scheme
+  <http://dhruvbird.com/lfu.pdf>`_.'''
+
+  _counts = None
+  '''Dictionary of key to its access count'''
+
+  _buckets = None
+  '''Dictionary of access count to ``OrderedDict`` of keys, least recently used first'''
+
+  _min = None
+  '''Minimal access count'''
+
+
+  def __init__(self):
+    self._counts  = {}
+    self._buckets = collections.defaultdict(collections.OrderedDict)
+    self._min     = 0
+
+  def _unlink(self, key):
+    count  = self._counts.pop(key)
+    bucket = self._buckets[count]
+    del bucket[key]
+    if not bucket:
+      del self._buckets[count]
+      if self._min == count:
+        self._min = count + 1
+    return count
+
+  def add(self, key):
+    self._counts[key] = 1
+    self._buckets[1][key] = None
+    self._min = 1
+
+  def touch(self, key):
+    count = self._unlink(key) + 1
+    self._counts[key] = count
+    self._buckets[count][key] = None
+
+  def discard(self, key):
+    if key in self._counts:
+      self._unlink(key)
+
+  def victim(self):
+    if self._min not in self._buckets:
+      # only happens after ``discard`` of the last least frequently used key
+      self._min = min(self._buckets)
+    return next(iter(self._buckets[self._min]))
+
+  def clear(self):
+    self._counts.clear()
+    self._buckets.clear()
+    self._min = 0
+
+
 class Backend(AbstractBackend):
-  '''Test purpose backend implementation. Does not support entry expiry. ``save`` and ``delete``
-  are not atomic in general. Though because writes are synchronized it may be suitable for
-  limited number of real cases with small cached entry size.'''
+  '''In-process backend implementation. Supports entry expiry and bounding by number of
+  entries and by total size of serialised entries, evicting entries with LRU or LFU policy.
+
+  Expiry is lazy. An expired entry is removed when it's accessed, and a heap of expiry
+  times is used to purge expired entries, which are not accessed, on writes. Thus all
+  operations stay O(1) amortised, not counting ``O(log n)`` of the heap.
 
+  ``lock`` is not key-aware and doesn't lock in fact. Thus the backend is suitable for
+  in-process caching of entries which are cheap to compute.'''
 
   cache = None
-  '''A dict intance'''
+  '''A dict instance of key to serialised value'''
+
+  maxsize = None
+  '''Maximum number of entries, unbounded if ``None``'''
+
+  maxbytes = None
+  '''Maximum total size of keys and serialised values, unbounded if ``None``'''
+
+  policy = 'lru'
+  '''Eviction policy name, ``lru`` or ``lfu``'''
+
+  policies = {'lru' : Lru, 'lfu' : Lfu}
+  '''Eviction policy name to class map'''
 
   _lock = None
   '''Lock instance'''
 
+  _mutex = None
+  '''Lock which synchronises access to the data structures'''
+
+  _policy = None
+  '''Eviction policy instance'''
+
+  _expiry = None
+  '''Dictionary of key to its expiry timestamp'''
+
+  _heap = None
+  '''Heap of ``(expiry, key)`` tuples, may contain outdated items'''
+
+  _bytes = 0
+  '''Current total size of keys and serialised values'''
+
 
   def __init__(self, mangler, **kwargs):
     super(Backend, self).__init__(mangler)
 
-    self.cache = {}
-    self._lock = AbstractLock(None)
+    self.maxsize  = kwargs.get('maxsize',  self.maxsize)
+    self.maxbytes = kwargs.get('maxbytes', self.maxbytes)
+    self.policy   = kwargs.get('policy',   self.policy)
+    if self.policy not in self.policies:
+      raise ValueError('Unknown eviction policy: {0}'.format(self.policy))
+
+    self.cache   = {}
+    self._lock   = AbstractLock(None)
+    self._mutex  = threading.RLock()
+    self._policy = self.policies[self.policy]()
+    self._expiry = {}
+    self._heap   = []
+
+  def _delete(self, key):
+    value = self.cache.pop(key, None)
+    if value is not None:
+      self._bytes -= len(key) + len(value)
+      self._expiry.pop(key, None)
+      self._policy.discard(key)
+
+  def _get(self, key, now):
+    value = self.cache.get(key, None)
+    if value is not None:
+      expiry = self._expiry.get(key)
+      if expiry is not None and expiry <= now:
+        self._delete(key)
+        value = None
+      else:
+        self._policy.touch(key)
+    return value
+
+  def _purge(self, now):
+    heap = self._heap
+    while heap and heap[0][0] <= now:
+      expiry, key = heapq.heappop(heap)
+      if self._expiry.get(key) == expiry:
+        self._delete(key)
+
+    # outdated items of overwritten and removed entries are dropped eventually
+    if len(heap) > 2 * len(self._expiry) + 64:
+      self._heap = [(e, k) for k, e in self._expiry.items()]
+      heapq.heapify(self._heap)
+
+  def _reserve(self, size):
+    '''Evict entries to make room for an entry of given size. Return false if it doesn't
+    fit at all.'''
+
+    if self.maxbytes is not None and size > self.maxbytes:
+      return False
+
+    while self.cache and (
+      self.maxsize is not None and len(self.cache) >= self.maxsize
+      or self.maxbytes is not None and self._bytes + size > self.maxbytes
+    ):
+      self._delete(self._policy.victim())
+
+    return True
 
   def lock(self, key):
     return self._lock
@@ -31,27 +211,57 @@ class Backend(AbstractBackend):
     if not mapping:
       mapping = {key : value}
 
-    self.cache.update({k : self.mangler.dumps(v) for k, v in mapping.items()})
+    mapping = {k : self.mangler.dumps(v) for k, v in mapping.items()}
+    now     = time.time()
+    with self._mutex:
+      self._purge(now)
+      for k, v in mapping.items():
+        self._delete(k)
+
+        size = len(k) + len(v)
+        if not self._reserve(size):
+          continue
+
+        self.cache[k] = v
+        self._bytes  += size
+        self._policy.add(k)
+        if ttl:
+          self._expiry[k] = now + ttl
+          heapq.heappush(self._heap, (now + ttl, k))
 
   def load(self, keys):
+    now = time.time()
     if self._isScalar(keys):
-      value = self.cache.get(keys, None)
+      with self._mutex:
+        value = self._get(keys, now)
       if value is not None:
         value = self.mangler.loads(value)
       return value
     else:
-      return {k : self.mangler.loads(self.cache[k]) for k in keys if k in self.cache}
+      with self._mutex:
+        values = {k : self._get(k, now) for k in keys}
+      return {k : self.mangler.loads(v) for k, v in values.items() if v is not None}
 
   def remove(self, keys):
     if self._isScalar(keys):
       keys = (keys,)
 
-    for key in keys:
-      self.cache.pop(key, None)
+    with self._mutex:
+      for key in keys:
+        self._delete(key)
 
   def clean(self):
-    self.cache.clear()
+    with self._mutex:
+      self.cache.clear()
+      self._policy.clear()
+      self._expiry.clear()
+      self._heap  = []
+      self._bytes = 0
 
   def dump(self):
-    return {k : self.mangler.loads(v) for k, v in self.cache.items()}
-
+    now = time.time()
+    with self._mutex:
+      return {
+        k : self.mangler.loads(v) for k, v in self.cache.items()
+        if self._expiry.get(k, now + 1) > now
+      }
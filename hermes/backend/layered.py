@@ -0,0 +1,133 @@
+import time
+import threading
+
+from . import AbstractBackend, dict
+
+
+__all__ = 'Backend',
+
+
+class Backend(AbstractBackend):
+  '''Two-tier backend. Reads are answered from a bounded in-process front store, which has
+  its own short TTL, and fall back to the remote backend. Writes and removals go through to
+  both tiers. When ``ttl`` is ``None`` there's no front store and entry operations go
+  directly to the remote backend.
+
+  Tag hashes, which the remote backend derives from tag entries, are cached in process for
+  ``tagTtl`` seconds. Thus a tagged read costs one remote lookup, tag invalidation made in
+  the same process is visible immediately, and invalidation made by other processes is
+  visible in at most ``tagTtl`` seconds. A tag hash loaded concurrently with a removal in the
+  process isn't cached, as it may precede the removal.'''
+
+  remote = None
+  '''Remote backend instance'''
+
+  front = None
+  '''Front store, ``hermes.backend.dict.Backend`` instance, or ``None``'''
+
+  ttl = 5
+  '''Maximum TTL of front store entry'''
+
+  maxsize = 4096
+  '''Maximum number of front store entries'''
+
+  tagTtl = None
+  '''TTL of cached tag hash, ``ttl`` by default'''
+
+  _tagHashes = None
+  '''Dictionary of tag entry key tuple to ``(expiry, tag hash)``'''
+
+  _generation = 0
+  '''Counter of removals, which tells whether a removal has happened during tag hash load'''
+
+  _mutex = None
+  '''Lock guarding the generation and the tag hash dictionary replacement'''
+
+
+  def __init__(self, mangler, remote, **kwargs):
+    super(Backend, self).__init__(mangler)
+
+    self.remote  = remote
+    self.ttl     = kwargs.get('ttl',     self.ttl)
+    self.maxsize = kwargs.get('maxsize', self.maxsize)
+    self.tagTtl  = kwargs.get('tagTtl',  self.tagTtl) or self.ttl
+    if not self.tagTtl:
+      raise ValueError('Either ttl or tagTtl must be set')
+
+    if self.ttl:
+      self.front = dict.Backend(mangler, maxsize = self.maxsize)
+    self._tagHashes = {}
+    self._mutex     = threading.Lock()
+
+  def lock(self, key):
+    return self.remote.lock(key)
+
+  def save(self, key = None, value = None, mapping = None, ttl = None):
+    if not mapping:
+      mapping = {key : value}
+
+    self.remote.save(mapping = mapping, ttl = ttl)
+    if self.front:
+      self.front.save(mapping = mapping, ttl = min(ttl, self.ttl) if ttl else self.ttl)
+
+  def load(self, keys):
+    if not self.front:
+      return self.remote.load(keys)
+    elif self._isScalar(keys):
+      value = self.front.load(keys)
+      if value is None:
+        value = self.remote.load(keys)
+        if value is not None:
+          self.front.save(keys, value, ttl = self.ttl)
+      return value
+    else:
+      keys    = tuple(keys)
+      result  = self.front.load(keys)
+      missing = [k for k in keys if k not in result]
+      if missing:
+        remote = self.remote.load(missing)
+        if remote:
+          self.front.save(mapping = remote, ttl = self.ttl)
+          result.update(remote)
+      return result
+
+  def remove(self, keys):
+    if self._isScalar(keys):
+      keys = (keys,)
+    else:
+      keys = tuple(keys)
+
+    self.remote.remove(keys)
+    if self.front:
+      self.front.remove(keys)
+
+    removed = set(keys)
+    with self._mutex:
+      self._generation += 1
+      self._tagHashes = {k : v for k, v in self._tagHashes.items() if removed.isdisjoint(k)}
+
+  def clean(self):
+    self.remote.clean()
+    if self.front:
+      self.front.clean()
+    with self._mutex:
+      self._generation += 1
+      self._tagHashes = {}
+
+  def loadTagHash(self, tagKeys, create = False):
+    tagKeys = tuple(sorted(tagKeys))
+    now     = time.time()
+    try:
+      expiry, tagHash = self._tagHashes[tagKeys]
+      if expiry > now:
+        return tagHash
+    except KeyError:
+      pass
+
+    generation = self._generation
+    tagHash    = self.remote.loadTagHash(tagKeys, create)
+    if tagHash is not None:
+      with self._mutex:
+        if generation == self._generation:
+          self._tagHashes[tagKeys] = now + self.tagTtl, tagHash
+    return tagHash
@@ -1,59 +1,161 @@
-import time
+import os
+import binascii
+import threading
 
 try:
   import pylibmc as memcache
 except ImportError:
   import memcache
 
-from . import AbstractBackend, AbstractLock
+from . import AbstractBackend, PollingLock, renewer
 
 
 __all__ = 'Lock', 'Backend'
 
 
-class Lock(AbstractLock):
-  '''Key-aware distributed lock'''
+class Lock(PollingLock):
+  '''Key-aware distributed lock. The lock entry holds unique token of the holder, which is
+  compared on release and renewal. Memcached has no compare-and-delete, so there's a tiny
+  window between the comparison and the deletion, unlike in ``hermes.backend.redis.Lock``.
 
-  client = None
-  '''Memcached client'''
+  Lock TTL is short, and while the lock is held it's renewed every ``renew`` seconds by
+  ``hermes.backend.renewer``.
+
+  Memcached has no notification mechanism, so waiters of other processes poll, see
+  ``hermes.backend.PollingLock``. Waiters of the process where the holder releases the lock
+  are woken up immediately.'''
 
-  timeout = 900
-  '''Maximum TTL of lock, can be up to 30 days,
+  timeout = 30
+  '''TTL of lock, can be up to 30 days,
   otherwise memcached will treated it as a unix timestamp of an exact date'''
 
-  sleep = 0.1
-  '''Amount of time to sleep per ``while True`` iteration when waiting'''
+  renew = None
+  '''Seconds between lock TTL renewals while the lock is held, a third of ``timeout`` by
+  default. ``0`` disables renewal.'''
 
+  token = None
+  '''Unique value of the lock entry, while the lock is held by this object'''
 
-  def __init__(self, key, client, **kwargs):
-    super(Lock, self).__init__(key)
+  _client = None
+  '''Memcached client'''
+
+  _backend = None
+  '''Backend, whose thread-mapped client is used instead, when the lock is created by the
+  backend. Memcached clients aren't thread-safe, and the lock is renewed, and with
+  write-behind released, in other threads.'''
+
+  _event = None
+  '''Event of the lock key, obtained before an acquire attempt while waiting'''
+
+  _events = {}
+  '''Process-wide dictionary of lock key to ``threading.Event``, set on release'''
 
-    self.client = client
+  _waiters = {}
+  '''Process-wide dictionary of lock key to number of waiting threads. The event of the key is
+  removed when its last waiter stops waiting, so the event dictionary doesn't grow with keys
+  whose holder is in another process.'''
 
-    self.sleep   = kwargs.get('lockSleep',   self.sleep)
-    self.timeout = kwargs.get('lockTimeout', self.timeout)
+  _eventsLock = threading.Lock()
+  '''Lock of process-wide event and waiter dictionaries'''
+
+
+  def __init__(self, key, client, **kwargs):
+    super(Lock, self).__init__(key, **kwargs)
+
+    self._client  = client
+    self._backend = kwargs.get('backend')
+    self.timeout  = kwargs.get('lockTimeout', self.timeout)
     if self.timeout is None:
       self.timeout = 0
+    self.renew = kwargs.get('lockRenew', self.renew)
+    if self.renew is None:
+      self.renew = self.timeout / 3.0
 
-  def acquire(self, wait = True):
-    while True:
-      if self.client.add(self.key, 'locked', self.timeout):
-        return True
-      elif not wait:
-        return False
+  @property
+  def client(self):
+    '''Memcached client'''
+
+    return self._backend.client if self._backend else self._client
+
+  def _getEvent(self):
+    with self._eventsLock:
+      return self._events.setdefault(self.key, threading.Event())
+
+  def _enter(self):
+    with self._eventsLock:
+      self._waiters[self.key] = self._waiters.get(self.key, 0) + 1
+
+  def _leave(self):
+    with self._eventsLock:
+      count = self._waiters.pop(self.key) - 1
+      if count:
+        self._waiters[self.key] = count
       else:
-        time.sleep(self.sleep)
+        self._events.pop(self.key, None)
+
+  def _tryAcquire(self):
+    token = binascii.hexlify(os.urandom(8)).decode('ascii')
+    if not self.client.add(self.key, token, self.timeout):
+      return False
+
+    self.token = token
+    if self.renew:
+      renewer.add(self)
+    return True
+
+  def _pause(self, timeout):
+    self._event.wait(timeout)
+    # the event is obtained before the attempt not to miss release in between
+    self._event = self._getEvent()
+
+  def _poll(self):
+    self._enter()
+    try:
+      self._event = self._getEvent()
+      if self._tryAcquire():
+        return True
+      return super(Lock, self)._poll()
+    finally:
+      self._event = None
+      self._leave()
 
   def release(self):
-    self.client.delete(self.key)
+    token, self.token = self.token, None
+    if token is None:
+      return
+
+    renewer.remove(self)
+    if self.client.get(self.key) == token:
+      self.client.delete(self.key)
+
+    with self._eventsLock:
+      event = self._events.pop(self.key, None)
+    if event:
+      event.set()
+
+  def extend(self):
+    '''Reset lock TTL. Return ``False`` if the lock isn't held by this object anymore.'''
+
+    token = self.token
+    if token is None or self.client.get(self.key) != token:
+      return False
+    return bool(self.client.touch(self.key, self.timeout))
 
 
 class Backend(AbstractBackend):
-  '''Memcached backend implementation'''
+  '''Memcached backend implementation. Memcached clients aren't thread-safe, so each thread
+  gets its own client. With ``pylibmc`` it's a clone of the first created client, which
+  shares its configuration.'''
 
-  _client = None
+  _local = None
   '''Thread-local data'''
 
+  _master = None
+  '''First created client, which ``pylibmc`` clients of other threads are cloned from'''
+
+  _masterLock = None
+  '''Lock guarding the master client creation'''
+
   _options = None
   '''Client options'''
 
@@ -62,17 +164,34 @@ class Backend(AbstractBackend):
     self.mangler  = mangler
     self._options = kwargs
 
+    self._local      = threading.local()
+    self._masterLock = threading.Lock()
+
   @property
   def client(self):
     '''Thread-mapped memcached client accessor'''
 
-    if self._client is None:
-      self._client = memcache.Client(self._options.get('servers', ['localhost:11211']))
-
-    return self._client
+    try:
+      return self._local.client
+    except AttributeError:
+      self._local.client = self._createClient()
+      return self._local.client
+
+  def _createClient(self):
+    servers = self._options.get('servers', ['localhost:11211'])
+    with self._masterLock:
+      if self._master is None:
+        self._master = memcache.Client(servers)
+        return self._master
+
+    if hasattr(self._master, 'clone'):
+      # pylibmc
+      return self._master.clone()
+    else:
+      return memcache.Client(servers)
 
   def lock(self, key):
-    return Lock(self.mangler.nameLock(key), self.client, **self._options)
+    return Lock(self.mangler.nameLock(key), None, backend = self, **self._options)
 
   def save(self, key = None, value = None, mapping = None, ttl = None):
     if not mapping:
@@ -0,0 +1,376 @@
+from __future__ import absolute_import
+
+import os
+import time
+import zlib
+import mmap
+import fcntl
+import struct
+import tempfile
+import threading
+
+from . import AbstractBackend, PollingLock
+
+
+__all__ = 'Lock', 'Backend'
+
+
+class Lock(PollingLock):
+  '''Key-aware cross-process lock. It's a POSIX record lock of one byte of the backend file at
+  an offset derived from the key, so the lock of a crashed holder is released by the OS.
+  Record locks are owned by processes, not threads, so threads of one process are excluded by
+  the backend's set of held offsets. There's no notification mechanism, so waiters poll, see
+  ``hermes.backend.PollingLock``.'''
+
+  offset = None
+  '''Offset of the locked byte'''
+
+  _backend = None
+  '''Backend instance'''
+
+  _held = False
+  '''Whether the lock is held by this object'''
+
+
+  def __init__(self, key, backend, **kwargs):
+    super(Lock, self).__init__(key, **kwargs)
+
+    self._backend = backend
+    self.offset   = backend._lockOffset(key)
+
+  def _tryAcquire(self):
+    if not self._backend._tryLock(self.offset):
+      return False
+
+    self._held = True
+    return True
+
+  def release(self):
+    if self._held:
+      self._held = False
+      self._backend._unlock(self.offset)
+
+
+class Backend(AbstractBackend):
+  '''Host-local backend implementation, which is shared by processes on the host, e.g. workers
+  of a prefork server. Entries are stored in a memory-mapped file, so a read is a hash index
+  lookup in shared memory without network round trip. Unix-only, as it relies on ``fcntl``.
+
+  The file is an array of ``maxsize`` fixed-size slots of ``slotSize`` bytes, grouped in sets
+  of ``ways`` slots. The hash of a key selects the set, and the entry is looked up among its
+  slots, so an operation scans at most ``ways`` slots. A new entry takes an empty or expired
+  slot of the set, otherwise the least recently used slot of the set is evicted. Thus eviction
+  is LRU per set, which approximates LRU of the whole cache. An entry whose key and serialised
+  value don't fit in a slot isn't saved.
+
+  Access to the index is guarded by a POSIX record lock of the first byte of the file, shared
+  for reads, so processes read concurrently, and exclusive for writes. Within a process the
+  access is serialised by a mutex. Record locks are owned by processes, so backends of one file
+  in a process share its descriptor, mapping, mutex and held entry locks, see ``_File``.
+  ``lock`` is a key-aware cross-process lock, see ``Lock``.
+
+  The file is created on first use, and processes must use the same ``maxsize``, ``slotSize``
+  and ``ways`` for it. The size of the file is ``maxsize * slotSize``, though it's sparse
+  until the slots are written.'''
+
+  path = os.path.join(tempfile.gettempdir(), 'hermes.cache')
+  '''Path of the cache file'''
+
+  maxsize = 16384
+  '''Number of slots, rounded up to a multiple of ``ways``'''
+
+  slotSize = 2048
+  '''Size of a slot, which bounds size of key and serialised value of an entry'''
+
+  ways = 8
+  '''Number of slots in a set'''
+
+  magic = b'HRMC'
+  '''File signature'''
+
+  headerStruct = struct.Struct('<4sIII')
+  '''File header of signature, number of sets, number of ways and slot size'''
+
+  headerSize = 64
+  '''Size reserved for the file header, the slots follow it'''
+
+  slotStruct = struct.Struct('<IddHI')
+  '''Slot header of key hash, expiry timestamp, last access timestamp, key size and value size.
+  Expiry timestamp is ``0`` for an entry without TTL, key size is ``0`` for an empty slot.'''
+
+  slotHeaderSize = 32
+  '''Size reserved for the slot header, the key and the value follow it'''
+
+  _lockOffsetBase = 1
+  '''Offset of the byte range of entry locks, past the byte of the index lock'''
+
+  _file = None
+  '''File descriptor of the cache file'''
+
+  _map = None
+  '''``mmap.mmap`` of the cache file'''
+
+  _sets = None
+  '''Number of sets'''
+
+  _shared = None
+  '''Process-wide state of the cache file'''
+
+  _files = {}
+  '''Process-wide dictionary of real path of cache file to its ``_File``'''
+
+  _filesLock = threading.Lock()
+  '''Lock of process-wide file dictionary'''
+
+  _options = None
+  '''Lock options'''
+
+
+  def __init__(self, mangler, **kwargs):
+    super(Backend, self).__init__(mangler)
+
+    self.path     = kwargs.pop('path',     self.path)
+    self.slotSize = kwargs.pop('slotSize', self.slotSize)
+    self.ways     = kwargs.pop('ways',     self.ways)
+    self.maxsize  = kwargs.pop('maxsize',  self.maxsize)
+    self._options = kwargs
+
+    self._sets = max(1, -(-self.maxsize // self.ways))
+    if self.slotSize <= self.slotHeaderSize:
+      raise ValueError('Slot size must be greater than {0}'.format(self.slotHeaderSize))
+
+    header = self.headerStruct.pack(self.magic, self._sets, self.ways, self.slotSize)
+    path   = os.path.realpath(self.path)
+    with self._filesLock:
+      self._shared = self._files.get(path)
+      if self._shared is None or not self._shared.isAt(path):
+        self._shared = self._files[path] = self._open(header)
+      elif self._shared.map[:len(header)] != header:
+        raise ValueError('Cache file {0} has different layout'.format(self.path))
+
+    self._file = self._shared.fd
+    self._map  = self._shared.map
+
+  def _open(self, header):
+    '''Open the cache file and map it into memory. A new file is initialised under exclusive
+    lock, so concurrently started processes don't race.'''
+
+    size = self.headerSize + self._sets * self.ways * self.slotSize
+    fd   = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+    fcntl.lockf(fd, fcntl.LOCK_EX, 1, 0)
+    try:
+      existing = os.read(fd, self.headerStruct.size)
+      if not existing:
+        os.ftruncate(fd, size)
+        os.write(fd, header)
+      elif existing != header:
+        raise ValueError('Cache file {0} has different layout'.format(self.path))
+    except Exception:
+      fcntl.lockf(fd, fcntl.LOCK_UN, 1, 0)
+      os.close(fd)
+      raise
+
+    result = _File(fd, mmap.mmap(fd, size))
+    fcntl.lockf(fd, fcntl.LOCK_UN, 1, 0)
+    return result
+
+  def _guard(self, exclusive):
+    '''Return context manager which locks the index within the process and across processes'''
+
+    shared = self._shared.current()
+    return _Guard(shared.mutex, shared.fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+  @staticmethod
+  def _encode(key):
+    return key if isinstance(key, bytes) else key.encode('utf-8')
+
+  def _find(self, key, keyHash, now):
+    '''Return tuple of offset of the slot of the key, or ``None``, and offset of the slot to
+    write the key to, i.e. the slot of the key, an empty or expired slot, or the least recently
+    used slot of the set.'''
+
+    free   = None
+    lru    = None
+    oldest = None
+    unpack = self.slotStruct.unpack_from
+    start  = self.headerSize + (keyHash % self._sets) * self.ways * self.slotSize
+    for offset in range(start, start + self.ways * self.slotSize, self.slotSize):
+      slotHash, expiry, access, keySize, _ = unpack(self._map, offset)
+      if not keySize or (expiry and expiry <= now):
+        if free is None:
+          free = offset
+        continue
+
+      keyStart = offset + self.slotHeaderSize
+      if slotHash == keyHash and self._map[keyStart:keyStart + keySize] == key:
+        return offset, offset
+      elif lru is None or access < oldest:
+        lru, oldest = offset, access
+
+    return None, free if free is not None else lru
+
+  def _get(self, key, now):
+    key    = self._encode(key)
+    offset = self._find(key, zlib.crc32(key) & 0xffffffff, now)[0]
+    if offset is not None:
+      _, expiry, _, keySize, valueSize = self.slotStruct.unpack_from(self._map, offset)
+      if not expiry or expiry > now:
+        # concurrent readers may overwrite each other's access time, which is harmless
+        struct.pack_into('<d', self._map, offset + 12, now)
+        start = offset + self.slotHeaderSize + keySize
+        return self._map[start:start + valueSize]
+
+  def _clear(self, offset):
+    self.slotStruct.pack_into(self._map, offset, 0, 0, 0, 0, 0)
+
+  def _lockOffset(self, key):
+    return self._lockOffsetBase + (zlib.crc32(self._encode(key)) & 0xffffffff)
+
+  def _tryLock(self, offset):
+    shared = self._shared.current()
+    with shared.mutex:
+      if offset in shared.held:
+        return False
+      try:
+        fcntl.lockf(shared.fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+      except (IOError, OSError):
+        return False
+      shared.held.add(offset)
+      return True
+
+  def _unlock(self, offset):
+    shared = self._shared.current()
+    with shared.mutex:
+      if offset in shared.held:
+        shared.held.discard(offset)
+        fcntl.lockf(shared.fd, fcntl.LOCK_UN, 1, offset)
+
+  def lock(self, key):
+    return Lock(self.mangler.nameLock(key), self, **self._options)
+
+  def save(self, key = None, value = None, mapping = None, ttl = None):
+    if not mapping:
+      mapping = {key : value}
+
+    mapping  = {self._encode(k) : self.mangler.dumps(v) for k, v in mapping.items()}
+    now      = time.time()
+    expiry   = now + ttl if ttl else 0
+    capacity = self.slotSize - self.slotHeaderSize
+    with self._guard(exclusive = True):
+      for k, v in mapping.items():
+        keyHash       = zlib.crc32(k) & 0xffffffff
+        found, offset = self._find(k, keyHash, now)
+        if len(k) + len(v) > capacity:
+          # an entry which doesn't fit isn't saved, and its previous value is removed
+          if found is not None:
+            self._clear(found)
+          continue
+
+        start = offset + self.slotHeaderSize
+        self._map[start:start + len(k) + len(v)] = k + v
+        self.slotStruct.pack_into(self._map, offset, keyHash, expiry, now, len(k), len(v))
+
+  def load(self, keys):
+    now = time.time()
+    if self._isScalar(keys):
+      with self._guard(exclusive = False):
+        value = self._get(keys, now)
+      if value is not None:
+        value = self.mangler.loads(value)
+      return value
+    else:
+      with self._guard(exclusive = False):
+        values = {k : self._get(k, now) for k in keys}
+      return {k : self.mangler.loads(v) for k, v in values.items() if v is not None}
+
+  def remove(self, keys):
+    if self._isScalar(keys):
+      keys = (keys,)
+
+    now = time.time()
+    with self._guard(exclusive = True):
+      for key in keys:
+        key = self._encode(key)
+        offset = self._find(key, zlib.crc32(key) & 0xffffffff, now)[0]
+        if offset is not None:
+          self._clear(offset)
+
+  def clean(self):
+    with self._guard(exclusive = True):
+      for offset in range(self.headerSize, len(self._map), self.slotSize):
+        self._clear(offset)
+
+  def dump(self):
+    now    = time.time()
+    result = {}
+    with self._guard(exclusive = False):
+      for offset in range(self.headerSize, len(self._map), self.slotSize):
+        _, expiry, _, keySize, valueSize = self.slotStruct.unpack_from(self._map, offset)
+        if keySize and (not expiry or expiry > now):
+          start = offset + self.slotHeaderSize
+          key   = self._map[start:start + keySize].decode('utf-8')
+          result[key] = self._map[start + keySize:start + keySize + valueSize]
+
+    return {k : self.mangler.loads(v) for k, v in result.items()}
+
+
+class _File(object):
+  '''Process-wide state of an open cache file. Record locks are owned by processes, and closing
+  any descriptor of the file releases them, so the file is opened once per process, and its
+  backends share the mutex of the index and the set of held entry locks.'''
+
+  __slots__ = 'fd', 'map', 'mutex', 'held', 'pid'
+
+
+  def __init__(self, fd, map):
+    self.fd  = fd
+    self.map = map
+    self._reset()
+
+  def _reset(self):
+    self.mutex = threading.Lock()
+    self.held  = set()
+    self.pid   = os.getpid()
+
+  def current(self):
+    '''Return the state, after resetting in-process state inherited by a forked child'''
+
+    if self.pid != os.getpid():
+      self._reset()
+    return self
+
+  def isAt(self, path):
+    '''Tell whether the file is still at the path, i.e. it wasn't removed or replaced'''
+
+    try:
+      stat = os.stat(path)
+    except OSError:
+      return False
+    fstat = os.fstat(self.fd)
+    return (stat.st_dev, stat.st_ino) == (fstat.st_dev, fstat.st_ino)
+
+
+class _Guard(object):
+  '''Context manager of the index lock'''
+
+  __slots__ = 'mutex', 'file', 'operation'
+
+
+  def __init__(self, mutex, file, operation):
+    self.mutex     = mutex
+    self.file      = file
+    self.operation = operation
+
+  def __enter__(self):
+    self.mutex.acquire()
+    try:
+      fcntl.lockf(self.file, self.operation, 1, 0)
+    except Exception:
+      self.mutex.release()
+      raise
+
+  def __exit__(self, type, value, traceback):
+    try:
+      fcntl.lockf(self.file, fcntl.LOCK_UN, 1, 0)
+    finally:
+      self.mutex.release()
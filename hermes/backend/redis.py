@@ -1,10 +1,13 @@
 from __future__ import absolute_import
 
+import os
 import time
+import hashlib
+import binascii
 
 import redis
 
-from . import AbstractBackend, AbstractLock
+from . import AbstractBackend, AbstractLock, renewer
 
 
 __all__ = 'Lock', 'Backend'
@@ -13,54 +16,214 @@ __all__ = 'Lock', 'Backend'
 class Lock(AbstractLock):
   '''Key-aware distributed lock. "Distributed" is in sense of clients,
   not Redis instances. Implemented as described `here
-  <http://redis.io/topics/distlock#correct-implementation-with-a-single-instance>`_,
-  but without setting unique value to the lock entry and later checking it,
-  because it is expected for a cached function to comlete before lock timeout.'''
+  <http://redis.io/topics/distlock#correct-implementation-with-a-single-instance>`_.
+  The lock entry holds unique token of the holder, and release and renewal compare it in
+  Lua scripts, so a holder whose lock has expired can't remove or prolong the lock of another.
+
+  Lock TTL is short, and while the lock is held it's renewed every ``renew`` seconds by
+  ``hermes.backend.renewer``. Thus the lock of a crashed holder expires soon, while a slow
+  computation keeps its lock. A waiter waits at most ``wait`` seconds, if set, then
+  ``acquire`` returns ``False`` and the caller proceeds without the lock.
+
+  Waiters don't poll. They subscribe to the channel named after the lock key, and the
+  holder publishes to it on release, so the waiters are woken up immediately.'''
 
   client = None
   '''Redis client'''
 
-  timeout = 900
-  '''Maximum TTL of lock'''
+  subscriber = None
+  '''Redis client to subscribe for release notification with, ``client`` by default'''
+
+  timeout = 30
+  '''TTL of lock'''
+
+  renew = None
+  '''Seconds between lock TTL renewals while the lock is held, a third of ``timeout`` by
+  default. ``0`` disables renewal.'''
+
+  wait = None
+  '''Maximum amount of time to wait for the lock, unlimited by default'''
+
+  sleep = 1
+  '''Maximum amount of time to wait for release notification before re-trying to acquire the
+  lock. Normally the notification comes earlier, but the holder may crash without releasing.'''
+
+  token = None
+  '''Unique value of the lock entry, while the lock is held by this object'''
 
-  sleep = 0.1
-  '''Amount of time to sleep per ``while True`` iteration when waiting'''
+  releaseLua = '''
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+      redis.call('DEL', KEYS[1])
+      redis.call('PUBLISH', KEYS[1], 'released')
+      return 1
+    end
+    return 0
+  '''
+  '''Lua script which deletes the lock entry, ``KEYS``, if it holds the token, ``ARGV``, and
+  notifies the waiters'''
+
+  extendLua = '''
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+      return redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+  '''
+  '''Lua script which resets TTL of the lock entry, ``KEYS``, to given seconds if it holds the
+  token, ``ARGV``'''
 
 
   def __init__(self, key, client, **kwargs):
     super(Lock, self).__init__(key)
 
-    self.client = client
+    self.client     = client
+    self.subscriber = kwargs.get('subscriber') or client
 
     self.sleep   = kwargs.get('lockSleep',   self.sleep)
+    self.wait    = kwargs.get('lockWait',    self.wait)
     self.timeout = kwargs.get('lockTimeout', self.timeout)
     if self.timeout is None:
       self.timeout = 0
+    self.renew = kwargs.get('lockRenew', self.renew)
+    if self.renew is None:
+      self.renew = self.timeout / 3.0
+
+  @staticmethod
+  def _createToken():
+    return binascii.hexlify(os.urandom(8)).decode('ascii')
+
+  def _set(self, token):
+    return self.client.set(self.key, token, nx = True, ex = self.timeout)
+
+  def _acquired(self, token):
+    self.token = token
+    if self.renew:
+      renewer.add(self)
+    return True
+
+  def _remaining(self, deadline):
+    '''Return seconds to wait for release notification, or ``0`` when the wait is over'''
+
+    if deadline is None:
+      return self.sleep
+    return max(0, min(self.sleep, deadline - time.time()))
 
   def acquire(self, wait = True):
-    while True:
-      if self.client.set(self.key, 'locked', nx = True, ex = self.timeout):
-        return True
-      elif not wait:
-        return False
-      else:
-        time.sleep(self.sleep)
+    token = self._createToken()
+    if self._set(token):
+      return self._acquired(token)
+    elif not wait:
+      return False
+
+    deadline = time.time() + self.wait if self.wait else None
+    pubsub   = self.subscriber.pubsub(ignore_subscribe_messages = True)
+    pubsub.subscribe(self.key)
+    try:
+      # the lock could have been released before the subscription
+      while not self._set(token):
+        timeout = self._remaining(deadline)
+        if not timeout:
+          return False
+        pubsub.get_message(timeout = timeout)
+      return self._acquired(token)
+    finally:
+      pubsub.close()
 
   def release(self):
-    self.client.delete(self.key)
+    token, self.token = self.token, None
+    if token is not None:
+      renewer.remove(self)
+      self.client.register_script(self.releaseLua)(keys = [self.key], args = [token])
+
+  def extend(self):
+    '''Reset lock TTL. Return ``False`` if the lock isn't held by this object anymore.'''
+
+    token = self.token
+    return token is not None and bool(self.client.register_script(self.extendLua)(
+      keys = [self.key], args = [token, self.timeout]))
 
 
 class Backend(AbstractBackend):
-  '''Redis backend implementation'''
+  '''Redis backend implementation.
+
+  Besides ``host``, ``port``, ``db`` and ``password``, the following connection options are
+  supported: ``socketPath`` to connect via Unix domain socket, ``socketTimeout``,
+  ``connectTimeout``, ``keepalive``, ``keepaliveOptions``, ``maxConnections``, ``blocking``
+  to wait at most ``poolTimeout`` seconds for a free connection when ``maxConnections`` are
+  in use, and ``pool`` to use a given connection pool, e.g. ``pool`` of another backend.
+
+  Tagged entries are loaded in one round trip. Tag entry lookup, composite key derivation and
+  entry lookup are made on the server by a Lua script. Because of that, tag hash is SHA1 of raw
+  serialised tag entries, not ``Mangler.hashTags``. Similarly tagged entries are saved in one
+  round trip, including creation of missing tag entries.'''
+
+  loadTaggedLua = '''
+    local tags = redis.call('MGET', unpack(KEYS))
+    for i = 1, #tags do
+      if not tags[i] then
+        return nil
+      end
+    end
+
+    local hash = redis.sha1hex(table.concat(tags, ':')):sub(1, 32):gsub('(.).', '%1')
+    local keys = {}
+    for i = 1, #ARGV do
+      keys[i] = ARGV[i] .. ':' .. hash
+    end
+
+    return redis.call('MGET', unpack(keys))
+  '''
+  '''Lua script which loads tagged entries, ``ARGV``, for given tag entries, ``KEYS``'''
+
+  saveTaggedLua = '''
+    local tags = redis.call('MGET', unpack(KEYS))
+    for i = 1, #tags do
+      if not tags[i] then
+        tags[i] = ARGV[i + 1]
+        redis.call('SET', KEYS[i], tags[i])
+      end
+    end
+
+    local hash = redis.sha1hex(table.concat(tags, ':')):sub(1, 32):gsub('(.).', '%1')
+    local ttl  = tonumber(ARGV[1])
+    for i = #KEYS + 2, #ARGV, 2 do
+      if ttl > 0 then
+        redis.call('SETEX', ARGV[i] .. ':' .. hash, ttl, ARGV[i + 1])
+      else
+        redis.call('SET', ARGV[i] .. ':' .. hash, ARGV[i + 1])
+      end
+    end
+  '''
+  '''Lua script which saves tagged entries for given tag entries, ``KEYS``. ``ARGV`` is TTL,
+  followed by a serialised value per tag entry, which is set if the tag entry is absent,
+  followed by entry key and serialised value pairs.'''
+
+  _redis = redis
+  '''Redis client library module'''
 
   _client = None
   '''Redis client'''
   _client_opt = None
-  '''Arguments for StrictRedis'''
+  '''Arguments for connection pool'''
+
+  _pool = None
+  '''Connection pool, shared by the client and can be shared with other backends'''
+
+  _subscriber = None
+  '''Redis client of lock waiters' subscriptions'''
+
+  _blocking = False
+  '''Flag defining if ``BlockingConnectionPool`` is used, which makes a thread wait for a free
+  connection, instead of creating more than ``max_connections`` connections'''
 
   _options = None
   '''Lock options'''
 
+  _loadTaggedScript = None
+  '''Registered ``loadTaggedLua`` script'''
+
+  _saveTaggedScript = None
+  '''Registered ``saveTaggedLua`` script'''
+
 
   def __init__(self, mangler, **kwargs):
     super(Backend, self).__init__(mangler)
@@ -69,19 +232,97 @@ class Backend(AbstractBackend):
       'host'     : kwargs.pop('host',     'localhost'),
       'password' : kwargs.pop('password', None),
       'port'     : kwargs.pop('port',     6379),
-      'db'       : kwargs.pop('db',       0)
+      'db'       : kwargs.pop('db',       0),
+
+      'socket_timeout'          : kwargs.pop('socketTimeout',    None),
+      'socket_connect_timeout'  : kwargs.pop('connectTimeout',   None),
+      'socket_keepalive'        : kwargs.pop('keepalive',        None),
+      'socket_keepalive_options': kwargs.pop('keepaliveOptions', None),
+      'max_connections'         : kwargs.pop('maxConnections',   None)
     }
 
+    socketPath = kwargs.pop('socketPath', None)
+    if socketPath:
+      # TCP-only options aren't accepted by ``UnixDomainSocketConnection``
+      for name in ('host', 'port', 'socket_connect_timeout', 'socket_keepalive',
+          'socket_keepalive_options'):
+        del self._client_opt[name]
+      self._client_opt['path'] = socketPath
+      self._client_opt['connection_class'] = self._redis.UnixDomainSocketConnection
+
+    self._blocking = kwargs.pop('blocking', self._blocking)
+    if self._blocking:
+      self._client_opt['timeout'] = kwargs.pop('poolTimeout', 20)
+      if self._client_opt['max_connections'] is None:
+        # ``BlockingConnectionPool`` doesn't accept ``None``
+        del self._client_opt['max_connections']
+
+    self._pool    = kwargs.pop('pool', None)
     self._options = kwargs
 
+  @property
+  def pool(self):
+    '''Connection pool. It can be passed as ``pool`` to another backend to share connections.'''
+
+    if self._pool is None:
+      if self._blocking:
+        self._pool = self._redis.BlockingConnectionPool(**self._client_opt)
+      else:
+        self._pool = self._redis.ConnectionPool(**self._client_opt)
+    return self._pool
+
   @property
   def client(self):
     if self._client is None:
-      self._client = redis.StrictRedis(**self._client_opt)
+      self._client = self._redis.StrictRedis(connection_pool = self.pool)
     return self._client
 
+  @property
+  def subscriber(self):
+    '''Client which lock waiters subscribe for release notification with. A subscription holds
+    a connection for the whole wait, so if waiters took connections from ``pool``, which may be
+    capped by ``maxConnections``, they could exhaust it and block the lock holder, whose save
+    and release they wait for. Hence the client has its own pool with the same connection
+    options.'''
+
+    if self._subscriber is None:
+      pool = self._redis.ConnectionPool(
+        connection_class = self.pool.connection_class, **self.pool.connection_kwargs)
+      self._subscriber = self._redis.StrictRedis(connection_pool = pool)
+    return self._subscriber
+
+  @property
+  def loadTaggedScript(self):
+    if self._loadTaggedScript is None:
+      self._loadTaggedScript = self.client.register_script(self.loadTaggedLua)
+    return self._loadTaggedScript
+
+  @property
+  def saveTaggedScript(self):
+    if self._saveTaggedScript is None:
+      self._saveTaggedScript = self.client.register_script(self.saveTaggedLua)
+    return self._saveTaggedScript
+
+  def _saveTaggedArgs(self, tagKeys, mapping, ttl):
+    '''Return ``KEYS`` and ``ARGV`` of ``saveTaggedLua``'''
+
+    tagMap = self.mangler.mapTags(tagKeys)
+    args   = [ttl or 0]
+    args.extend(self.mangler.dumps(tagMap[k]) for k in tagKeys)
+    for k, v in mapping.items():
+      args.extend((k, self.mangler.dumps(v)))
+    return tagKeys, args
+
+  @staticmethod
+  def _hashTags(values):
+    '''Python counterpart of ``loadTaggedLua`` tag hash, ``values`` are raw serialised
+    tag entries sorted by key'''
+
+    return hashlib.sha1(b':'.join(values)).hexdigest()[:32][::2]
+
   def lock(self, key):
-    return Lock(self.mangler.nameLock(key), self.client, **self._options)
+    return Lock(
+      self.mangler.nameLock(key), self.client, subscriber = self.subscriber, **self._options)
 
   def save(self, key = None, value = None, mapping = None, ttl = None):
     if not mapping:
@@ -116,3 +357,45 @@ class Backend(AbstractBackend):
   def clean(self):
     self.client.flushdb()
 
+  def loadTagHash(self, tagKeys, create = False):
+    values = self._loadTagValues(sorted(tagKeys), create)
+    return self._hashTags(values) if values else None
+
+  def _loadTagValues(self, tagKeys, create):
+    '''Return list of raw serialised tag entries of given tag entry keys, or ``None`` if some
+    of them are absent, unless ``create`` is true'''
+
+    values = self.client.mget(tagKeys)
+    if None in values:
+      if not create:
+        return None
+
+      missing  = [k for k, v in zip(tagKeys, values) if v is None]
+      pipeline = self.client.pipeline()
+      for k, v in self.mangler.mapTags(missing).items():
+        # another client may have created the tag entry in the meantime
+        pipeline.set(k, self.mangler.dumps(v), nx = True)
+      pipeline.mget(tagKeys)
+      values = pipeline.execute()[-1]
+
+    return values
+
+  def saveTagged(self, tagKeys, key = None, value = None, mapping = None, ttl = None):
+    if not mapping:
+      mapping = {key : value}
+
+    keys, args = self._saveTaggedArgs(sorted(tagKeys), mapping, ttl)
+    self.saveTaggedScript(keys = keys, args = args)
+
+  def loadTagged(self, tagKeys, keys):
+    tagKeys = sorted(tagKeys)
+    if self._isScalar(keys):
+      values = self.loadTaggedScript(keys = tagKeys, args = (keys,))
+      if values and values[0] is not None:
+        return self.mangler.loads(values[0])
+      return None
+    else:
+      keys   = tuple(keys)
+      values = self.loadTaggedScript(keys = tagKeys, args = keys)
+      return {k : self.mangler.loads(v) for k, v in zip(keys, values or ()) if v is not None}
+
@@ -0,0 +1,206 @@
+from __future__ import absolute_import
+
+import os
+import bisect
+import hashlib
+import threading
+from multiprocessing.pool import ThreadPool
+
+from . import AbstractBackend, redis
+
+
+__all__ = 'Backend',
+
+
+class Backend(AbstractBackend):
+  '''Redis backend which distributes keys across several Redis nodes by consistent hashing.
+  Usage::
+
+    cache = hermes.Hermes(hermes.backend.shardedredis.Backend, ttl = 600,
+      nodes = [{'host' : 'redis1'}, {'host' : 'redis2', 'port' : 6380}], socketTimeout = 2)
+
+  Each item of ``nodes`` is a dictionary of connection options of ``hermes.backend.redis``,
+  which extend the common options given as other keyword arguments.
+
+  Like in Redis Cluster, when a key contains a hash tag, a non-empty substring between ``{``
+  and the first following ``}``, only the hash tag is hashed. Multi-key calls are split per
+  node and run in parallel.
+
+  Tagged entry key ends with the tag hash, so without hash tags a tagged call makes two
+  round trips, one for the tag entries and one for the entries. When all tag entry keys and
+  entry keys have hash tags which map to one node, e.g. tag ``{user:42}`` and custom key
+  ``lambda fn, id: 'user:{{user:{0}}}'.format(id)``, the node serves the call in one round
+  trip.'''
+
+  replicas = 64
+  '''Number of points of each node on the hash ring'''
+
+  nodes = None
+  '''List of node backends, ``hermes.backend.redis.Backend`` instances'''
+
+  _ring = None
+  '''Sorted list of hash ring points'''
+
+  _ringNodes = None
+  '''List of node backends of the hash ring points'''
+
+  _threadPool = None
+  '''Thread pool which runs per node calls in parallel'''
+
+  _threadPoolLock = None
+  '''Lock guarding the thread pool creation'''
+
+  _pid = None
+  '''Process id the thread pool was created in, it's re-created in a forked child, which
+  doesn't have the pool's threads'''
+
+
+  def __init__(self, mangler, **kwargs):
+    super(Backend, self).__init__(mangler)
+
+    nodes = kwargs.pop('nodes', None)
+    if not nodes:
+      raise ValueError('At least one node is required')
+    self.replicas = kwargs.pop('replicas', self.replicas)
+
+    self.nodes = [redis.Backend(mangler, **dict(kwargs, **node)) for node in nodes]
+
+    points = []
+    for i, node in enumerate(self.nodes):
+      name = node._client_opt.get('path') or '{host}:{port}:{db}'.format(**node._client_opt)
+      for j in range(self.replicas):
+        points.append((self._hash('{0}-{1}'.format(name, j)), i))
+    points.sort()
+    self._ring      = [p for p, _ in points]
+    self._ringNodes = [self.nodes[i] for _, i in points]
+
+    self._threadPoolLock = threading.Lock()
+
+  @staticmethod
+  def _hash(value):
+    return int(hashlib.md5(value.encode('utf8')).hexdigest()[:8], 16)
+
+  @staticmethod
+  def _hashTag(key):
+    '''Return hash tag of the key, or ``None``'''
+
+    start = key.find('{')
+    if start != -1:
+      end = key.find('}', start + 1)
+      if end > start + 1:
+        return key[start + 1:end]
+
+  def node(self, key):
+    '''Return node backend of the key'''
+
+    hashTag = self._hashTag(key)
+    point   = self._hash(key if hashTag is None else hashTag)
+    return self._ringNodes[bisect.bisect(self._ring, point) % len(self._ring)]
+
+  def _split(self, keys):
+    '''Return list of ``(node, keys)`` tuples'''
+
+    result = {}
+    for k in keys:
+      result.setdefault(self.node(k), []).append(k)
+    return list(result.items())
+
+  def _map(self, fn, items):
+    '''Return list of results of the function applied to the items. When there's more than
+    one item, they're processed in parallel.'''
+
+    if len(items) < 2:
+      return [fn(item) for item in items]
+
+    pool = self._threadPool
+    if pool is None or self._pid != os.getpid():
+      with self._threadPoolLock:
+        if self._threadPool is None or self._pid != os.getpid():
+          self._threadPool = ThreadPool(len(self.nodes))
+          self._pid        = os.getpid()
+        pool = self._threadPool
+    return pool.map(fn, items)
+
+  def lock(self, key):
+    return self.node(self.mangler.nameLock(key)).lock(key)
+
+  def save(self, key = None, value = None, mapping = None, ttl = None):
+    if not mapping:
+      mapping = {key : value}
+
+    self._map(
+      lambda item: item[0].save(mapping = {k : mapping[k] for k in item[1]}, ttl = ttl),
+      self._split(mapping.keys()))
+
+  def load(self, keys):
+    if self._isScalar(keys):
+      return self.node(keys).load(keys)
+
+    result = {}
+    for part in self._map(lambda item: item[0].load(item[1]), self._split(keys)):
+      result.update(part)
+    return result
+
+  def remove(self, keys):
+    if self._isScalar(keys):
+      keys = (keys,)
+
+    self._map(lambda item: item[0].remove(item[1]), self._split(keys))
+
+  def clean(self):
+    self._map(lambda node: node.clean(), self.nodes)
+
+  def loadTagHash(self, tagKeys, create = False):
+    tagKeys = sorted(tagKeys)
+    parts   = self._split(tagKeys)
+    values  = self._map(lambda item: item[0]._loadTagValues(item[1], create), parts)
+    if None in values:
+      return None
+
+    valueMap = {}
+    for (_, keys), nodeValues in zip(parts, values):
+      valueMap.update(zip(keys, nodeValues))
+    return redis.Backend._hashTags([valueMap[k] for k in tagKeys])
+
+  def _tagNode(self, tagKeys, keys):
+    '''Return the node which has all tag entries and entries, when their keys have hash tags
+    which map to one node, otherwise ``None``'''
+
+    keys  = tuple(tagKeys) + ((keys,) if self._isScalar(keys) else tuple(keys))
+    nodes = set()
+    for k in keys:
+      if self._hashTag(k) is None:
+        return None
+      nodes.add(self.node(k))
+    if len(nodes) == 1:
+      return nodes.pop()
+
+  def saveTagged(self, tagKeys, key = None, value = None, mapping = None, ttl = None):
+    if not mapping:
+      mapping = {key : value}
+
+    node = self._tagNode(tagKeys, mapping.keys())
+    if node:
+      node.saveTagged(tagKeys, mapping = mapping, ttl = ttl)
+    else:
+      super(Backend, self).saveTagged(tagKeys, mapping = mapping, ttl = ttl)
+
+  def loadTagged(self, tagKeys, keys):
+    if not self._isScalar(keys):
+      keys = tuple(keys)
+
+    node = self._tagNode(tagKeys, keys)
+    if node:
+      return node.loadTagged(tagKeys, keys)
+    else:
+      return super(Backend, self).loadTagged(tagKeys, keys)
+
+  def removeTagged(self, tagKeys, keys):
+    if not self._isScalar(keys):
+      keys = tuple(keys)
+
+    node = self._tagNode(tagKeys, keys)
+    if node:
+      node.removeTagged(tagKeys, keys)
+    else:
+      super(Backend, self).removeTagged(tagKeys, keys)
@@ -0,0 +1,221 @@
+import os
+import time
+import sqlite3
+import binascii
+import tempfile
+import threading
+
+from . import AbstractBackend, PollingLock, renewer
+
+
+__all__ = 'Lock', 'Backend'
+
+
+class Lock(PollingLock):
+  '''Key-aware distributed lock. A lock is a row of the ``lock`` table which holds unique token
+  of the holder and the expiry time. Release and renewal compare the token in the statement, so
+  a holder whose lock has expired can't remove or prolong the lock of another.
+
+  Lock TTL is short, and while the lock is held it's renewed every ``renew`` seconds by
+  ``hermes.backend.renewer``. There's no notification mechanism, so waiters poll, see
+  ``hermes.backend.PollingLock``.'''
+
+  timeout = 30
+  '''TTL of lock, ``0`` or ``None`` means the lock doesn't expire'''
+
+  renew = None
+  '''Seconds between lock TTL renewals while the lock is held, a third of ``timeout`` by
+  default. ``0`` disables renewal.'''
+
+  token = None
+  '''Unique value of the lock row, while the lock is held by this object'''
+
+  _backend = None
+  '''Backend, whose thread-mapped connection is used'''
+
+
+  def __init__(self, key, backend, **kwargs):
+    super(Lock, self).__init__(key, **kwargs)
+
+    self._backend = backend
+    self.timeout  = kwargs.get('lockTimeout', self.timeout)
+    if self.timeout is None:
+      self.timeout = 0
+    self.renew = kwargs.get('lockRenew', self.renew)
+    if self.renew is None:
+      self.renew = self.timeout / 3.0
+
+  def _expiry(self, now):
+    return now + self.timeout if self.timeout else None
+
+  def _set(self, token):
+    now = time.time()
+    with self._backend.connection as connection:
+      connection.execute('DELETE FROM lock WHERE key = ? AND expiry <= ?', (self.key, now))
+      cursor = connection.execute('INSERT OR IGNORE INTO lock VALUES (?, ?, ?)',
+        (self.key, token, self._expiry(now)))
+      return cursor.rowcount == 1
+
+  def _tryAcquire(self):
+    token = binascii.hexlify(os.urandom(8)).decode('ascii')
+    if not self._set(token):
+      return False
+
+    self.token = token
+    if self.renew:
+      renewer.add(self)
+    return True
+
+  def release(self):
+    token, self.token = self.token, None
+    if token is not None:
+      renewer.remove(self)
+      with self._backend.connection as connection:
+        connection.execute('DELETE FROM lock WHERE key = ? AND token = ?', (self.key, token))
+
+  def extend(self):
+    '''Reset lock TTL. Return ``False`` if the lock isn't held by this object anymore.'''
+
+    token = self.token
+    if token is None:
+      return False
+
+    with self._backend.connection as connection:
+      cursor = connection.execute('UPDATE lock SET expiry = ? WHERE key = ? AND token = ?',
+        (self._expiry(time.time()), self.key, token))
+      return cursor.rowcount == 1
+
+
+class Backend(AbstractBackend):
+  '''SQLite backend implementation. The cache is a database file, ``path``, which survives
+  restarts and is shared by processes on the host. The database is in WAL mode, so readers
+  don't block each other nor the writer, across processes.
+
+  Entries are rows of the ``entry`` table, with expiry timestamp in an indexed column. Expired
+  rows are skipped on load, and on each save up to ``pruneLimit`` of them are deleted, so the
+  table doesn't grow with expired rows and no operation stalls on a full scan. Multi-key saves
+  and removals are made by ``executemany`` in one transaction, and multi-key loads by one
+  ``SELECT`` per ``batchSize`` keys.
+
+  ``sqlite3`` connections can't be shared by threads, so the backend maps a connection per
+  thread, and per process after fork.'''
+
+  path = os.path.join(tempfile.gettempdir(), 'hermes.sqlite')
+  '''Path of the database file'''
+
+  busyTimeout = 5
+  '''Seconds to wait for a concurrent writer to release the database lock'''
+
+  pruneLimit = 64
+  '''Maximum number of expired rows deleted on a save'''
+
+  batchSize = 512
+  '''Maximum number of keys in one ``SELECT``, it's bound by the limit of SQL parameters'''
+
+  schema = (
+    'CREATE TABLE IF NOT EXISTS entry '
+    '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expiry REAL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS entry_expiry ON entry (expiry) WHERE expiry IS NOT NULL',
+    'CREATE TABLE IF NOT EXISTS lock '
+    '(key TEXT PRIMARY KEY, token TEXT NOT NULL, expiry REAL) WITHOUT ROWID',
+  )
+  '''Statements creating the database schema'''
+
+  _local = None
+  '''Thread-local data'''
+
+  _pid = None
+  '''Process id the connections were created in, they're re-created in a forked child'''
+
+  _options = None
+  '''Lock options'''
+
+
+  def __init__(self, mangler, **kwargs):
+    super(Backend, self).__init__(mangler)
+
+    self.path        = kwargs.pop('path',        self.path)
+    self.busyTimeout = kwargs.pop('busyTimeout', self.busyTimeout)
+    self.pruneLimit  = kwargs.pop('pruneLimit',  self.pruneLimit)
+    self.batchSize   = kwargs.pop('batchSize',   self.batchSize)
+    self._options    = kwargs
+
+    self._local = threading.local()
+    self._pid   = os.getpid()
+
+    with self.connection as connection:
+      for statement in self.schema:
+        connection.execute(statement)
+
+  @property
+  def connection(self):
+    '''Thread-mapped connection accessor'''
+
+    if self._pid != os.getpid():
+      # connections inherited from the parent must not be used
+      self._local = threading.local()
+      self._pid   = os.getpid()
+
+    try:
+      return self._local.connection
+    except AttributeError:
+      self._local.connection = self._connect()
+      return self._local.connection
+
+  def _connect(self):
+    connection = sqlite3.connect(self.path, timeout = self.busyTimeout)
+    connection.execute('PRAGMA journal_mode = WAL')
+    # in WAL mode it's durable against application crash, but not against power loss
+    connection.execute('PRAGMA synchronous = NORMAL')
+    return connection
+
+  def lock(self, key):
+    return Lock(self.mangler.nameLock(key), self, **self._options)
+
+  def save(self, key = None, value = None, mapping = None, ttl = None):
+    if not mapping:
+      mapping = {key : value}
+
+    now    = time.time()
+    expiry = now + ttl if ttl else None
+    rows   = [(k, sqlite3.Binary(self.mangler.dumps(v)), expiry) for k, v in mapping.items()]
+    with self.connection as connection:
+      connection.executemany('INSERT OR REPLACE INTO entry VALUES (?, ?, ?)', rows)
+      connection.execute(
+        'DELETE FROM entry WHERE key IN '
+        '(SELECT key FROM entry WHERE expiry <= ? ORDER BY expiry LIMIT ?)',
+        (now, self.pruneLimit))
+
+  def load(self, keys):
+    now = time.time()
+    if self._isScalar(keys):
+      row = self.connection.execute(
+        'SELECT value FROM entry WHERE key = ? AND (expiry IS NULL OR expiry > ?)',
+        (keys, now)).fetchone()
+      return self.mangler.loads(bytes(row[0])) if row else None
+    else:
+      keys   = tuple(keys)
+      result = {}
+      for i in range(0, len(keys), self.batchSize):
+        chunk = keys[i:i + self.batchSize]
+        rows  = self.connection.execute(
+          'SELECT key, value FROM entry WHERE key IN ({0}) AND (expiry IS NULL OR expiry > ?)'
+          .format(','.join('?' * len(chunk))), chunk + (now,))
+        result.update((k, self.mangler.loads(bytes(v))) for k, v in rows)
+      return result
+
+  def remove(self, keys):
+    if self._isScalar(keys):
+      keys = (keys,)
+
+    with self.connection as connection:
+      connection.executemany('DELETE FROM entry WHERE key = ?', [(k,) for k in keys])
+
+  def clean(self):
+    with self.connection as connection:
+      connection.execute('DELETE FROM entry')
+
+  def dump(self):
+    rows = self.connection.execute(
+      'SELECT key, value FROM entry WHERE expiry IS NULL OR expiry > ?', (time.time(),))
+    return {k : self.mangler.loads(bytes(v)) for k, v in rows}
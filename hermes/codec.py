@@ -0,0 +1,139 @@
+import json
+import marshal
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+try:
+  import msgpack
+except ImportError:
+  msgpack = None
+
+
+__all__ = 'Codec', 'Pickle', 'Marshal', 'Json', 'Msgpack', 'register', 'get', 'decode'
+
+
+class Encoded(bytes):
+  '''Value serialised by a codec, including its format marker. ``Mangler.dumps`` passes it
+  through as is.'''
+
+
+class Codec(object):
+  '''Base value codec. Encoded value starts with one-byte format marker, which ``decode``
+  uses to find the codec, so values of different codecs can coexist in the cache.'''
+
+  marker = None
+  '''One-byte format marker'''
+
+
+  def dumps(self, value):
+    raise NotImplementedError()
+
+  def loads(self, value):
+    raise NotImplementedError()
+
+  def encode(self, value):
+    return Encoded(self.marker + self.dumps(value))
+
+  def decode(self, value):
+    return self.loads(value[1:])
+
+
+class Pickle(Codec):
+  '''Pickle with highest available protocol. Pickle protocol 2+ starts with ``PROTO``
+  opcode, so pickled value is marked by itself and the values written before codecs were
+  introduced are readable.'''
+
+  marker = b'\x80'
+
+
+  def dumps(self, value):
+    return pickle.dumps(value, protocol = pickle.HIGHEST_PROTOCOL)
+
+  def loads(self, value):
+    return pickle.loads(value)
+
+  def encode(self, value):
+    return Encoded(self.dumps(value))
+
+  def decode(self, value):
+    return self.loads(value)
+
+
+class Marshal(Codec):
+  '''Fast for built-in types, but the format is Python version specific'''
+
+  marker = b'M'
+
+
+  def dumps(self, value):
+    return marshal.dumps(value)
+
+  def loads(self, value):
+    return marshal.loads(value)
+
+
+class Json(Codec):
+  '''Note that tuples are loaded as lists and dictionary keys as strings'''
+
+  marker = b'J'
+
+
+  def dumps(self, value):
+    return json.dumps(value, separators = (',', ':')).encode('utf8')
+
+  def loads(self, value):
+    return json.loads(value.decode('utf8'))
+
+
+class Msgpack(Codec):
+  '''Requires ``msgpack`` package. Note that tuples are loaded as lists'''
+
+  marker = b'P'
+
+
+  def dumps(self, value):
+    return msgpack.packb(value, use_bin_type = True)
+
+  def loads(self, value):
+    return msgpack.unpackb(value, raw = False)
+
+
+_registry = {}
+'''Dictionary of codec name to codec instance'''
+
+_markers = {}
+'''Dictionary of format marker to codec instance'''
+
+
+def register(name, codec):
+  '''Make the codec instance available by the name for ``Hermes`` and ``@cache``'''
+
+  existing = _markers.get(codec.marker)
+  if existing and type(existing) is not type(codec):
+    raise ValueError('Marker {0!r} is already taken'.format(codec.marker))
+
+  _registry[name] = codec
+  _markers[codec.marker] = codec
+
+def get(name):
+  try:
+    return _registry[name]
+  except KeyError:
+    raise ValueError('Unknown codec: {0}'.format(name))
+
+def decode(value):
+  try:
+    codec = _markers[value[:1]]
+  except KeyError:
+    raise ValueError('Unknown format marker: {0!r}'.format(value[:1]))
+  return codec.decode(value)
+
+
+register('pickle',  Pickle())
+register('marshal', Marshal())
+register('json',    Json())
+if msgpack:
+  register('msgpack', Msgpack())
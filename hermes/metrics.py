@@ -0,0 +1,190 @@
+import time
+import bisect
+import threading
+
+
+__all__ = 'Histogram', 'Metrics', 'Registry'
+
+
+timer = getattr(time, 'perf_counter', time.time)
+'''Monotonic clock for latency measurement, ``time.time`` on Python 2'''
+
+
+class Histogram(object):
+  '''Histogram of observed values with fixed bucket upper bounds, like in Prometheus'''
+
+  buckets = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+  '''Sorted tuple of bucket upper bounds, seconds by default. The last, ``+Inf``, bucket is
+  implied.'''
+
+  counts = None
+  '''List of non-cumulative bucket counts, the last is ``+Inf`` bucket'''
+
+  sum = 0
+  '''Sum of observed values'''
+
+
+  def __init__(self, buckets = None):
+    self.buckets = tuple(buckets or self.buckets)
+    self.counts  = [0] * (len(self.buckets) + 1)
+
+  def observe(self, value):
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.sum += value
+
+  @property
+  def count(self):
+    return sum(self.counts)
+
+  def snapshot(self):
+    '''Return dictionary of ``buckets``, list of ``(upper bound, cumulative count)`` tuples,
+    ``sum`` and ``count``'''
+
+    cumulative = []
+    total      = 0
+    for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+      total += count
+      cumulative.append((bound, total))
+    return {'buckets' : cumulative, 'sum' : self.sum, 'count' : total}
+
+
+class Metrics(object):
+  '''Counters and latency histograms of a cached callable. They're updated without locking,
+  so an increment can be lost when threads race on it, which is accepted for the sake of
+  low overhead.'''
+
+  hits = 0
+  '''Number of entries found in cache'''
+
+  misses = 0
+  '''Number of entries computed by the callable'''
+
+  lockWaits = 0
+  '''Number of entry lock acquisitions on miss'''
+
+  lockWaitTime = 0
+  '''Seconds spent waiting for entry locks'''
+
+  computeTime = 0
+  '''Seconds spent in the callable'''
+
+  saves = 0
+  '''Number of saved entries'''
+
+  savedBytes = 0
+  '''Total serialised size of saved entries'''
+
+  load = None
+  '''Histogram of backend load latency'''
+
+  save = None
+  '''Histogram of backend save latency'''
+
+
+  def __init__(self):
+    self.load = Histogram()
+    self.save = Histogram()
+
+  def snapshot(self):
+    return {
+      'hits'         : self.hits,
+      'misses'       : self.misses,
+      'lockWaits'    : self.lockWaits,
+      'lockWaitTime' : self.lockWaitTime,
+      'computeTime'  : self.computeTime,
+      'saves'        : self.saves,
+      'savedBytes'   : self.savedBytes,
+      'load'         : self.load.snapshot(),
+      'save'         : self.save.snapshot(),
+    }
+
+
+class Registry(object):
+  '''Registry of ``Metrics`` of cached callables by name. Usage::
+
+    cache = hermes.Hermes(hermes.backend.redis.Backend, metrics = True)
+
+    cache.metrics.collect()     # pull API, dictionary of name to metrics dictionary
+    cache.metrics.prometheus()  # Prometheus text exposition format
+  '''
+
+  prefix = 'hermes'
+  '''Prefix of exported metric names'''
+
+  _counters = (
+    ('hits',         'hits_total',               'Cache hits'),
+    ('misses',       'misses_total',             'Cache misses, computations of the callable'),
+    ('lockWaits',    'lock_waits_total',         'Entry lock acquisitions on miss'),
+    ('lockWaitTime', 'lock_wait_seconds_total',  'Seconds spent waiting for entry locks'),
+    ('computeTime',  'compute_seconds_total',    'Seconds spent in the callable'),
+    ('saves',        'saves_total',              'Saved entries'),
+    ('savedBytes',   'saved_bytes_total',        'Serialised size of saved entries'),
+  )
+  '''Tuple of ``(attribute, metric name, help)`` of exported counters'''
+
+  _histograms = (
+    ('load', 'load_seconds', 'Backend load latency'),
+    ('save', 'save_seconds', 'Backend save latency'),
+  )
+  '''Tuple of ``(attribute, metric name, help)`` of exported histograms'''
+
+  _metrics = None
+  '''Dictionary of name to ``Metrics``'''
+
+  _lock = None
+  '''Lock guarding metrics creation'''
+
+
+  def __init__(self, prefix = None):
+    self.prefix   = prefix or self.prefix
+    self._metrics = {}
+    self._lock    = threading.Lock()
+
+  def get(self, name):
+    '''Return metrics of given name, creating them on first use'''
+
+    try:
+      return self._metrics[name]
+    except KeyError:
+      with self._lock:
+        return self._metrics.setdefault(name, Metrics())
+
+  def collect(self):
+    '''Return dictionary of name to dictionary of metrics, see ``Metrics.snapshot``'''
+
+    return {name : metrics.snapshot() for name, metrics in list(self._metrics.items())}
+
+  def prometheus(self):
+    '''Return metrics in Prometheus text exposition format. Cached callable name is the
+    ``function`` label.'''
+
+    collected = sorted(self.collect().items())
+    lines     = []
+    for attr, name, help in self._counters:
+      name = '{0}_{1}'.format(self.prefix, name)
+      lines.append('# HELP {0} {1}'.format(name, help))
+      lines.append('# TYPE {0} counter'.format(name))
+      for function, snapshot in collected:
+        lines.append('{0}{{function="{1}"}} {2!r}'.format(
+          name, self._escape(function), snapshot[attr]))
+
+    for attr, name, help in self._histograms:
+      name = '{0}_{1}'.format(self.prefix, name)
+      lines.append('# HELP {0} {1}'.format(name, help))
+      lines.append('# TYPE {0} histogram'.format(name))
+      for function, snapshot in collected:
+        label     = self._escape(function)
+        histogram = snapshot[attr]
+        for bound, count in histogram['buckets']:
+          bound = '+Inf' if bound == float('inf') else repr(bound)
+          lines.append('{0}_bucket{{function="{1}",le="{2}"}} {3}'.format(
+            name, label, bound, count))
+        lines.append('{0}_sum{{function="{1}"}} {2!r}'.format(name, label, histogram['sum']))
+        lines.append('{0}_count{{function="{1}"}} {2}'.format(name, label, histogram['count']))
+
+    return '\n'.join(lines) + '\n'
+
+  @staticmethod
+  def _escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
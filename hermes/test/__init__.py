@@ -1,14 +1,8 @@
-import hashlib
-import random
 import socket
 import unittest
-import datetime
 import threading
 
-try:
-  import cPickle as pickle
-except ImportError:
-  import pickle
+import hermes
 
 
 class TestCase(unittest.TestCase):
@@ -22,11 +16,11 @@ class TestCase(unittest.TestCase):
 
   def _arghash(self, *args, **kwargs):
     '''Not very neat as it penetrates into an implementation detail, though otherwise it'll be
-    harder to make assertion on keys, because pickled results are different on py2 and py3'''
+    harder to make assertion on keys, because pickled results are different on py2 and py3.
+    Argument encoding is covered by ``hermes.test.abstract.TestMangler``.'''
 
-    arguments = args, tuple(sorted(kwargs.items()))
-    return hashlib.md5(
-      pickle.dumps(arguments, protocol = pickle.HIGHEST_PROTOCOL)).hexdigest()[::2]
+    mangler = hermes.Mangler()
+    return mangler.hash(mangler.packArguments(args, kwargs))
 
 
 def createFixture(cache):
@@ -73,28 +67,6 @@ def createFixture(cache):
   return Fixture()
 
 
-def benchmark(fixture):
-  try:
-    # Python 2
-    xrange = xrange  # @UndefinedVariable
-  except NameError:
-    # Python 3
-    xrange = range
-
-  args   = [(random.randint(0, 4096), random.randint(0, 4096)) for _ in xrange(1024)]
-  repeat = 8192
-  for method in ('simple', 'tagged'):
-    print(
-      '\n{0} {1} {2} '.format('-' * 10, fixture.simple._backend.__module__, method).ljust(50, '-'))
-    start = datetime.datetime.now()
-    for _ in xrange(repeat):
-      getattr(fixture, method)(*random.choice(args))
-    delta = datetime.datetime.now() - start
-    print('  repeated:    {0:,}'.format(repeat))
-    print('  time:        {0}'.format(delta))
-    print('  call/second: {0:,.0f}'.format(repeat / delta.total_seconds()))
-
-
 class FakeBackendServer:
 
   port = None
@@ -1,4 +1,10 @@
+import sys
+import time
+import pickle
+import marshal
+
 from .. import test
+from . import benchmark
 import hermes.backend.dict
 
 
@@ -142,6 +148,80 @@ class TestAbstractLock(test.TestCase):
       self.assertTrue(self.testee.acquire(False))
 
 
+class TestPollingLock(test.TestCase):
+
+  class Lock(hermes.backend.PollingLock):
+
+    free = False
+
+    def __init__(self, key, **kwargs):
+      super(TestPollingLock.Lock, self).__init__(key, **kwargs)
+      self.pauses = []
+
+    def _tryAcquire(self):
+      return self.free
+
+    def _pause(self, timeout):
+      self.pauses.append(round(timeout, 3))
+      if len(self.pauses) == 5:
+        self.free = True
+
+  def testBackoff(self):
+    testee = self.Lock('123', lockMinSleep = 0.01, lockSleep = 0.05)
+    self.assertFalse(testee.acquire(False))
+    self.assertEqual([], testee.pauses)
+
+    self.assertTrue(testee.acquire(True))
+    self.assertEqual([0.01, 0.02, 0.04, 0.05, 0.05], testee.pauses)
+
+  def testWait(self):
+    testee = hermes.backend.PollingLock('123', lockWait = 0.1)
+    testee._tryAcquire = lambda: False
+
+    start = time.time()
+    self.assertFalse(testee.acquire(True))
+    self.assertTrue(0.1 <= time.time() - start < 0.3)
+
+
+class TestRenewer(test.TestCase):
+
+  class Lock(object):
+
+    key   = '123'
+    renew = 0.02
+
+    def __init__(self):
+      self.extends = 0
+
+    def extend(self):
+      self.extends += 1
+      return True
+
+  def testRenew(self):
+    testee = hermes.backend.Renewer()
+    lock   = self.Lock()
+    testee.add(lock)
+    time.sleep(0.1)
+    testee.remove(lock)
+    self.assertGreaterEqual(lock.extends, 2)
+
+    extends = lock.extends
+    time.sleep(0.05)
+    self.assertEqual(extends, lock.extends)
+    testee.stop()
+
+  def testStop(self):
+    testee = hermes.backend.Renewer()
+    lock   = self.Lock()
+    lock.renew = 60
+    testee.add(lock)
+
+    # the worker waiting with timeout exits, and doesn't run on interpreter shutdown
+    testee.stop()
+    self.assertFalse(testee._thread.is_alive())
+    self.assertEqual(0, lock.extends)
+
+
 class TestAbstractPerformance(test.unittest.TestCase):
 
   def setUp(self):
@@ -152,7 +232,7 @@ class TestAbstractPerformance(test.unittest.TestCase):
     self.testee.clean()
 
   def testPerformance(self):
-    test.benchmark(self.fixture)
+    benchmark.report(benchmark.run(self.testee, number = 1024, warmup = 128))
 
 
 class TestWrapping(test.TestCase):
@@ -205,6 +285,33 @@ class TestWrapping(test.TestCase):
     self.assertEqual(12, f1.foo())
     self.assertEqual(24, f2.foo())
 
+  def testBoundWrapper(self):
+    testee = hermes.Hermes()
+
+    class Fixture(object):
+
+      @testee(tags = ('a',))
+      def foo(self):
+        return 'foo'
+
+    class Subfixture(Fixture):
+      pass
+
+    unbound = Fixture.__dict__['foo']
+    bound   = Fixture().foo
+    self.assertIsInstance(bound, type(unbound))
+    self.assertIs(unbound.__dict__, bound.__dict__)
+    self.assertEqual(('a',), bound._tags)
+    self.assertEqual('foo', bound.__name__)
+
+    prefix = 'cache:entry:hermes.test.abstract:{0}:foo:'
+    self.assertEqual(prefix.format('Fixture'), bound._prefix)
+    self.assertEqual(prefix.format('Subfixture'), Subfixture().foo._prefix)
+    self.assertEqual(prefix.format('Fixture'), Fixture().foo._prefix)
+
+    self.assertEqual('foo', bound())
+    self.assertIs(type(bound), type(Subfixture().foo))
+
   def testMethodDescriptor(self):
 
     class Fixture(object):
@@ -290,3 +397,142 @@ class TestWrapping(test.TestCase):
       'Fn is callable but its name is undefined, consider overriding Mangler.nameEntry',
       str(ctx.exception))
 
+
+
+class TestMangler(test.TestCase):
+
+  def setUp(self):
+    self.testee = hermes.Mangler()
+
+  def testPackArguments(self):
+    self.assertEqual(
+      marshal.dumps((('alpha', 2), (('b', None),)), 0),
+      self.testee.packArguments(('alpha', 2), {'b' : None}))
+    self.assertEqual(
+      marshal.dumps(((), ()), 0), self.testee.packArguments((), {}))
+
+    # string interning doesn't affect encoding
+    self.assertEqual(
+      self.testee.packArguments(('alpha',), {}),
+      self.testee.packArguments((''.join(['al', 'pha']),), {}))
+
+    if sys.version_info >= (3,):
+      values = 1, 1.0, True, '1', b'1', None
+    else:
+      # ``str`` is ``bytes``
+      values = 1, 1.0, True, '1', u'1', None
+    packed = [self.testee.packArguments((v,), {}) for v in values]
+    self.assertEqual(6, len(set(packed)))
+
+    self.assertEqual(
+      self.testee.packArguments((1,), {'b' : 2, 'a' : 3}),
+      self.testee.packArguments((1,), {'a' : 3, 'b' : 2}))
+
+  def testPackArgumentsFallback(self):
+    for args, kwargs, expected in [
+      (([1, 2],), {}, (([1, 2],), ())),
+      ((1,), {'b' : {'c' : 3}}, ((1,), (('b', {'c' : 3}),)))
+    ]:
+      packed = self.testee.packArguments(args, kwargs)
+      if sys.version_info >= (3,):
+        self.assertEqual(pickle.dumps(expected, protocol = pickle.HIGHEST_PROTOCOL), packed)
+      else:
+        # the mangler uses ``cPickle``, whose output differs from ``pickle``
+        self.assertEqual(expected, pickle.loads(packed))
+
+  def testPackArgumentsOverriddenDumps(self):
+    class Mangler(hermes.Mangler):
+
+      def dumps(self, value):
+        return repr(value).encode('ascii')
+
+    testee = Mangler()
+    for _ in range(2):
+      self.assertEqual(b"(('a', 1), ())", testee.packArguments(('a', 1), {}))
+      self.assertEqual(b"(([1],), ())", testee.packArguments(([1],), {}))
+
+  def testNameEntry(self):
+
+    class Fixture(object):
+
+      def foo(self, a):
+        pass
+
+    class Subfixture(Fixture):
+      pass
+
+    def foo(a):
+      pass
+
+    argHash = self._arghash(1)
+    for _ in range(2):
+      self.assertEqual(
+        'cache:entry:hermes.test.abstract:Fixture:foo:' + argHash,
+        self.testee.nameEntry(Fixture().foo, 1))
+      self.assertEqual(
+        'cache:entry:hermes.test.abstract:Subfixture:foo:' + argHash,
+        self.testee.nameEntry(Subfixture().foo, 1))
+      self.assertEqual(
+        'cache:entry:hermes.test.abstract:foo:' + argHash, self.testee.nameEntry(foo, 1))
+
+    self.assertEqual(16, len(argHash))
+
+  def testHashArgumentsMemo(self):
+    self.testee.memoSize = 4
+
+    hashes = [self.testee.hashArguments((v,), {}) for v in (1, True, 1.0, '1', 1)]
+    self.assertEqual(hashes[0], hashes[-1])
+    self.assertEqual(4, len(set(hashes)))
+    self.assertEqual(3, len(self.testee._hashes), 'float is not memoised')
+
+    self.testee.hashArguments(('a',), {})
+    self.testee.hashArguments(('b',), {})
+    self.assertEqual(1, len(self.testee._hashes), 'Memo is reset on overflow')
+
+    for args in [(1, 2), ([1], 2), (1, 2)]:
+      self.assertEqual(
+        self.testee.hash(self.testee.packArguments(args, {})),
+        self.testee.hashArguments(args, {}))
+
+  def testNamePrefixMemo(self):
+    self.testee.memoSize = 2
+
+    functions = []
+    for name in 'abc':
+      fn = lambda a: a
+      fn.__name__ = name
+      functions.append(fn)
+
+    for fn in functions[:2]:
+      self.testee.nameEntry(fn, 1)
+    self.assertEqual(2, len(self.testee._prefixes))
+
+    self.assertEqual('cache:entry:hermes.test.abstract:c:', self.testee._namePrefix(functions[2]))
+    self.assertEqual(1, len(self.testee._prefixes), 'Memo is reset on overflow')
+
+  def testCachedPrefix(self):
+    testee = hermes.Hermes()
+
+    @testee
+    def foo(a):
+      return a
+
+    @testee(key = lambda fn, a: 'foo:{0}'.format(a))
+    def bar(a):
+      return a
+
+    class Mangler(hermes.Mangler):
+
+      def nameEntry(self, fn, *args, **kwargs):
+        return 'baz'
+
+    @hermes.Hermes(manglerClass = Mangler)
+    def baz(a):
+      return a
+
+    self.assertEqual('cache:entry:hermes.test.abstract:foo:', foo._prefix)
+    self.assertEqual(self.testee.nameEntry(foo._callable, 1), foo._key((1,), {}))
+    self.assertIsNone(bar._prefix)
+    self.assertEqual('foo:1', bar._key((1,), {}))
+    self.assertIsNone(baz._prefix)
+    self.assertEqual('baz', baz._key((1,), {}))
@@ -0,0 +1,445 @@
+import time
+import pickle
+import asyncio
+
+from .. import test, Hermes, aio
+from ..backend import aioredis
+import hermes.backend.dict
+
+
+def createFixture(cache):
+
+  class Fixture(object):
+
+    calls = 0
+
+
+    @cache
+    async def simple(self, a, b):
+      '''Here be dragons... seriously just a docstring test'''
+
+      self.calls += 1
+      await asyncio.sleep(0)
+      return '{0}+{1}'.format(a, b)[::-1]
+
+    @cache(tags = ('rock', 'tree'))
+    async def tagged(self, a, b):
+      self.calls += 1
+      await asyncio.sleep(0.01)
+      return '{0}-{1}'.format(a, b)[::-2]
+
+    @cache
+    @staticmethod
+    async def static(a):
+      await asyncio.sleep(0)
+      return a * 2
+
+  return Fixture()
+
+
+class TestCoroDict(test.TestCase):
+
+  def setUp(self):
+    self.testee  = Hermes(hermes.backend.dict.Backend, ttl = 360)
+    self.fixture = createFixture(self.testee)
+    self.loop    = asyncio.new_event_loop()
+
+    self.testee.clean()
+
+  def tearDown(self):
+    self.loop.close()
+
+  def await_(self, coro):
+    return self.loop.run_until_complete(coro)
+
+  def testWrapping(self):
+    self.assertTrue(isinstance(self.fixture.simple, aio.CachedCoro))
+    self.assertEqual('simple', self.fixture.simple.__name__)
+    self.assertEqual(
+      'Here be dragons... seriously just a docstring test', self.fixture.simple.__doc__)
+
+    @self.testee
+    def sync(a):
+      return a
+
+    self.assertFalse(isinstance(sync, aio.CachedCoro))
+    self.assertEqual(1, sync(1))
+
+  def testSimple(self):
+    key = 'cache:entry:hermes.test.aio:Fixture:simple:' + self._arghash('alpha', 'beta')
+    for _ in range(4):
+      self.assertEqual('ateb+ahpla', self.await_(self.fixture.simple('alpha', 'beta')))
+      self.assertEqual(1, self.fixture.calls)
+      self.assertEqual({key : 'ateb+ahpla'}, self.testee.backend.dump())
+
+    self.await_(self.fixture.simple.invalidate('alpha', 'beta'))
+    self.assertEqual({}, self.testee.backend.dump())
+
+    self.assertEqual('ateb+ahpla', self.await_(self.fixture.simple('alpha', 'beta')))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testTagged(self):
+    for _ in range(4):
+      self.assertEqual('ae-hl', self.await_(self.fixture.tagged('alpha', 'beta')))
+      self.assertEqual(1, self.fixture.calls)
+      self.assertEqual(3, len(self.testee.backend.dump()))
+
+    self.testee.clean(['rock'])
+
+    self.assertEqual('ae-hl', self.await_(self.fixture.tagged('alpha', 'beta')))
+    self.assertEqual(2, self.fixture.calls)
+
+    self.await_(self.fixture.tagged.invalidate('alpha', 'beta'))
+    self.assertEqual(3, len(self.testee.backend.dump()), '2 tags and old entry')
+
+  def testMethodDescriptor(self):
+    self.assertEqual(4, self.await_(self.fixture.static(2)))
+    self.assertEqual(4, self.await_(self.fixture.static(2)))
+
+  def testConcurrent(self):
+    async def target():
+      return await asyncio.gather(*[self.fixture.simple('alpha', 'beta') for _ in range(8)])
+
+    result = self.await_(target())
+    self.assertEqual(['ateb+ahpla'] * 8, result)
+
+  def testBatch(self):
+    arguments = [('alpha', 'beta'), ('gamma', 'delta'), ('alpha', 'beta')]
+    self.assertEqual(['ateb+ahpla', 'atled+ammag', 'ateb+ahpla'],
+      self.await_(self.fixture.simple.batch(arguments)))
+    self.assertEqual(2, self.fixture.calls)
+    self.assertEqual(2, len(self.testee.backend.dump()))
+
+    self.assertEqual('atled+ammag', self.await_(self.fixture.simple('gamma', 'delta')))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testSoftTtl(self):
+    calls = []
+
+    @self.testee(softTtl = 0.2)
+    async def foo(a):
+      calls.append(a)
+      await asyncio.sleep(0)
+      return a * len(calls)
+
+    async def target():
+      self.assertEqual(2, await foo(2))
+      self.assertEqual(2, await foo(2))
+      self.assertEqual([2], calls)
+
+      await asyncio.sleep(0.25)
+
+      # stale value is returned immediately, the entry is refreshed in a task
+      self.assertEqual(2, await foo(2))
+      self.assertEqual(2, await foo(2))
+      await asyncio.gather(*foo._refreshes.values())
+      self.assertEqual([2, 2], calls)
+      self.assertEqual(4, await foo(2))
+
+    self.await_(target())
+    self.assertEqual({}, foo._refreshes)
+
+  def testLayered(self):
+    for kwargs in ({'localTtl' : 5}, {'tagTtl' : 5}):
+      with self.assertRaises(ValueError) as ctx:
+        Hermes(aioredis.Backend, **kwargs)
+      self.assertEqual(
+        'localTtl and tagTtl are not supported for asynchronous backend', str(ctx.exception))
+
+    # synchronous backend is layered for coroutine functions as well
+    testee = Hermes(hermes.backend.dict.Backend, localTtl = 5)
+
+    @testee
+    async def foo(a):
+      return a * 2
+
+    self.assertEqual(4, self.await_(foo(2)))
+    self.assertEqual(4, self.await_(foo(2)))
+
+  def testCacheNoneAndErrors(self):
+    calls = []
+
+    @self.testee(cacheNone = True, errorTtl = 30, errors = (KeyError,))
+    async def foo(a):
+      calls.append(a)
+      await asyncio.sleep(0)
+      if a:
+        raise KeyError(a)
+
+    for _ in range(2):
+      self.assertIsNone(self.await_(foo(0)))
+      self.assertRaises(KeyError, self.await_, foo(1))
+      self.assertEqual([0, 1], calls)
+
+    self.assertEqual([None], self.await_(foo.batch([(0,)])))
+    self.assertEqual([0, 1], calls)
+
+    # a sentinel saved with other options isn't returned as a result
+    plain = self.testee(foo.__wrapped__)
+    self.assertIsNone(self.await_(plain(0)))
+    self.assertRaises(KeyError, self.await_, plain(1))
+    self.assertEqual([0, 1], calls)
+
+    @self.testee(errorTtl = 30)
+    async def bar(a):
+      calls.append(a)
+      raise TypeError(lambda: a)
+
+    # the exception can't be pickled, its save failure doesn't replace it
+    del calls[:]
+    for i in range(1, 3):
+      self.assertRaises(TypeError, self.await_, bar(1))
+      self.assertEqual(i, len(calls))
+
+  def testWriteBehind(self):
+    calls = []
+
+    @self.testee(writeBehind = True)
+    async def foo(a):
+      calls.append(a)
+      await asyncio.sleep(0)
+      return a * 2
+
+    saves = []
+    save  = self.testee.backend.save
+    def recordingSave(key = None, value = None, mapping = None, ttl = None):
+      saves.append(sorted(mapping))
+      return save(key, value, mapping, ttl)
+    self.testee.backend.save = recordingSave
+
+    async def target():
+      # the entry is saved by the worker task
+      self.assertEqual(4, await foo(2))
+      self.assertEqual({}, self.testee.backend.dump())
+      await self.testee.aioWriter.flush()
+
+      self.assertEqual(1, len(self.testee.backend.dump()))
+      self.assertEqual(4, await foo(2))
+      self.assertEqual([2], calls)
+
+      # saves queued on one iteration of the loop are coalesced
+      self.assertEqual([6, 8, 10], await asyncio.gather(foo(3), foo(4), foo(5)))
+      await self.testee.aioWriter.flush()
+      self.assertEqual(4, len(self.testee.backend.dump()))
+      self.assertEqual([1, 3], [len(keys) for keys in saves])
+
+    self.assertIs(self.testee.aioWriter, foo._writer)
+    self.await_(target())
+
+  def testWriteBehindFullQueue(self):
+    writer = aio.Writer(maxsize = 1)
+
+    @self.testee(writeBehind = True, aioWriter = writer)
+    async def foo(a):
+      await asyncio.sleep(0)
+      return a * 2
+
+    async def target():
+      self.assertTrue(writer.submit(foo, 'a', 1, None, None))
+      self.assertFalse(writer.submit(foo, 'b', 2, None, None))
+      await writer.flush()
+      self.assertEqual({'a' : 1}, self.testee.backend.dump())
+
+      # the caller saves the entry which doesn't fit in the queue
+      self.assertEqual([2, 4], await asyncio.gather(foo(1), foo(2)))
+      await writer.flush()
+      self.assertEqual(3, len(self.testee.backend.dump()))
+
+    self.await_(target())
+
+    # the queue of another event loop is independent
+    loop = asyncio.new_event_loop()
+    try:
+      self.assertEqual(6, loop.run_until_complete(foo(3)))
+      loop.run_until_complete(writer.flush())
+    finally:
+      loop.close()
+    self.assertEqual(4, len(self.testee.backend.dump()))
+
+  def testSingleFlight(self):
+    calls = []
+
+    @self.testee(singleFlight = True, lock = False)
+    async def foo(a):
+      calls.append(a)
+      await asyncio.sleep(0.01)
+      return [a]
+
+    async def target():
+      return await asyncio.gather(*[foo(2) for _ in range(8)])
+
+    results = self.await_(target())
+    self.assertEqual([2], calls)
+    self.assertEqual([[2]] * 8, results)
+    self.assertTrue(all(r is results[0] for r in results))
+    self.assertEqual({}, foo._flights)
+
+    self.assertEqual([2], self.await_(foo(2)))
+    self.assertEqual([2], calls)
+
+  def testMetrics(self):
+    testee = Hermes(hermes.backend.dict.Backend, metrics = True)
+
+    @testee
+    async def foo(a):
+      return a * 2
+
+    for _ in range(3):
+      self.assertEqual(4, self.await_(foo(2)))
+    self.assertEqual([4, 6], self.await_(foo.batch([(2,), (3,)])))
+
+    snapshot = testee.metrics.collect()['hermes.test.aio.TestCoroDict.testMetrics.foo']
+    self.assertEqual(3, snapshot['hits'])
+    self.assertEqual(2, snapshot['misses'])
+    self.assertEqual(1, snapshot['lockWaits'])
+    self.assertEqual(2, snapshot['saves'])
+    self.assertEqual(5, snapshot['load']['count'])
+    self.assertEqual(2, snapshot['save']['count'])
+
+  def testEarlyRecomputation(self):
+    calls = []
+
+    @self.testee(beta = 1e9, jitter = 0.5)
+    async def foo(a):
+      calls.append(a)
+      await asyncio.sleep(0.01)
+      return a * len(calls)
+
+    self.assertEqual(2, self.await_(foo(2)))
+    self.assertEqual(4, self.await_(foo(2)))
+    self.assertEqual([6, 12], self.await_(foo.batch([(2,), (3,)])))
+    self.assertEqual(4, len(calls))
+
+    value, expireAt, delta = self.testee.backend.dump()[foo._key((3,), {})]
+    self.assertEqual(12, value)
+    self.assertTrue(time.time() + 179 <= expireAt <= time.time() + 360)
+
+  def testEarlyRecomputationSwitch(self):
+    async def foo(a):
+      return [a]
+
+    # the callable's entries are saved with and without envelope, e.g. during a deployment
+    plain = self.testee(foo)
+    eager = self.testee(beta = 1)(foo)
+    for _ in range(2):
+      self.assertEqual([1], self.await_(plain(1)))
+      self.assertEqual([1], self.await_(eager(1)))
+      self.assertEqual([[1]], self.await_(plain.batch([(1,)])))
+      self.assertEqual([[1]], self.await_(eager.batch([(1,)])))
+
+    dump = self.testee.backend.dump()
+    self.assertEqual([1], dump[plain._key((1,), {})])
+    self.assertEqual([1], dump[eager._key((1,), {})][0])
+
+
+class TestCoroRedis(test.TestCase):
+
+  def setUp(self):
+    self.testee  = Hermes(aioredis.Backend, ttl = 360, lockTimeout = 120)
+    self.fixture = createFixture(self.testee)
+    self.loop    = asyncio.new_event_loop()
+
+    self.await_(self.testee.clean())
+
+  def tearDown(self):
+    self.await_(self.testee.clean())
+    self.await_(aioredis._close(self.testee.backend.client))
+    self.loop.close()
+
+  def await_(self, coro):
+    return self.loop.run_until_complete(coro)
+
+  def testSimple(self):
+    key    = 'cache:entry:hermes.test.aio:Fixture:simple:' + self._arghash('alpha', 'beta')
+    client = self.testee.backend.client
+    for _ in range(4):
+      self.assertEqual('ateb+ahpla', self.await_(self.fixture.simple('alpha', 'beta')))
+      self.assertEqual(1, self.fixture.calls)
+      self.assertEqual(1, self.await_(client.dbsize()))
+
+      self.assertEqual(360, self.await_(client.ttl(key)))
+      self.assertEqual('ateb+ahpla', pickle.loads(self.await_(client.get(key))))
+
+    self.await_(self.fixture.simple.invalidate('alpha', 'beta'))
+    self.assertEqual(0, self.await_(client.dbsize()))
+
+  def testTagged(self):
+    client = self.testee.backend.client
+    for _ in range(4):
+      self.assertEqual('ae-hl', self.await_(self.fixture.tagged('alpha', 'beta')))
+      self.assertEqual(1, self.fixture.calls)
+      self.assertEqual(3, self.await_(client.dbsize()))
+
+    self.await_(self.testee.clean(['rock']))
+    self.assertEqual(2, self.await_(client.dbsize()))
+
+    self.assertEqual('ae-hl', self.await_(self.fixture.tagged('alpha', 'beta')))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testConcurrent(self):
+    async def target():
+      return await asyncio.gather(*[self.fixture.tagged('alpha', 'beta') for _ in range(8)])
+
+    result = self.await_(target())
+    self.assertEqual(['ae-hl'] * 8, result)
+    self.assertEqual(1, self.fixture.calls)
+
+  def testBatch(self):
+    client = self.testee.backend.client
+    result = self.await_(self.fixture.tagged.batch([('alpha', 'beta'), ('gamma', 'delta')]))
+    self.assertEqual(['ae-hl', 'aldamg'], result)
+    self.assertEqual(2, self.fixture.calls)
+    self.assertEqual(4, self.await_(client.dbsize()))
+
+    self.assertEqual('aldamg', self.await_(self.fixture.tagged('gamma', 'delta')))
+    self.assertEqual(2, self.fixture.calls)
+
+
+class TestCoroRedisLock(test.TestCase):
+
+  def setUp(self):
+    self.loop   = asyncio.new_event_loop()
+    self.cache  = Hermes(aioredis.Backend)
+    self.testee = aioredis.Lock('123', self.cache.backend.client)
+
+    self.await_(self.cache.clean())
+
+  def tearDown(self):
+    self.await_(aioredis._close(self.cache.backend.client))
+    self.loop.close()
+
+  def await_(self, coro):
+    return self.loop.run_until_complete(coro)
+
+  def testAcquire(self):
+    for _ in range(2):
+      try:
+        self.assertTrue(self.await_(self.testee.acquire(True)))
+        self.assertFalse(self.await_(self.testee.acquire(False)))
+        self.assertEqual(30, self.await_(self.testee.client.ttl(self.testee.key)))
+      finally:
+        self.await_(self.testee.release())
+        self.assertIsNone(self.await_(self.testee.client.get(self.testee.key)))
+
+  def testWith(self):
+
+    async def target():
+      async with self.testee:
+        self.assertFalse(await self.testee.acquire(False))
+
+    self.await_(target())
+    self.assertIsNone(self.await_(self.testee.client.get(self.testee.key)))
+
+  def testRenewal(self):
+    testee = aioredis.Lock('123', self.cache.backend.client, lockTimeout = 1, lockRenew = 0.1)
+    client = self.cache.backend.client
+
+    async def target():
+      async with testee:
+        await client.pexpire('123', 200)
+        await asyncio.sleep(0.35)
+        self.assertEqual(1, await client.ttl('123'))
+      self.assertIsNone(testee._renewal)
+
+    self.await_(target())
+    self.assertIsNone(self.await_(client.get('123')))
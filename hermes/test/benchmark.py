@@ -0,0 +1,326 @@
+'''Benchmark suite of hit, miss, tagged and batched calls, key derivation, value codecs and
+lock contention. Usage::
+
+  python -m hermes.test.benchmark --backend dict redis memcached --json result.json
+
+``redis`` and ``memcached`` expect local servers on default ports, and their databases are
+flushed. Each scenario is warmed up and then timed per operation. Latency percentiles are
+reported in microseconds, and with ``--json`` the results are written in machine-readable
+form, so they can be compared across releases. Arguments are generated from a fixed seed,
+so runs are reproducible.'''
+
+import sys
+import json
+import math
+import time
+import timeit
+import random
+import argparse
+import platform
+import functools
+import itertools
+import threading
+
+import hermes
+import hermes.codec
+import hermes.backend.dict
+from hermes.metrics import timer
+
+
+__all__ = 'backends', 'scenarios', 'measure', 'summarise', 'run', 'report', 'overhead'
+
+
+def createDict():
+  return hermes.Hermes(hermes.backend.dict.Backend, ttl = 360)
+
+def createLayered():
+  return hermes.Hermes(hermes.backend.dict.Backend, ttl = 360, localTtl = 60)
+
+def createRedis():
+  import hermes.backend.redis
+  return hermes.Hermes(hermes.backend.redis.Backend, ttl = 360)
+
+def createMemcached():
+  import hermes.backend.memcached
+  return hermes.Hermes(hermes.backend.memcached.Backend, ttl = 360)
+
+def createMmap():
+  import hermes.backend.mmap
+  return hermes.Hermes(hermes.backend.mmap.Backend, ttl = 360)
+
+def createSqlite():
+  import hermes.backend.sqlite
+  return hermes.Hermes(hermes.backend.sqlite.Backend, ttl = 360)
+
+backends = {
+  'abstract'  : lambda: hermes.Hermes(hermes.backend.AbstractBackend, ttl = 360),
+  'dict'      : createDict,
+  'layered'   : createLayered,
+  'redis'     : createRedis,
+  'memcached' : createMemcached,
+  'mmap'      : createMmap,
+  'sqlite'    : createSqlite,
+}
+'''Dictionary of backend name to factory of ``Hermes`` instance'''
+
+
+def percentile(values, p):
+  '''Return nearest-rank percentile of sorted values'''
+
+  return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+def summarise(timings):
+  '''Return dictionary of statistics of the list of operation durations in seconds.
+  Latencies are in microseconds.'''
+
+  timings = sorted(timings)
+  total   = sum(timings)
+  us      = lambda v: round(v * 1e6, 3)
+  return {
+    'number' : len(timings),
+    'ops'    : round(len(timings) / total, 1) if total else None,
+    'mean'   : us(total / len(timings)),
+    'min'    : us(timings[0]),
+    'p50'    : us(percentile(timings, 50)),
+    'p90'    : us(percentile(timings, 90)),
+    'p99'    : us(percentile(timings, 99)),
+    'max'    : us(timings[-1]),
+  }
+
+def measure(fn, number, warmup):
+  '''Call the function ``warmup`` times, then time ``number`` calls and summarise them'''
+
+  for _ in range(warmup):
+    fn()
+
+  timings = []
+  for _ in range(number):
+    start = timer()
+    fn()
+    timings.append(timer() - start)
+  return summarise(timings)
+
+
+def add(a, b):
+  return a + b
+
+def scenarioHit(cache, rnd, number, warmup):
+  cached = cache(add)
+  args   = [(rnd.randint(0, 4096), rnd.randint(0, 4096)) for _ in range(64)]
+  for a in args:
+    cached(*a)
+  return measure(lambda: cached(*rnd.choice(args)), number, warmup)
+
+def scenarioMiss(cache, rnd, number, warmup):
+  cached  = cache(add)
+  counter = itertools.count()
+  return measure(lambda: cached(next(counter), 0), number, warmup)
+
+def scenarioTaggedHit(cache, rnd, number, warmup):
+  cached = cache(tags = ('rock', 'tree'))(add)
+  args   = [(rnd.randint(0, 4096), rnd.randint(0, 4096)) for _ in range(64)]
+  for a in args:
+    cached(*a)
+  return measure(lambda: cached(*rnd.choice(args)), number, warmup)
+
+def scenarioTaggedMiss(cache, rnd, number, warmup):
+  cached  = cache(tags = ('rock', 'tree'))(add)
+  counter = itertools.count()
+  return measure(lambda: cached(next(counter), 0), number, warmup)
+
+def scenarioBatch(cache, rnd, number, warmup, size = 64):
+  '''Batch of ``size`` argument tuples of which a half is cached'''
+
+  cached  = cache(add)
+  counter = itertools.count()
+  def fn():
+    base = next(counter) * size
+    cached.batch([(base + i, 0) for i in range(0, size, 2)])
+    cached.batch([(base + i, 0) for i in range(size)])
+
+  result = measure(fn, number // size or 1, warmup // size)
+  result['size'] = size
+  return result
+
+def scenarioKey(cache, rnd, number, warmup):
+  '''Entry key derivation of mixed primitive and container arguments'''
+
+  cached = cache(add)
+  args   = [
+    ((rnd.randint(0, 4096), 'alpha'), {}),
+    ((rnd.random(), None), {'b' : True}),
+    (({'alpha' : [1, 2]}, (3, 4)), {}),
+  ]
+  return measure(lambda: cached._key(*rnd.choice(args)), number, warmup)
+
+def scenarioCodec(cache, rnd, number, warmup):
+  '''Encoding and decoding of a typical value by each available codec'''
+
+  value  = {'id' : 42, 'name' : 'alpha', 'tags' : ['a', 'b', 'c'], 'score' : 0.5}
+  result = {}
+  for name in sorted(hermes.codec._registry):
+    codec = hermes.codec.get(name)
+    result[name] = measure(lambda: hermes.codec.decode(codec.encode(value)), number, warmup)
+    result[name]['size'] = len(codec.encode(value))
+  return result
+
+def scenarioContention(cache, rnd, number, warmup, threads = 8, delay = 0.001):
+  '''Concurrent calls of ``threads`` threads missing the same entry, which takes ``delay``
+  seconds to compute. One thread computes it, the others wait for its lock.'''
+
+  @cache
+  def slow(a):
+    time.sleep(delay)
+    return a
+
+  counter = itertools.count()
+  def race():
+    key   = next(counter)
+    start = threading.Event()
+    times = []
+    def target():
+      start.wait()
+      begin = timer()
+      slow(key)
+      times.append(timer() - begin)
+
+    workers = [threading.Thread(target = target) for _ in range(threads)]
+    for w in workers:
+      w.start()
+    start.set()
+    for w in workers:
+      w.join()
+    return times
+
+  for _ in range(max(1, warmup // threads)):
+    race()
+  timings = []
+  for _ in range(max(1, number // threads)):
+    timings.extend(race())
+
+  result = summarise(timings)
+  result['threads'] = threads
+  return result
+
+scenarios = (
+  ('hit',         scenarioHit),
+  ('miss',        scenarioMiss),
+  ('tagged-hit',  scenarioTaggedHit),
+  ('tagged-miss', scenarioTaggedMiss),
+  ('batch',       scenarioBatch),
+  ('key',         scenarioKey),
+  ('codec',       scenarioCodec),
+  ('contention',  scenarioContention),
+)
+'''Tuple of ``(name, function)`` of benchmark scenarios. A function takes ``Hermes``
+instance, seeded ``random.Random``, number of operations and number of warm-up operations,
+and returns a summary or a dictionary of summaries.'''
+
+
+def run(cache, names = None, number = 4096, warmup = 512, seed = 42):
+  '''Run scenarios of given names, all by default, against the cache and return list of
+  result dictionaries. The cache is cleaned before each scenario.'''
+
+  results = []
+  for name, scenario in scenarios:
+    if names and name not in names:
+      continue
+
+    cache.clean()
+    result = scenario(cache, random.Random(seed), number, warmup)
+    if 'number' in result:
+      result = {None : result}
+    for variant, summary in sorted(result.items(), key = lambda item: str(item[0])):
+      summary = dict(summary, scenario = name, backend = cache.backend.__module__)
+      if variant:
+        summary['variant'] = variant
+      results.append(summary)
+  cache.clean()
+
+  return results
+
+def report(results, stream = None):
+  '''Print results as a table'''
+
+  stream  = stream or sys.stdout
+  columns = 'ops', 'mean', 'p50', 'p90', 'p99', 'max'
+  stream.write('\n{0:<28}{1:<14}'.format('backend', 'scenario'))
+  stream.write(''.join('{0:>12}'.format(c) for c in columns) + '\n')
+  for r in results:
+    name = r['scenario'] + (':' + r['variant'] if 'variant' in r else '')
+    stream.write('{0:<28}{1:<14}'.format(r['backend'], name))
+    stream.write(''.join('{0:>12,.1f}'.format(r[c] or 0) for c in columns) + '\n')
+
+def overhead(cache, number = 16384):
+  '''Micro-benchmark of per-call overhead of ``hermes.Cached`` on cache hit, which is the
+  difference between cached call and the decorated callable call plus direct backend load of
+  the entry. Timed in aggregate, unlike scenarios, because it's comparable to per-call timer
+  cost. Return dictionary of name to tuple of overhead and time of the direct call, which is
+  the baseline measured in the same run, in nanoseconds.'''
+
+  simple  = cache(add)
+  tagged  = cache(tags = ('rock', 'tree'))(add)
+  backend = cache.backend
+  result  = {}
+  for name, cached, load in (
+    ('simple', simple, backend.load),
+    ('tagged', tagged, functools.partial(backend.loadTagged, tagged._tagKeys))
+  ):
+    cached(1, 2)
+    key    = cached._key((1, 2), {})
+    direct = lambda: (add(1, 2), load(key))
+
+    directTime = min(timeit.repeat(direct, number = number, repeat = 5))
+    cachedTime = min(timeit.repeat(lambda: cached(1, 2), number = number, repeat = 5))
+    result[name] = (cachedTime - directTime) / number * 1e9, directTime / number * 1e9
+
+  return result
+
+
+def main(argv = None):
+  parser = argparse.ArgumentParser(description = __doc__.split('\n\n')[0])
+  parser.add_argument('--backend', nargs = '+', default = ['dict'], choices = sorted(backends))
+  parser.add_argument('--scenario', nargs = '+', choices = [n for n, _ in scenarios])
+  parser.add_argument('--number', type = int, default = 4096, help = 'operations per scenario')
+  parser.add_argument('--warmup', type = int, default = 512, help = 'warm-up operations')
+  parser.add_argument('--seed', type = int, default = 42)
+  parser.add_argument('--json', metavar = 'PATH', help = 'write results as JSON, - for stdout')
+  args = parser.parse_args(argv)
+
+  results = []
+  errors  = {}
+  for name in args.backend:
+    try:
+      results.extend(run(
+        backends[name](), args.scenario, args.number, args.warmup, args.seed))
+    except Exception as ex:
+      errors[name] = '{0}: {1}'.format(type(ex).__name__, ex)
+      sys.stderr.write('Backend {0} is skipped, {1}\n'.format(name, errors[name]))
+
+  if args.json != '-':
+    report(results)
+  if args.json:
+    document = {
+      'meta' : {
+        'time'           : time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python'         : platform.python_version(),
+        'implementation' : platform.python_implementation(),
+        'platform'       : platform.platform(),
+        'number'         : args.number,
+        'warmup'         : args.warmup,
+        'seed'           : args.seed,
+        'errors'         : errors,
+      },
+      'results' : results
+    }
+    if args.json == '-':
+      json.dump(document, sys.stdout, indent = 2, sort_keys = True)
+    else:
+      with open(args.json, 'w') as f:
+        json.dump(document, f, indent = 2, sort_keys = True)
+
+  return 1 if errors and not results else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
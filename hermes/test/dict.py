@@ -1,7 +1,13 @@
 import json
 import time
+import zlib
+import pickle
+import threading
+import unittest
 
 import hermes.test as test
+import hermes.test.benchmark as benchmark
+import hermes.codec
 import hermes.backend.dict
 
 
@@ -324,8 +330,361 @@ class TestDict(test.TestCase):
     }, self.testee.backend.dump())
 
 
+  def testBatch(self):
+    arguments = [('alpha', 'beta'), ('gamma', 'delta'), ('alpha', 'beta')]
+    self.assertEqual(
+      ['ateb+ahpla', 'atled+ammag', 'ateb+ahpla'], self.fixture.simple.batch(arguments))
+    self.assertEqual(2, self.fixture.calls)
+    self.assertEqual({
+      'cache:entry:hermes.test:Fixture:simple:' + self._arghash('alpha', 'beta')  : 'ateb+ahpla',
+      'cache:entry:hermes.test:Fixture:simple:' + self._arghash('gamma', 'delta') : 'atled+ammag'
+    }, self.testee.backend.dump())
+
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.assertEqual(
+      ['ateb+ahpla', 'ih+oe'], self.fixture.simple.batch([('alpha', 'beta'), ('eo', 'hi')], 2))
+    self.assertEqual(3, self.fixture.calls)
+
+    self.assertEqual(['ae-hl', 'aldamg'],
+      self.fixture.tagged.batch([('alpha', 'beta'), ('gamma', 'delta')]))
+    self.assertEqual(5, self.fixture.calls)
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(5, self.fixture.calls)
+
+    self.assertEqual([], self.fixture.simple.batch([]))
+
+  def testSoftTtl(self):
+    calls = []
+
+    @self.testee(softTtl = 0.2)
+    def foo(a):
+      calls.append(a)
+      return a * len(calls)
+
+    for _ in range(2):
+      self.assertEqual(2, foo(2))
+      self.assertEqual([2], calls)
+
+    value, staleAt, delta = tuple(self.testee.backend.dump().values())[0]
+    self.assertEqual(2, value)
+    self.assertAlmostEqual(time.time() + 0.2, staleAt, delta = 0.1)
+    self.assertGreaterEqual(delta, 0)
+
+    time.sleep(0.25)
+
+    # stale value is returned immediately, the entry is refreshed in background
+    self.assertEqual(2, foo(2))
+    self.testee.revalidator.join()
+    self.assertEqual([2, 2], calls)
+    self.assertEqual(4, foo(2))
+    self.assertEqual([2, 2], calls)
+
+    self.assertEqual([4, 9], foo.batch([(2,), (3,)]))
+    self.assertEqual([2, 2, 3], calls)
+
+    time.sleep(0.25)
+
+    self.assertEqual([4, 9], foo.batch([(2,), (3,)]))
+    self.testee.revalidator.join()
+    self.assertEqual(5, len(calls))
+    self.assertEqual(2, len(self.testee.backend.dump()))
+
+  def testSoftTtlSwitch(self):
+    def foo(a):
+      return [a]
+
+    # the callable's entries are saved with and without envelope, e.g. during a deployment
+    plain    = self.testee(foo)
+    envelope = self.testee(softTtl = 10)(foo)
+    for _ in range(2):
+      self.assertEqual([1], plain(1))
+      self.assertEqual([1], envelope(1))
+      self.assertEqual([[1]], plain.batch([(1,)]))
+      self.assertEqual([[1]], envelope.batch([(1,)]))
+
+    keys = plain._key((1,), {}), envelope._key((1,), {})
+    self.assertEqual(keys[0].replace(':foo:', ':foo:envelope:'), keys[1])
+    self.assertEqual(sorted(keys), sorted(self.testee.backend.dump()))
+
+    keyFunc  = lambda fn, a: 'foo:{0}'.format(a)
+    plain    = self.testee(key = keyFunc)(foo)
+    envelope = self.testee(softTtl = 10, key = keyFunc)(foo)
+    for _ in range(2):
+      self.assertEqual([1], plain(1))
+      self.assertEqual([1], envelope(1))
+    self.assertEqual([1], self.testee.backend.load('foo:1'))
+    self.assertEqual([1], self.testee.backend.load('foo:1:envelope')[0])
+
+  def testEarlyRecomputation(self):
+    calls = []
+
+    def target(a):
+      calls.append(a)
+      time.sleep(0.01)
+      return a * len(calls)
+
+    # expiry is moved earlier by delta * beta * -log(random()), beta is exaggerated
+    eager = self.testee(beta = 1e9)(target)
+    for i in range(1, 4):
+      self.assertEqual(2 * i, eager(2))
+      self.assertEqual(i, len(calls))
+
+    value, expireAt, delta = tuple(self.testee.backend.dump().values())[0]
+    self.assertEqual(6, value)
+    self.assertAlmostEqual(time.time() + 360, expireAt, delta = 1)
+    self.assertAlmostEqual(0.01, delta, delta = 0.05)
+
+    self.testee.clean()
+    del calls[:]
+
+    lazy = self.testee(beta = 1e-9)(target)
+    for _ in range(3):
+      self.assertEqual(2, lazy(2))
+      self.assertEqual(1, len(calls))
+
+    with self.assertRaises(ValueError):
+      self.testee(beta = 1, ttl = None)(target)
+
+  def testCacheNone(self):
+    calls = []
+
+    @self.testee
+    def foo(a):
+      calls.append(a)
+
+    @self.testee(cacheNone = True)
+    def bar(a):
+      calls.append(a)
+
+    for i in range(1, 3):
+      self.assertIsNone(foo(1))
+      self.assertEqual(i, len(calls))
+
+    del calls[:]
+    for _ in range(2):
+      self.assertIsNone(bar(1))
+      self.assertEqual([1], calls)
+    self.assertEqual([None, None], bar.batch([(1,), (2,)]))
+    self.assertEqual([1, 2], calls)
+
+  def testErrorTtl(self):
+    calls = []
+
+    @self.testee(errorTtl = 0.2, errors = (LookupError,))
+    def foo(a):
+      calls.append(a)
+      return {}[a] if a else [][a]
+
+    for _ in range(2):
+      with self.assertRaises(KeyError) as ctx:
+        foo('x')
+      self.assertEqual(('x',), ctx.exception.args)
+      self.assertEqual(['x'], calls)
+
+    with self.assertRaises(IndexError):
+      foo(0)
+    self.assertEqual(['x', 0], calls)
+
+    time.sleep(0.25)
+
+    self.assertRaises(KeyError, foo, 'x')
+    self.assertEqual(['x', 0, 'x'], calls)
+
+    @self.testee(errorTtl = 60)
+    def bar(a):
+      calls.append(a)
+      raise TypeError('a')
+
+    self.assertRaises(TypeError, bar, 1)
+    self.assertRaises(TypeError, bar, 1)
+    self.assertEqual(['x', 0, 'x', 1], calls)
+
+    del calls[:]
+    @self.testee(errorTtl = 60, softTtl = 60)
+    def baz(a):
+      calls.append(a)
+      raise ValueError('a')
+
+    self.assertRaises(ValueError, baz, 1)
+    self.assertRaises(ValueError, baz, 1)
+    self.assertEqual([1], calls)
+
+  def testErrorSaveFailure(self):
+    calls = []
+
+    @self.testee(errorTtl = 60)
+    def foo(a):
+      calls.append(a)
+      raise UnpicklableError(threading.Lock())
+
+    for i in range(1, 3):
+      self.assertRaises(UnpicklableError, foo, 1)
+      self.assertEqual(i, len(calls))
+    self.assertEqual({}, self.testee.backend.dump())
+
+    @self.testee(errorTtl = 60)
+    def bar(a):
+      calls.append(a)
+      raise ArgumentError(a, 'b')
+
+    del calls[:]
+    for i in range(1, 3):
+      # the cached exception can't be unpickled, so it's a miss
+      with self.assertRaises(ArgumentError) as ctx:
+        bar(1)
+      self.assertEqual(i, len(calls))
+      self.assertEqual(('b',), ctx.exception.args)
+
+  def testSentinelSwitch(self):
+    def foo(a):
+      if a:
+        raise ValueError(a)
+
+    special = self.testee(cacheNone = True, errorTtl = 60)(foo)
+    plain   = self.testee(foo)
+    self.assertIsNone(special(0))
+    self.assertRaises(ValueError, special, 1)
+
+    # a sentinel saved with other options isn't returned as a result
+    self.assertIsNone(plain(0))
+    self.assertRaises(ValueError, plain, 1)
+    self.assertEqual([None], plain.batch([(0,)]))
+    self.assertRaises(ValueError, plain.batch, [(1,)])
+
+  def testJitter(self):
+    @self.testee(ttl = 100, jitter = 0.5)
+    def foo(a):
+      return a
+
+    now = time.time()
+    foo.batch([(i,) for i in range(16)])
+    foo(16)
+
+    expiry = self.testee.backend._expiry.values()
+    self.assertEqual(17, len(expiry))
+    self.assertTrue(all(now + 49 <= e <= now + 101 for e in expiry))
+    self.assertGreater(len(set(int(e - now) for e in expiry)), 1)
+
+  def testSingleFlight(self):
+    calls = []
+    loads = []
+    load  = self.testee.backend.load
+
+    def countingLoad(keys):
+      loads.append(keys)
+      return load(keys)
+
+    self.testee.backend.load = countingLoad
+
+    def target(a):
+      calls.append(a)
+      time.sleep(0.05)
+      if a < 0:
+        raise ValueError(a)
+      return [a]
+
+    def race(fn, a):
+      start   = threading.Event()
+      results = []
+      def call():
+        start.wait()
+        try:
+          results.append(fn(a))
+        except ValueError as ex:
+          results.append(ex)
+
+      threads = [threading.Thread(target = call) for _ in range(8)]
+      for t in threads:
+        t.start()
+      start.set()
+      for t in threads:
+        t.join()
+      return results
+
+    local = self.testee(singleFlight = True, lock = False)(target)
+    results = race(local, 1)
+    self.assertEqual([1], calls)
+    self.assertEqual([[1]] * 8, results)
+    self.assertTrue(all(r is results[0] for r in results))
+    self.assertEqual(8, len(loads), 'no second load without backend lock')
+    self.assertEqual({}, local._flights)
+
+    results = race(local, -1)
+    self.assertEqual([1, -1], calls)
+    self.assertTrue(all(isinstance(r, ValueError) for r in results))
+
+    del calls[:], loads[:]
+    both = self.testee(singleFlight = True)(target)
+    self.assertEqual([[2]] * 8, race(both, 2))
+    self.assertEqual([2], calls)
+    self.assertEqual(9, len(loads))
+
+    del calls[:]
+    unlocked = self.testee(lock = False)(target)
+    self.assertEqual([[3]] * 8, race(unlocked, 3))
+    self.assertEqual([3] * 8, calls)
+
+  def testWriteBehind(self):
+    calls   = []
+    saves   = []
+    entered = threading.Event()
+    proceed = threading.Event()
+    save    = self.testee.backend.save
+
+    def blockingSave(key = None, value = None, mapping = None, ttl = None):
+      if threading.current_thread().name == 'hermes-writer':
+        entered.set()
+        proceed.wait()
+      saves.append(sorted(mapping.values()))
+      save(mapping = mapping, ttl = ttl)
+
+    self.testee.backend.save = blockingSave
+
+    @self.testee(writeBehind = True)
+    def foo(a):
+      calls.append(a)
+      return a * 2
+
+    # the writer is blocked in the first save, the value is returned anyway
+    self.assertEqual(2, foo(1))
+    entered.wait()
+    self.assertEqual(4, foo(2))
+    self.assertEqual(6, foo(3))
+    self.assertEqual([], saves)
+
+    # saves queued meanwhile are coalesced
+    proceed.set()
+    self.testee.writer.flush()
+    self.assertEqual([[2], [4, 6]], saves)
+    self.assertEqual(3, len(self.testee.backend.dump()))
+
+    for _ in range(2):
+      self.assertEqual([2, 4, 6], [foo(1), foo(2), foo(3)])
+      self.assertEqual([1, 2, 3], calls)
+
+    # when the queue is full, the entry is saved by the caller
+    writer = hermes.Writer(maxsize = 1)
+    proceed.clear()
+    entered.clear()
+
+    @self.testee(writeBehind = True, writer = writer)
+    def bar(a):
+      return a * 3
+
+    self.assertEqual(3, bar(1))
+    entered.wait()
+    self.assertEqual(6, bar(2))
+    self.assertEqual(9, bar(3))
+    self.assertEqual([[9]], saves[2:])
+
+    proceed.set()
+    writer.flush()
+    self.assertEqual([[9], [3], [6]], saves[2:])
+
+
 class TestDictLock(test.TestCase):
 
+
   def setUp(self):
     self.testee = hermes.backend.dict.Lock('123')
 
@@ -350,6 +709,237 @@ class TestDictLock(test.TestCase):
       self.assertTrue(self.testee.acquire(False)) # reintrant within one thread
 
 
+class TestDictBounded(test.TestCase):
+
+  def setUp(self):
+    self.testee = hermes.backend.dict.Backend(hermes.Mangler(), maxsize = 4)
+
+  def testExpiry(self):
+    self.testee.save('a', 1, ttl = 0.05)
+    self.testee.save('b', 2)
+    self.assertEqual(1, self.testee.load('a'))
+    self.assertEqual({'a' : 1, 'b' : 2}, self.testee.dump())
+
+    time.sleep(0.1)
+
+    self.assertIsNone(self.testee.load('a'))
+    self.assertEqual({'b' : 2}, self.testee.load(['a', 'b']))
+    self.assertEqual({'b' : 2}, self.testee.dump())
+    self.assertEqual(['b'], list(self.testee.cache.keys()))
+
+  def testExpiryPurge(self):
+    self.testee.maxsize = None
+    self.testee.save(mapping = {str(i) : i for i in range(128)}, ttl = 0.05)
+    self.testee.save(mapping = {str(i) : i for i in range(64)}, ttl = 0.05)
+
+    time.sleep(0.1)
+
+    # expired entries that are not accessed are purged on write
+    self.testee.save('a', 1)
+    self.assertEqual({'a' : 1}, self.testee.dump())
+    self.assertEqual(1, len(self.testee.cache))
+    self.assertEqual(0, len(self.testee._heap))
+
+  def testOverwrite(self):
+    self.testee.save('a', 1, ttl = 0.05)
+    self.testee.save('a', 2)
+
+    time.sleep(0.1)
+
+    self.testee.save('b', 3)
+    self.assertEqual({'a' : 2, 'b' : 3}, self.testee.dump())
+
+  def testLru(self):
+    # sequential saves, as order of a mapping isn't guaranteed on Python < 3.7
+    for k, v in zip('abcd', range(1, 5)):
+      self.testee.save(k, v)
+    self.assertEqual(1, self.testee.load('a'))
+
+    self.testee.save('e', 5)
+    self.assertEqual({'a' : 1, 'c' : 3, 'd' : 4, 'e' : 5}, self.testee.dump())
+
+    self.testee.load(['c', 'a'])
+    self.testee.save(mapping = {'f' : 6, 'g' : 7})
+    self.assertEqual({'a' : 1, 'c' : 3, 'f' : 6, 'g' : 7}, self.testee.dump())
+
+  def testLfu(self):
+    self.testee = hermes.backend.dict.Backend(hermes.Mangler(), maxsize = 3, policy = 'lfu')
+
+    self.testee.save(mapping = {'a' : 1, 'b' : 2, 'c' : 3})
+    for _ in range(3):
+      self.testee.load('a')
+    self.testee.load('b')
+    self.testee.load('c')
+    self.testee.load('c')
+
+    self.testee.save('d', 4)
+    self.assertEqual({'a' : 1, 'c' : 3, 'd' : 4}, self.testee.dump())
+
+    self.testee.save('e', 5)
+    self.assertEqual({'a' : 1, 'c' : 3, 'e' : 5}, self.testee.dump())
+
+    self.testee.remove(['e', 'c'])
+    self.testee.save(mapping = {'f' : 6, 'g' : 7})
+    self.testee.save('h', 8)
+    self.assertEqual(3, len(self.testee.dump()))
+    self.assertEqual(1, self.testee.load('a'))
+
+  def testMaxbytes(self):
+    self.testee = hermes.backend.dict.Backend(hermes.Mangler(), maxbytes = 512)
+
+    for i in range(16):
+      self.testee.save(str(i), 'x' * 64)
+    self.assertTrue(self.testee._bytes <= 512)
+    self.assertTrue(0 < len(self.testee.cache) < 16)
+    self.assertEqual('x' * 64, self.testee.load('15'))
+
+    self.testee.save('big', 'x' * 1024)
+    self.assertIsNone(self.testee.load('big'))
+    self.assertTrue(self.testee._bytes <= 512)
+
+    self.testee.clean()
+    self.assertEqual(0, self.testee._bytes)
+
+  def testUnknownPolicy(self):
+    with self.assertRaises(ValueError) as ctx:
+      hermes.backend.dict.Backend(hermes.Mangler(), policy = 'fifo')
+    self.assertEqual('Unknown eviction policy: fifo', str(ctx.exception))
+
+  def testCached(self):
+    cache = hermes.Hermes(hermes.backend.dict.Backend, ttl = 0.05, maxsize = 16)
+    fixture = test.createFixture(cache)
+
+    self.assertEqual('ateb+ahpla', fixture.simple('alpha', 'beta'))
+    self.assertEqual('ateb+ahpla', fixture.simple('alpha', 'beta'))
+    self.assertEqual(1, fixture.calls)
+
+    time.sleep(0.1)
+
+    self.assertEqual('ateb+ahpla', fixture.simple('alpha', 'beta'))
+    self.assertEqual(2, fixture.calls)
+
+
+class TestDictCodec(test.TestCase):
+
+  def setUp(self):
+    self.testee  = hermes.Hermes(hermes.backend.dict.Backend, ttl = 360, codec = 'json')
+    self.fixture = test.createFixture(self.testee)
+
+    self.testee.clean()
+
+  def testInstanceDefault(self):
+    key = 'cache:entry:hermes.test:Fixture:simple:' + self._arghash('alpha', 'beta')
+    for _ in range(2):
+      self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+      self.assertEqual(1, self.fixture.calls)
+
+    self.assertEqual(b'J"ateb+ahpla"', self.testee.backend.cache[key])
+    self.assertEqual({key : 'ateb+ahpla'}, self.testee.backend.dump())
+
+  def testFunction(self):
+    @self.testee(codec = 'marshal')
+    def f(a):
+      return {'a' : a}
+
+    @self.testee(codec = 'pickle')
+    def g(a):
+      return {'a' : a}
+
+    self.assertEqual({'a' : (1, 2)}, f((1, 2)))
+    self.assertEqual({'a' : (1, 2)}, f((1, 2)))
+    self.assertEqual({'a' : (1, 2)}, g((1, 2)))
+    self.assertEqual({'a' : (1, 2)}, g((1, 2)))
+
+    markers = sorted(v[:1] for v in self.testee.backend.cache.values())
+    self.assertEqual([b'M', b'\x80'], markers)
+
+    with self.assertRaises(ValueError):
+      self.testee(codec = 'unknown')(f)
+
+  def testTagged(self):
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(1, self.fixture.calls)
+
+    values = self.testee.backend.cache.values()
+    self.assertEqual(2, len([v for v in values if v[:1] == b'\x80']), 'Tag entries')
+    self.assertEqual(1, len([v for v in values if v[:1] == b'J']))
+
+  def testLegacyValue(self):
+    key = 'cache:entry:hermes.test:Fixture:simple:' + self._arghash('alpha', 'beta')
+    # written by previous version, which pickled values unconditionally
+    self.testee.backend.save(key, hermes.codec.Encoded(pickle.dumps('legacy', protocol = 2)))
+
+    self.assertEqual('legacy', self.fixture.simple('alpha', 'beta'))
+    self.assertEqual(0, self.fixture.calls)
+
+  def testSwitch(self):
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+
+    testee  = hermes.Hermes(hermes.backend.dict.Backend, ttl = 360, codec = 'marshal')
+    testee.backend = self.testee.backend
+    fixture = test.createFixture(testee)
+
+    self.assertEqual('ateb+ahpla', fixture.simple('alpha', 'beta'))
+    self.assertEqual(0, fixture.calls)
+
+  @unittest.skipUnless(hermes.codec.msgpack, 'msgpack is not installed')
+  def testMsgpack(self):
+    @self.testee(codec = 'msgpack')
+    def f(a):
+      return {'a' : [a, b'\x00']}
+
+    self.assertEqual({'a' : ['b', b'\x00']}, f('b'))
+    self.assertEqual({'a' : ['b', b'\x00']}, f('b'))
+    self.assertEqual([b'P'], [v[:1] for v in self.testee.backend.cache.values()])
+
+  def testUnknownMarker(self):
+    with self.assertRaises(ValueError):
+      hermes.codec.decode(b'?')
+
+  def testRegister(self):
+    class Repr(hermes.codec.Codec):
+      marker = b'R'
+      dumps  = lambda self, value: repr(value).encode('ascii')
+      loads  = lambda self, value: eval(value)
+
+    hermes.codec.register('repr', Repr())
+    try:
+      @self.testee(codec = 'repr')
+      def f(a):
+        return {'a' : a}
+
+      self.assertEqual({'a' : (1,)}, f((1,)))
+      self.assertEqual({'a' : (1,)}, f((1,)))
+
+      class Clash(Repr):
+        marker = b'J'
+
+      with self.assertRaises(ValueError):
+        hermes.codec.register('clash', Clash())
+      self.assertNotIn('clash', hermes.codec._registry)
+    finally:
+      # the codec is global, and must not leak into other tests
+      del hermes.codec._registry['repr']
+      del hermes.codec._markers[Repr.marker]
+
+  def testCustomMangler(self):
+    testee = hermes.Hermes(hermes.backend.dict.Backend, ZlibMangler, ttl = 360, codec = 'json')
+
+    @testee
+    def f(a):
+      return {'a' : a}
+
+    for _ in range(2):
+      self.assertEqual({'a' : 1}, f(1))
+      self.assertEqual([{'a' : 1}, {'a' : 2}], f.batch([(1,), (2,)]))
+
+    # the mangler serialises encoded value as any other bytes
+    key = f._key((1,), {})
+    self.assertEqual(b'J{"a":1}', testee.mangler.loads(testee.backend.cache[key]))
+    self.assertIs(hermes.codec.Encoded, type(testee.backend.load(key)))
+
+
 class CustomMangler(hermes.Mangler):
 
   prefix = 'hermes'
@@ -366,6 +956,26 @@ class CustomMangler(hermes.Mangler):
     return json.loads(value)
 
 
+class UnpicklableError(Exception):
+  '''Exception which can't be pickled because of its argument'''
+
+
+class ArgumentError(Exception):
+  '''Exception which can't be unpickled, because its arguments aren't ``args``'''
+
+  def __init__(self, a, b):
+    super(ArgumentError, self).__init__(b)
+
+
+class ZlibMangler(hermes.Mangler):
+
+  def dumps(self, value):
+    return zlib.compress(pickle.dumps(value, protocol = pickle.HIGHEST_PROTOCOL))
+
+  def loads(self, value):
+    return pickle.loads(zlib.decompress(value))
+
+
 class TestDictCustomMangler(TestDict):
 
   def setUp(self):
@@ -683,6 +1293,32 @@ class TestDictCustomMangler(TestDict):
       prefix + ':simple:' + str(self._arghash('beta', 'alpha')) : 'ahpla+ateb'
     }, self.testee.backend.dump())
 
+  @unittest.skip('JSON mangler cannot serialise the sentinel')
+  def testCacheNone(self):
+    pass
+
+  @unittest.skip('JSON mangler cannot serialise exceptions')
+  def testErrorTtl(self):
+    pass
+
+  @unittest.skip('JSON mangler cannot serialise the sentinel')
+  def testSentinelSwitch(self):
+    pass
+
+  def testBatch(self):
+    arguments = [('alpha', 'beta'), ('gamma', 'delta'), ('alpha', 'beta')]
+    self.assertEqual(
+      ['ateb+ahpla', 'atled+ammag', 'ateb+ahpla'], self.fixture.simple.batch(arguments))
+    self.assertEqual(2, self.fixture.calls)
+    prefix = 'hermes:entry:hermes.test:Fixture'
+    self.assertEqual({
+      prefix + ':simple:' + str(self._arghash('alpha', 'beta'))  : 'ateb+ahpla',
+      prefix + ':simple:' + str(self._arghash('gamma', 'delta')) : 'atled+ammag'
+    }, self.testee.backend.dump())
+
+    self.assertEqual('atled+ammag', self.fixture.simple('gamma', 'delta'))
+    self.assertEqual(2, self.fixture.calls)
+
 
 class CustomCached(hermes.Cached):
 
@@ -732,5 +1368,12 @@ class TestDictPerformance(test.unittest.TestCase):
     self.testee.clean()
 
   def testPerformance(self):
-    test.benchmark(self.fixture)
+    benchmark.report(benchmark.run(self.testee, number = 1024, warmup = 128))
+
+  def testOverhead(self):
+    for name, (overhead, direct) in sorted(benchmark.overhead(self.testee).items()):
+      print('{0} overhead: {1:,.0f} ns, direct call: {2:,.0f} ns'.format(name, overhead, direct))
+      # the bound is loose, so timing noise doesn't fail it, but a regression like pickling
+      # arguments or unmemoised key prefix does
+      self.assertLess(overhead, 3 * direct, name)
 
@@ -0,0 +1,184 @@
+import time
+
+from .. import test, Hermes
+from ..backend import layered
+import hermes.backend.dict
+
+
+class TestLayered(test.TestCase):
+
+  def setUp(self):
+    self.testee  = Hermes(hermes.backend.dict.Backend, ttl = 360, localTtl = 60, localMaxsize = 4)
+    self.fixture = test.createFixture(self.testee)
+
+    self.testee.clean()
+
+  def testInit(self):
+    self.assertTrue(isinstance(self.testee.backend, layered.Backend))
+    self.assertTrue(isinstance(self.testee.backend.remote, hermes.backend.dict.Backend))
+    self.assertEqual(60, self.testee.backend.ttl)
+    self.assertEqual(4,  self.testee.backend.maxsize)
+
+    self.assertFalse(isinstance(Hermes(hermes.backend.dict.Backend).backend, layered.Backend))
+
+  def testSimple(self):
+    remote = self.testee.backend.remote
+
+    for _ in range(4):
+      self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+      self.assertEqual(1, self.fixture.calls)
+
+    key = 'cache:entry:hermes.test:Fixture:simple:' + self._arghash('alpha', 'beta')
+    self.assertEqual({key : 'ateb+ahpla'}, remote.dump())
+
+    # front store answers even though remote entry is gone
+    remote.clean()
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.assertEqual(1, self.fixture.calls)
+
+    self.fixture.simple.invalidate('alpha', 'beta')
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testTagged(self):
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(1, self.fixture.calls)
+    self.assertEqual(3, len(self.testee.backend.remote.dump()))
+
+    self.testee.clean(['rock'])
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testExpiry(self):
+    self.testee.backend.ttl = 0.05
+
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.testee.backend.remote.clean()
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.assertEqual(1, self.fixture.calls)
+
+    time.sleep(0.1)
+
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testEviction(self):
+    backend = self.testee.backend
+    backend.save(mapping = {str(i) : i for i in range(4)})
+    self.assertEqual(0, backend.load('0'))
+
+    backend.save('4', 4)
+    backend.remote.clean()
+
+    self.assertEqual({'0' : 0, '2' : 2, '3' : 3, '4' : 4}, backend.load(map(str, range(5))))
+
+  def testMutableValue(self):
+    backend = self.testee.backend
+    backend.save('key', {'a' : [1]})
+
+    value = backend.load('key')
+    value['a'].append(2)
+
+    self.assertEqual({'a' : [1]}, backend.load('key'))
+
+  def testClean(self):
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.testee.clean()
+
+    self.assertEqual({}, self.testee.backend.remote.dump())
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testNested(self):
+    self.assertEqual('beta+alpha', self.fixture.nested('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+    self.assertEqual('beta+alpha', self.fixture.nested('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+
+class TestLayeredTagHash(test.TestCase):
+
+  def setUp(self):
+    self.testee  = Hermes(hermes.backend.dict.Backend, ttl = 360, tagTtl = 60)
+    self.fixture = test.createFixture(self.testee)
+
+    self.testee.clean()
+
+  def testInit(self):
+    self.assertTrue(isinstance(self.testee.backend, layered.Backend))
+    self.assertIsNone(self.testee.backend.front)
+    self.assertEqual(60, self.testee.backend.tagTtl)
+
+    backend = Hermes(hermes.backend.dict.Backend, localTtl = 5).backend
+    self.assertEqual(5, backend.tagTtl)
+
+    with self.assertRaises(ValueError):
+      layered.Backend(self.testee.mangler, self.testee.backend.remote, ttl = None)
+
+  def testTagged(self):
+    remote = self.testee.backend.remote
+    loads  = []
+    load   = remote.load
+    def countingLoad(keys):
+      loads.append(keys)
+      return load(keys)
+    remote.load = countingLoad
+
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual('ae%ma', self.fixture.tagged2('gamma', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+    self.assertEqual(5, len(remote.dump()))
+
+    del loads[:]
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(1, len(loads), 'Tag hash is not loaded')
+
+    # invalidation in the same process is visible immediately
+    self.testee.clean(['rock'])
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual('ae%ma', self.fixture.tagged2('gamma', 'beta'))
+    self.assertEqual(4, self.fixture.calls)
+
+  def testStaleness(self):
+    self.testee.backend.tagTtl = 0.05
+
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+
+    # invalidation made by another process
+    self.testee.backend.remote.remove('cache:tag:rock')
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(1, self.fixture.calls)
+
+    time.sleep(0.1)
+
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testConcurrentInvalidation(self):
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+
+    backend = self.testee.backend
+    load    = backend.remote.loadTagHash
+    def racingLoad(tagKeys, create = False):
+      tagHash = load(tagKeys, create)
+      # invalidation happens in another thread after the tag hash is loaded
+      backend.remote.loadTagHash = load
+      self.testee.clean(['rock'])
+      return tagHash
+
+    backend._tagHashes.clear()
+    backend.remote.loadTagHash = racingLoad
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(1, self.fixture.calls)
+
+    # the stale tag hash isn't cached
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testSimple(self):
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.testee.backend.remote.clean()
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls, 'No front store')
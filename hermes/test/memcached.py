@@ -1,8 +1,10 @@
 import time
+import threading
 import pickle
 import telnetlib
 
 from .. import test, Hermes, Mangler
+from . import benchmark
 from ..backend import memcached, AbstractLock
 
 
@@ -391,6 +393,21 @@ class TestMemcached(test.TestCase):
     key = 'cache:entry:hermes.test:Fixture:simple:' + self._arghash('beta', 'alpha')
     self.assertEqual('ahpla+ateb', pickle.loads(self.testee.backend.client.get(key)))
 
+  def testThreadMapping(self):
+    clients = []
+    def target():
+      clients.append(self.testee.backend.client)
+      self.assertIs(clients[-1], self.testee.backend.client)
+      self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+
+    threads = [threading.Thread(target = target) for _ in range(4)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    clients.append(self.testee.backend.client)
+    self.assertEqual(5, len(set(map(id, clients))))
+    self.assertEqual(1, self.fixture.calls)
+
 
 class TestMemcachedLock(test.TestCase):
 
@@ -398,10 +415,8 @@ class TestMemcachedLock(test.TestCase):
     cache = Hermes(memcached.Backend)
     cache.clean()
 
-    # make lock instance be created with client from ``Hermes`` instance at
-    # thread context to utilize ``memcached.Backend`` ``thread.local``
-    self.__class__.testee = property(
-      lambda self: memcached.Lock('123', cache.backend.client))
+    # the lock takes the client of current thread from ``memcached.Backend`` ``thread.local``
+    self.testee = memcached.Lock('123', None, backend = cache.backend)
 
   def testAcquire(self):
     for _ in range(2):
@@ -433,6 +448,64 @@ class TestMemcachedLock(test.TestCase):
         self.assertFalse(self.testee.acquire(False))
         self.assertEqual('234', another.key)
 
+  def testNotification(self):
+    waiter = memcached.Lock('123', self.testee.client, lockSleep = 30)
+    result = []
+
+    def target():
+      start = time.time()
+      result.append(waiter.acquire(True))
+      result.append(time.time() - start)
+      waiter.release()
+
+    holder = self.testee
+    self.assertTrue(holder.acquire(False))
+    thread = threading.Thread(target = target)
+    thread.start()
+
+    time.sleep(0.25)
+    self.assertEqual([], result)
+    holder.release()
+
+    thread.join(5)
+    self.assertTrue(result[0])
+    self.assertTrue(0.25 <= result[1] < 1, 'woken up by release event, not by timeout')
+
+  def testOwnership(self):
+    self.assertTrue(self.testee.acquire(False))
+    self.testee.client.set(self.testee.key, 'another')
+    self.assertFalse(self.testee.extend())
+    self.testee.release()
+    self.assertEqual('another', self.testee.client.get(self.testee.key))
+
+  def testWait(self):
+    waiter = memcached.Lock('123', self.testee.client, lockWait = 0.25)
+    with self.testee:
+      start = time.time()
+      self.assertFalse(waiter.acquire(True))
+      self.assertTrue(0.25 <= time.time() - start < 0.5)
+      self.assertIsNone(waiter.token)
+
+
+  def testEvents(self):
+    # the lock is held by another process
+    self.testee.client.set(self.testee.key, 'another')
+
+    waiters = [memcached.Lock('123', self.testee.client, lockWait = 0.1) for _ in range(2)]
+    threads = [threading.Thread(target = w.acquire) for w in waiters]
+    for thread in threads:
+      thread.start()
+    time.sleep(0.05)
+    self.assertEqual({'123' : 2}, memcached.Lock._waiters)
+
+    for thread in threads:
+      thread.join(5)
+    self.assertEqual({}, memcached.Lock._waiters)
+    self.assertEqual({}, memcached.Lock._events)
+
+    self.assertFalse(waiters[0].acquire(False))
+    self.assertEqual({}, memcached.Lock._events)
+
 
 class TestMemcachedPerformance(test.unittest.TestCase):
 
@@ -444,7 +517,7 @@ class TestMemcachedPerformance(test.unittest.TestCase):
     self.testee.backend.remove(getAllKeys())
 
   def testPerformance(self):
-    test.benchmark(self.fixture)
+    benchmark.report(benchmark.run(self.testee, number = 1024, warmup = 128))
 
   def testLazyInit(self):
     server = test.FakeBackendServer()
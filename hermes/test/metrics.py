@@ -0,0 +1,167 @@
+import sys
+import pickle
+
+from .. import test, metrics, Hermes
+from .dict import ZlibMangler
+import hermes.codec
+import hermes.backend.dict
+
+
+class TestMetrics(test.TestCase):
+
+  def setUp(self):
+    self.testee  = Hermes(hermes.backend.dict.Backend, ttl = 360, metrics = True)
+    self.fixture = test.createFixture(self.testee)
+
+    self.testee.clean()
+
+  def testDisabled(self):
+    testee  = Hermes(hermes.backend.dict.Backend)
+    fixture = test.createFixture(testee)
+    self.assertIsNone(testee.metrics)
+    self.assertEqual('ateb+ahpla', fixture.simple('alpha', 'beta'))
+    self.assertIsNone(fixture.simple._metrics)
+
+  def testCounters(self):
+    for _ in range(4):
+      self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+      self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+
+    if sys.version_info >= (3,):
+      name = 'hermes.test.createFixture.Fixture.{0}'.format
+    else:
+      # the line the function is defined at is appended to its name, see ``Cached._getName``
+      name = lambda n: 'hermes.test.{0}:{1}'.format(
+        n, vars(type(self.fixture))[n]._callable.__code__.co_firstlineno)
+
+    # metrics are registered on decoration
+    collected = self.testee.metrics.collect()
+    self.assertEqual(
+      {name(n) for n in ('simple', 'nested', 'tagged', 'tagged2', 'key', 'all')},
+      set(collected.keys()))
+    self.assertEqual(3, collected[name('tagged')]['hits'])
+    self.assertEqual(0, collected[name('nested')]['hits'])
+
+    simple = collected[name('simple')]
+    self.assertEqual(3, simple['hits'])
+    self.assertEqual(1, simple['misses'])
+    self.assertEqual(1, simple['lockWaits'])
+    self.assertGreaterEqual(simple['lockWaitTime'], 0)
+    self.assertGreaterEqual(simple['computeTime'], 0)
+    self.assertEqual(1, simple['saves'])
+    self.assertEqual(len(pickle.dumps('ateb+ahpla', pickle.HIGHEST_PROTOCOL)),
+      simple['savedBytes'])
+    self.assertEqual(5, simple['load']['count'])
+    self.assertEqual(1, simple['save']['count'])
+    self.assertEqual(5, simple['load']['buckets'][-1][1])
+
+    self.fixture.simple.batch([('alpha', 'beta'), ('gamma', 'delta')])
+    simple = self.testee.metrics.collect()[name('simple')]
+    self.assertEqual(4, simple['hits'])
+    self.assertEqual(2, simple['misses'])
+    self.assertEqual(2, simple['saves'])
+
+  def testCodec(self):
+    @self.testee(codec = 'json')
+    def foo(a):
+      return {'a' : a}
+
+    self.assertEqual({'a' : 1}, foo(1))
+    self.assertEqual({'a' : 1}, foo(1))
+
+    snapshot = foo._metrics.snapshot()
+    self.assertEqual(len(hermes.codec.get('json').encode({'a' : 1})), snapshot['savedBytes'])
+    self.assertEqual(1, snapshot['hits'])
+
+  def testCustomMangler(self):
+    testee = Hermes(hermes.backend.dict.Backend, ZlibMangler, ttl = 360, metrics = True)
+
+    @testee(codec = 'json')
+    def foo(a):
+      return {'a' : a}
+
+    self.assertEqual({'a' : 1}, foo(1))
+    self.assertEqual({'a' : 1}, foo(1))
+
+    # the value is serialised by the mangler once
+    data = testee.backend.cache[foo._key((1,), {})]
+    self.assertEqual(b'J{"a":1}', testee.mangler.loads(data))
+    self.assertEqual(len(data), foo._metrics.snapshot()['savedBytes'])
+
+  def testWriteBehind(self):
+    @self.testee(writeBehind = True)
+    def foo(a):
+      return a
+
+    @self.testee(writeBehind = True)
+    def bar(a):
+      return a
+
+    for i in range(8):
+      self.assertEqual(i, foo(i))
+      self.assertEqual(i, bar(i))
+    self.testee.writer.flush()
+
+    # saves of the callables coalesced by the writer are credited to each
+    self.assertEqual(8, foo._metrics.snapshot()['saves'])
+    self.assertEqual(8, bar._metrics.snapshot()['saves'])
+
+  def testName(self):
+    class Function(object):
+      '''Python 2 function, which doesn't have ``__qualname__``'''
+
+      def __init__(self, name, line):
+        self.__name__ = name
+        self.__code__ = type('Code', (object,), {'co_firstlineno' : line})()
+
+    class Method(object):
+      '''Python 2 bound method'''
+
+      def __init__(self, fn, cls):
+        self.__func__ = fn
+        self.im_class = cls
+
+    getName = hermes.Cached._getName
+    self.assertEqual('hermes.test.metrics.foo:10', getName(Function('foo', 10)))
+    self.assertEqual('hermes.test.metrics.foo:20', getName(Function('foo', 20)))
+    self.assertEqual('hermes.test.metrics.Method.foo', getName(Method(Function('foo', 10), Method)))
+
+    def foo():
+      pass
+    if sys.version_info >= (3,):
+      self.assertEqual('hermes.test.metrics.TestMetrics.testName.foo', getName(foo))
+    else:
+      expected = 'hermes.test.metrics.foo:{0}'.format(foo.__code__.co_firstlineno)
+      self.assertEqual(expected, getName(foo))
+
+  def testHistogram(self):
+    histogram = metrics.Histogram((0.1, 1))
+    for v in (0.05, 0.1, 0.5, 5):
+      histogram.observe(v)
+
+    self.assertEqual(4, histogram.count)
+    self.assertEqual({
+      'buckets' : [(0.1, 2), (1, 3), (float('inf'), 4)],
+      'sum'     : 5.65,
+      'count'   : 4
+    }, histogram.snapshot())
+
+  def testPrometheus(self):
+    registry = metrics.Registry()
+    registry.get('foo.bar').hits = 3
+    registry.get('foo."baz"').misses = 2
+    registry.get('foo.bar').load.observe(0.002)
+
+    text = registry.prometheus()
+    self.assertTrue(text.endswith('\n'))
+    lines = text.splitlines()
+    self.assertIn('# TYPE hermes_hits_total counter', lines)
+    self.assertIn('hermes_hits_total{function="foo.bar"} 3', lines)
+    self.assertIn('hermes_misses_total{function="foo.\\"baz\\""} 2', lines)
+    self.assertIn('# TYPE hermes_load_seconds histogram', lines)
+    self.assertIn('hermes_load_seconds_bucket{function="foo.bar",le="0.001"} 0', lines)
+    self.assertIn('hermes_load_seconds_bucket{function="foo.bar",le="0.0025"} 1', lines)
+    self.assertIn('hermes_load_seconds_bucket{function="foo.bar",le="+Inf"} 1', lines)
+    self.assertIn('hermes_load_seconds_count{function="foo.bar"} 1', lines)
+    self.assertIn('hermes_load_seconds_sum{function="foo.bar"} 0.002', lines)
+    self.assertIs(registry.get('foo.bar'), registry.get('foo.bar'))
@@ -0,0 +1,220 @@
+import os
+import time
+import tempfile
+import threading
+
+from .. import test, Hermes, Mangler
+from ..backend import mmap
+
+
+class TestMmap(test.TestCase):
+
+  def setUp(self):
+    fd, self.path = tempfile.mkstemp()
+    os.close(fd)
+    os.remove(self.path)
+
+    self.testee  = Hermes(mmap.Backend, ttl = 360, path = self.path)
+    self.fixture = test.createFixture(self.testee)
+
+    self.testee.clean()
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def testSimple(self):
+    for _ in range(4):
+      self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+      self.assertEqual(1, self.fixture.calls)
+
+      key = 'cache:entry:hermes.test:Fixture:simple:' + self._arghash('alpha', 'beta')
+      self.assertEqual({key : 'ateb+ahpla'}, self.testee.backend.dump())
+
+    self.fixture.simple.invalidate('alpha', 'beta')
+    self.assertEqual({}, self.testee.backend.dump())
+
+  def testTagged(self):
+    for _ in range(4):
+      self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+      self.assertEqual(1, self.fixture.calls)
+      self.assertEqual(3, len(self.testee.backend.dump()))
+
+    self.testee.clean(['rock'])
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testBatch(self):
+    result = self.fixture.simple.batch([('alpha', 'beta'), ('gamma', 'delta')])
+    self.assertEqual(['ateb+ahpla', 'atled+ammag'], result)
+    self.assertEqual(2, self.fixture.calls)
+    self.assertEqual(2, len(self.testee.backend.dump()))
+
+  def testShared(self):
+    other = Hermes(mmap.Backend, ttl = 360, path = self.path)
+    self.testee.backend.save('a', 1)
+    self.assertEqual(1, other.backend.load('a'))
+
+    pid = os.fork()
+    if not pid:
+      # the child inherits the mapping, and writes to the parent's file
+      self.testee.backend.save(mapping = {'b' : 2, 'c' : 3}, ttl = 10)
+      os._exit(0)
+
+    os.waitpid(pid, 0)
+    self.assertEqual({'a' : 1, 'b' : 2, 'c' : 3}, other.backend.dump())
+
+  def testLayout(self):
+    with self.assertRaises(ValueError) as ctx:
+      mmap.Backend(Mangler(), path = self.path, slotSize = 1024)
+    self.assertEqual('Cache file {0} has different layout'.format(self.path), str(ctx.exception))
+
+  def testSharedFile(self):
+    link = self.path + '.link'
+    os.symlink(self.path, link)
+    try:
+      other = mmap.Backend(Mangler(), path = link)
+    finally:
+      os.remove(link)
+
+    # record locks are owned by the process, so backends of the file share them
+    backend = self.testee.backend
+    self.assertIs(backend._shared, other._shared)
+    with backend.lock('123'):
+      self.assertFalse(other.lock('123').acquire(False))
+    lock = other.lock('123')
+    self.assertTrue(lock.acquire(False))
+    lock.release()
+
+    # a file which is replaced is opened anew
+    os.remove(self.path)
+    another = mmap.Backend(Mangler(), path = self.path)
+    self.assertIsNot(backend._shared, another._shared)
+    another.save('a', 1)
+    self.assertIsNone(backend.load('a'))
+
+
+class TestMmapBackend(test.TestCase):
+
+  def setUp(self):
+    fd, self.path = tempfile.mkstemp()
+    os.close(fd)
+    os.remove(self.path)
+
+    # one set of 4 slots
+    self.testee = mmap.Backend(Mangler(), path = self.path, maxsize = 4, ways = 4, slotSize = 128)
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def testExpiry(self):
+    self.testee.save('a', 1, ttl = 0.05)
+    self.testee.save('b', 2)
+    self.assertEqual(1, self.testee.load('a'))
+    self.assertEqual({'a' : 1, 'b' : 2}, self.testee.dump())
+
+    time.sleep(0.1)
+
+    self.assertIsNone(self.testee.load('a'))
+    self.assertEqual({'b' : 2}, self.testee.load(['a', 'b']))
+    self.assertEqual({'b' : 2}, self.testee.dump())
+
+    # expired slot is reused before eviction
+    self.testee.save(mapping = {'c' : 3, 'd' : 4, 'e' : 5})
+    self.assertEqual({'b' : 2, 'c' : 3, 'd' : 4, 'e' : 5}, self.testee.dump())
+
+  def testLru(self):
+    for k, v in zip('abcd', range(4)):
+      self.testee.save(k, v)
+      time.sleep(0.001)
+    self.assertEqual(0, self.testee.load('a'))
+
+    self.testee.save('e', 4)
+    self.assertEqual({'a' : 0, 'c' : 2, 'd' : 3, 'e' : 4}, self.testee.dump())
+
+  def testOverwrite(self):
+    self.testee.save('a', 1, ttl = 0.05)
+    self.testee.save('a', 2)
+
+    time.sleep(0.1)
+
+    self.assertEqual({'a' : 2}, self.testee.dump())
+
+  def testSlotSize(self):
+    self.testee.save('a', 'x')
+    self.testee.save('a', 'x' * 128)
+    self.assertIsNone(self.testee.load('a'))
+    self.assertEqual({}, self.testee.dump())
+
+  def testRemove(self):
+    self.testee.save(mapping = {'a' : 1, 'b' : 2, 'c' : 3})
+    self.testee.remove('a')
+    self.testee.remove(['b', 'z'])
+    self.assertEqual({'c' : 3}, self.testee.dump())
+
+    self.testee.clean()
+    self.assertEqual({}, self.testee.dump())
+
+
+class TestMmapLock(test.TestCase):
+
+  def setUp(self):
+    fd, self.path = tempfile.mkstemp()
+    os.close(fd)
+    os.remove(self.path)
+
+    self.backend = mmap.Backend(Mangler(), path = self.path, maxsize = 8)
+    self.testee  = self.backend.lock('123')
+
+  def tearDown(self):
+    os.remove(self.path)
+
+  def testAcquire(self):
+    for _ in range(2):
+      try:
+        self.assertTrue(self.testee.acquire(True))
+        self.assertFalse(self.testee.acquire(False))
+        self.assertEqual('cache:lock:123', self.testee.key)
+      finally:
+        self.testee.release()
+
+  def testWith(self):
+    with self.testee:
+      another = self.backend.lock('234')
+      with another:
+        self.assertFalse(another.acquire(False))
+        self.assertFalse(self.backend.lock('123').acquire(False))
+
+    # release of not acquired lock is no-op
+    another = self.backend.lock('123')
+    another.release()
+    with self.testee:
+      self.assertFalse(another.acquire(False))
+
+  def testProcess(self):
+    with self.testee:
+      pid = os.fork()
+      if not pid:
+        os._exit(0 if self.backend.lock('123').acquire(False) else 1)
+      self.assertEqual(1, os.waitpid(pid, 0)[1] >> 8)
+
+    pid = os.fork()
+    if not pid:
+      os._exit(0 if self.backend.lock('123').acquire(False) else 1)
+    self.assertEqual(0, os.waitpid(pid, 0)[1] >> 8)
+
+  def testWait(self):
+    waiter = mmap.Lock('cache:lock:123', self.backend, lockWait = 0.25)
+    result = []
+
+    def target():
+      start = time.time()
+      result.append(waiter.acquire(True))
+      result.append(time.time() - start)
+
+    with self.testee:
+      thread = threading.Thread(target = target)
+      thread.start()
+      thread.join(5)
+
+    self.assertFalse(result[0])
+    self.assertTrue(0.25 <= result[1] < 0.5)
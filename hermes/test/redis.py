@@ -1,6 +1,9 @@
+import time
 import pickle
+import threading
 
 from .. import test, Hermes, Mangler
+from . import benchmark
 from ..backend import redis, AbstractLock
 
 
@@ -15,6 +18,13 @@ class TestRedis(test.TestCase):
   def tearDown(self):
     self.testee.clean()
 
+  def _taghash(self, **kwargs):
+    '''Tag hash is derived from serialised tag entries sorted by key, see
+    ``redis.Backend.loadTaggedLua``'''
+
+    return redis.Backend._hashTags(
+      [pickle.dumps(v, protocol = pickle.HIGHEST_PROTOCOL) for _, v in sorted(kwargs.items())])
+
   def testSimple(self):
     self.assertEqual(0, self.fixture.calls)
     self.assertEqual(0, self.testee.backend.client.dbsize())
@@ -70,7 +80,7 @@ class TestRedis(test.TestCase):
       self.assertEqual(16, len(treeTag))
 
       argHash = self._arghash('alpha', b = 'beta')
-      tagHash = self.testee.mangler.hashTags(dict(tree = treeTag, rock = rockTag))
+      tagHash = self._taghash(tree = treeTag, rock = rockTag)
       key     = 'cache:entry:hermes.test:Fixture:tagged:{0}:{1}'.format(argHash, tagHash)
       self.assertEqual(360, self.testee.backend.client.ttl(key))
       self.assertEqual('ae-hl', pickle.loads(self.testee.backend.client.get(key)))
@@ -163,7 +173,7 @@ class TestRedis(test.TestCase):
       self.assertEqual(16, len(aTag))
       self.assertEqual(16, len(zTag))
 
-      tagHash = self.testee.mangler.hashTags(dict(a = aTag, z = zTag))
+      tagHash = self._taghash(a = aTag, z = zTag)
       key     = 'mk:alpha:beta:' + tagHash
       self.assertEqual(120,     self.testee.backend.client.ttl(key))
       self.assertEqual('apabt', pickle.loads(self.testee.backend.client.get(key)))
@@ -194,7 +204,7 @@ class TestRedis(test.TestCase):
       self.assertEqual(16, len(ashTag))
       self.assertEqual(16, len(stoneTag))
 
-      tagHash = self.testee.mangler.hashTags(dict(ash = ashTag, stone = stoneTag))
+      tagHash = self._taghash(ash = ashTag, stone = stoneTag)
       key     = 'mykey:alpha:beta:' + tagHash
       self.assertEqual(360, self.testee.backend.client.ttl(key))
       self.assertEqual('apabt', pickle.loads(self.testee.backend.client.get(key)))
@@ -224,7 +234,7 @@ class TestRedis(test.TestCase):
       self.assertEqual(16, len(aTag))
       self.assertEqual(16, len(zTag))
 
-      tagHash = self.testee.mangler.hashTags(dict(a = aTag, z = zTag))
+      tagHash = self._taghash(a = aTag, z = zTag)
       key = "mk:{'alpha':1}:['beta']:" + tagHash
       self.assertEqual(1200, self.testee.backend.client.ttl(key))
       self.assertEqual({'a': 1, 'b': {'b': 'beta'}},
@@ -269,7 +279,7 @@ class TestRedis(test.TestCase):
     self.assertEqual(16, len(treeTag))
 
     argHash   = self._arghash('gamma', 'delta')
-    tagHash   = self.testee.mangler.hashTags(dict(tree = treeTag, rock = rockTag))
+    tagHash   = self._taghash(tree = treeTag, rock = rockTag)
     taggedKey = 'cache:entry:hermes.test:Fixture:tagged:{0}:{1}'.format(argHash, tagHash)
     self.assertEqual('aldamg', pickle.loads(self.testee.backend.client.get(taggedKey)))
 
@@ -303,7 +313,7 @@ class TestRedis(test.TestCase):
     self.assertEqual('aldamg', pickle.loads(self.testee.backend.client.get(taggedKey)))
 
     argHash   = self._arghash('gamma', 'delta')
-    tagHash   = self.testee.mangler.hashTags(dict(tree = treeTag, rock = rockTag))
+    tagHash   = self._taghash(tree = treeTag, rock = rockTag)
     taggedKey = 'cache:entry:hermes.test:Fixture:tagged:{0}:{1}'.format(argHash, tagHash)
     self.assertEqual('aldamg', pickle.loads(self.testee.backend.client.get(taggedKey)))
 
@@ -337,7 +347,7 @@ class TestRedis(test.TestCase):
     self.assertEqual(16, len(treeTag))
 
     argHash   = self._arghash('gamma', 'delta')
-    tagHash   = self.testee.mangler.hashTags(dict(tree = treeTag, rock = rockTag))
+    tagHash   = self._taghash(tree = treeTag, rock = rockTag)
     taggedKey = 'cache:entry:hermes.test:Fixture:tagged:{0}:{1}'.format(argHash, tagHash)
     self.assertEqual('aldamg', pickle.loads(self.testee.backend.client.get(taggedKey)))
 
@@ -355,6 +365,191 @@ class TestRedis(test.TestCase):
     self.assertEqual('ahpla+ateb', pickle.loads(self.testee.backend.client.get(key)))
 
 
+  def testBatch(self):
+    arguments = [('alpha', 'beta'), ('gamma', 'delta'), ('alpha', 'beta')]
+    self.assertEqual(
+      ['ateb+ahpla', 'atled+ammag', 'ateb+ahpla'], self.fixture.simple.batch(arguments))
+    self.assertEqual(2, self.fixture.calls)
+    self.assertEqual(2, self.testee.backend.client.dbsize())
+
+    key = 'cache:entry:hermes.test:Fixture:simple:' + self._arghash('gamma', 'delta')
+    self.assertEqual('atled+ammag', pickle.loads(self.testee.backend.client.get(key)))
+    self.assertEqual(360, self.testee.backend.client.ttl(key))
+
+    self.assertEqual(['ae-hl', 'aldamg'],
+      self.fixture.tagged.batch([('alpha', 'beta'), ('gamma', 'delta')], threads = 2))
+    self.assertEqual(4, self.fixture.calls)
+    self.assertEqual(6, self.testee.backend.client.dbsize())
+    self.assertEqual('aldamg', self.fixture.tagged('gamma', 'delta'))
+    self.assertEqual(4, self.fixture.calls)
+
+  def testCodec(self):
+    @self.testee(codec = 'json', tags = ('rock',))
+    def f(a):
+      return {'a' : a}
+
+    self.assertEqual({'a' : 'b'}, f('b'))
+    self.assertEqual({'a' : 'b'}, f('b'))
+
+    values = [self.testee.backend.client.get(k) for k in self.testee.backend.client.keys()]
+    self.assertEqual([b'J', b'\x80'], sorted(v[:1] for v in values))
+
+  def testCacheNoneAndErrors(self):
+    calls = []
+
+    @self.testee(codec = 'json', cacheNone = True, errorTtl = 30)
+    def f(a):
+      calls.append(a)
+      if a:
+        raise KeyError(a)
+
+    for _ in range(2):
+      self.assertIsNone(f(0))
+      self.assertRaises(KeyError, f, 1)
+      self.assertEqual([0, 1], calls)
+
+    client = self.testee.backend.client
+    self.assertEqual(360, client.ttl('cache:entry:hermes.test.redis:f:' + self._arghash(0)))
+    self.assertEqual(30, client.ttl('cache:entry:hermes.test.redis:f:' + self._arghash(1)))
+    # sentinels are pickled regardless of the codec
+    self.assertEqual([b'\x80', b'\x80'], [client.get(k)[:1] for k in client.keys()])
+
+  def testSoftTtl(self):
+    calls = []
+
+    @self.testee(softTtl = 0.2, codec = 'json')
+    def f(a):
+      calls.append(a)
+      return a * len(calls)
+
+    self.assertEqual(2, f(2))
+    key = 'cache:entry:hermes.test.redis:f:envelope:' + self._arghash(2)
+    self.assertEqual(360, self.testee.backend.client.ttl(key))
+
+    time.sleep(0.25)
+
+    # entry lock is held by another process, which is computing the entry
+    lock = self.testee.backend.lock(key)
+    lock.acquire()
+    try:
+      self.assertEqual(2, f(2))
+      self.testee.revalidator.join()
+      self.assertEqual([2], calls)
+    finally:
+      lock.release()
+
+    self.assertEqual(2, f(2))
+    self.testee.revalidator.join()
+    self.assertEqual([2, 2], calls)
+    self.assertEqual(4, f(2))
+
+  def testLoadTagged(self):
+    backend = self.testee.backend
+    tagKeys = ('cache:tag:b', 'cache:tag:a')
+    self.assertIsNone(backend.loadTagHash(tagKeys))
+    self.assertIsNone(backend.loadTagged(tagKeys, 'k1'))
+    self.assertEqual({}, backend.loadTagged(tagKeys, ['k1', 'k2']))
+
+    backend.saveTagged(tagKeys, mapping = {'k1' : 1, 'k2' : 2}, ttl = 10)
+    self.assertEqual(4, backend.client.dbsize())
+
+    tagHash = backend.loadTagHash(tagKeys)
+    self.assertEqual(tagHash, self._taghash(
+      a = pickle.loads(backend.client.get('cache:tag:a')),
+      b = pickle.loads(backend.client.get('cache:tag:b'))))
+    self.assertEqual(1, pickle.loads(backend.client.get('k1:' + tagHash)))
+
+    self.assertEqual(1, backend.loadTagged(tagKeys, 'k1'))
+    self.assertEqual({'k1' : 1, 'k2' : 2}, backend.loadTagged(tagKeys, ['k1', 'k2', 'k3']))
+
+    backend.removeTagged(tagKeys, 'k1')
+    self.assertIsNone(backend.loadTagged(tagKeys, 'k1'))
+
+    backend.remove('cache:tag:a')
+    self.assertIsNone(backend.loadTagHash(tagKeys))
+    self.assertNotEqual(tagHash, backend.loadTagHash(tagKeys, create = True))
+
+  def testSaveTagged(self):
+    backend = self.testee.backend
+    client  = backend.client
+    tagKeys = ('cache:tag:b', 'cache:tag:a')
+
+    backend.saveTagged(tagKeys, 'k1', {'v' : 1}, ttl = 10)
+    self.assertEqual(3, client.dbsize())
+    tagA = client.get('cache:tag:a')
+    self.assertEqual(-1, client.ttl('cache:tag:a'))
+    self.assertNotEqual(tagA, client.get('cache:tag:b'))
+
+    tagHash = backend.loadTagHash(tagKeys)
+    self.assertEqual({'v' : 1}, pickle.loads(client.get('k1:' + tagHash)))
+    self.assertEqual(10, client.ttl('k1:' + tagHash))
+
+    # existing tag entries are preserved
+    backend.remove('cache:tag:b')
+    backend.saveTagged(tagKeys, mapping = {'k2' : 2, 'k3' : 3})
+    self.assertEqual(tagA, client.get('cache:tag:a'))
+    tagHash = backend.loadTagHash(tagKeys)
+    self.assertEqual({'k2' : 2, 'k3' : 3}, backend.loadTagged(tagKeys, ['k1', 'k2', 'k3']))
+    self.assertEqual(-1, client.ttl('k2:' + tagHash))
+
+  def testPool(self):
+    pool = self.testee.backend.pool
+    self.assertIsInstance(pool, redis.redis.ConnectionPool)
+    self.assertNotIsInstance(pool, redis.redis.BlockingConnectionPool)
+
+    backend = redis.Backend(Mangler(), pool = pool, lockTimeout = 60)
+    self.assertIs(pool, backend.pool)
+    self.assertEqual({'lockTimeout' : 60}, backend._options)
+
+    backend = redis.Backend(Mangler(), blocking = True, maxConnections = 8, poolTimeout = 2,
+      socketPath = '/var/run/redis.sock', socketTimeout = 5, keepalive = True)
+    pool = backend.pool
+    self.assertIsInstance(pool, redis.redis.BlockingConnectionPool)
+    self.assertEqual(8, pool.max_connections)
+    self.assertEqual(2, pool.timeout)
+    self.assertIs(redis.redis.UnixDomainSocketConnection, pool.connection_class)
+    self.assertEqual('/var/run/redis.sock', pool.connection_kwargs['path'])
+    self.assertEqual(5, pool.connection_kwargs['socket_timeout'])
+    self.assertNotIn('socket_keepalive', pool.connection_kwargs)
+    self.assertEqual({}, backend._options)
+    # a connection is created without connecting
+    self.assertIsInstance(pool.make_connection(), redis.redis.UnixDomainSocketConnection)
+
+    backend = redis.Backend(Mangler(), keepalive = True, connectTimeout = 2)
+    connection = backend.pool.make_connection()
+    self.assertTrue(connection.socket_keepalive)
+    self.assertEqual(2, connection.socket_connect_timeout)
+
+  def testSubscriber(self):
+    backend = redis.Backend(Mangler(), blocking = True, maxConnections = 1, poolTimeout = 1)
+    pool    = backend.subscriber.connection_pool
+    self.assertIsNot(backend.pool, pool)
+    self.assertNotIsInstance(pool, redis.redis.BlockingConnectionPool)
+    for name in ('host', 'port', 'db', 'password', 'socket_timeout'):
+      self.assertEqual(backend.pool.connection_kwargs[name], pool.connection_kwargs[name])
+
+    holder = backend.lock('123')
+    waiter = backend.lock('123')
+    self.assertIs(backend.subscriber, waiter.subscriber)
+
+    result = []
+    def target():
+      result.append(waiter.acquire(True))
+      waiter.release()
+
+    self.assertTrue(holder.acquire(False))
+    thread = threading.Thread(target = target)
+    thread.start()
+    time.sleep(0.1)
+
+    # the waiter's subscription doesn't take the only connection of the pool
+    backend.save('key', 'value')
+    holder.release()
+    thread.join(5)
+    self.assertEqual([True], result)
+    self.assertEqual('value', backend.load('key'))
+
+
 class TestRedisLock(test.TestCase):
 
   def setUp(self):
@@ -369,7 +564,7 @@ class TestRedisLock(test.TestCase):
         self.assertTrue(self.testee.acquire(True))
         self.assertFalse(self.testee.acquire(False))
         self.assertEqual('123', self.testee.key)
-        self.assertEqual(900, self.testee.client.ttl(self.testee.key))
+        self.assertEqual(30, self.testee.client.ttl(self.testee.key))
       finally:
         self.testee.release()
 
@@ -395,6 +590,71 @@ class TestRedisLock(test.TestCase):
         self.assertFalse(self.testee.acquire(False))
         self.assertEqual('234', another.key)
 
+  def testNotification(self):
+    client = self.testee.client
+    waiter = redis.Lock('123', client, lockSleep = 30)
+    result = []
+
+    def target():
+      start = time.time()
+      result.append(waiter.acquire(True))
+      result.append(time.time() - start)
+      waiter.release()
+
+    self.assertTrue(self.testee.acquire(False))
+    thread = threading.Thread(target = target)
+    thread.start()
+
+    time.sleep(0.25)
+    self.assertEqual([], result)
+    self.testee.release()
+
+    thread.join(5)
+    self.assertTrue(result[0])
+    self.assertTrue(0.25 <= result[1] < 1, 'woken up by notification, not by timeout')
+    self.assertIs(None, client.get('123'))
+
+  def testOwnership(self):
+    client = self.testee.client
+    self.assertTrue(self.testee.acquire(False))
+    self.assertEqual(self.testee.token, client.get('123').decode())
+
+    # the lock has expired and is acquired by another
+    client.set('123', 'another')
+    self.assertFalse(self.testee.extend())
+    self.testee.release()
+    self.assertIsNone(self.testee.token)
+    self.assertEqual(b'another', client.get('123'))
+
+    # release of not acquired lock is no-op
+    self.testee.release()
+    self.assertEqual(b'another', client.get('123'))
+
+  def testRenewal(self):
+    testee = redis.Lock('123', self.testee.client, lockTimeout = 1, lockRenew = 0.1)
+    with testee:
+      self.testee.client.pexpire('123', 200)
+      time.sleep(0.35)
+      self.assertEqual(1, self.testee.client.ttl('123'))
+    self.assertIsNone(self.testee.client.get('123'))
+
+    testee = redis.Lock('123', self.testee.client, lockTimeout = 1, lockRenew = 0)
+    with testee:
+      self.testee.client.pexpire('123', 200)
+      time.sleep(0.35)
+      self.assertIsNone(self.testee.client.get('123'))
+
+  def testWait(self):
+    waiter = redis.Lock('123', self.testee.client, lockWait = 0.25)
+    with self.testee:
+      start = time.time()
+      self.assertFalse(waiter.acquire(True))
+      self.assertTrue(0.25 <= time.time() - start < 0.5)
+      self.assertIsNone(waiter.token)
+
+    self.assertTrue(waiter.acquire(True))
+    waiter.release()
+
 
 class TestRedisPerformance(test.TestCase):
 
@@ -406,7 +666,7 @@ class TestRedisPerformance(test.TestCase):
     self.testee.clean()
 
   def testPerformance(self):
-    test.benchmark(self.fixture)
+    benchmark.report(benchmark.run(self.testee, number = 1024, warmup = 128))
 
   def testLazyInit(self):
     server = test.FakeBackendServer()
@@ -0,0 +1,132 @@
+import os
+import pickle
+import signal
+
+from .. import test, Hermes
+from ..backend import shardedredis
+
+
+class TestShardedRedis(test.TestCase):
+
+  def setUp(self):
+    self.testee = Hermes(shardedredis.Backend, ttl = 360, lockTimeout = 120,
+      nodes = [{'db' : 1}, {'db' : 2}])
+    self.fixture = test.createFixture(self.testee)
+
+    self.testee.clean()
+
+  def tearDown(self):
+    self.testee.clean()
+
+  def getSizes(self):
+    return [n.client.dbsize() for n in self.testee.backend.nodes]
+
+  def testRing(self):
+    backend = self.testee.backend
+    self.assertEqual(2, len(backend.nodes))
+    self.assertEqual(128, len(backend._ring))
+
+    keys  = ['cache:entry:foo:{0}'.format(i) for i in range(1000)]
+    share = [sum(1 for k in keys if backend.node(k) is n) for n in backend.nodes]
+    self.assertTrue(all(s > 300 for s in share), share)
+
+    self.assertIs(backend.node('a:{user:1}:b'), backend.node('user:1'))
+    self.assertIs(backend.node('{user:1}'), backend.node('user:1'))
+    self.assertIs(backend.node('a:{}:b'), backend.node('a:{}:b'))
+    self.assertEqual('user:1', backend._hashTag('a:{user:1}:{b}'))
+    self.assertIsNone(backend._hashTag('a:{}:b}'))
+    self.assertIsNone(backend._hashTag('a:b}'))
+
+  def testMultiKey(self):
+    backend = self.testee.backend
+    mapping = {'k{0}'.format(i) : i for i in range(32)}
+    backend.save(mapping = mapping, ttl = 10)
+    self.assertEqual(32, sum(self.getSizes()))
+    self.assertTrue(all(self.getSizes()))
+
+    for k, v in mapping.items():
+      node = backend.node(k)
+      self.assertEqual(v, pickle.loads(node.client.get(k)))
+      self.assertEqual(10, node.client.ttl(k))
+
+    self.assertEqual(mapping, backend.load(list(mapping.keys()) + ['k99']))
+    self.assertEqual(7, backend.load('k7'))
+
+    backend.remove(['k{0}'.format(i) for i in range(16)])
+    self.assertEqual(16, sum(self.getSizes()))
+    self.assertEqual({'k20' : 20}, backend.load(['k1', 'k20']))
+
+  def testFork(self):
+    backend = self.testee.backend
+    mapping = {'k{0}'.format(i) : i for i in range(8)}
+    backend.save(mapping = mapping)
+    self.assertEqual(mapping, backend.load(list(mapping.keys())))
+
+    pid = os.fork()
+    if not pid:
+      # threads of the parent's pool don't exist in the child, a call would hang on it
+      signal.alarm(5)
+      os._exit(0 if backend.load(list(mapping.keys())) == mapping else 1)
+
+    self.assertEqual(0, os.waitpid(pid, 0)[1])
+    self.assertEqual(mapping, backend.load(list(mapping.keys())))
+
+  def testSimple(self):
+    for _ in range(4):
+      self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', b = 'beta'))
+      self.assertEqual(1, self.fixture.calls)
+      self.assertEqual(1, sum(self.getSizes()))
+
+    self.fixture.simple.invalidate('alpha', b = 'beta')
+    self.assertEqual(0, sum(self.getSizes()))
+
+  def testTagged(self):
+    for _ in range(4):
+      self.assertEqual('ae-hl', self.fixture.tagged('alpha', b = 'beta'))
+      self.assertEqual(1, self.fixture.calls)
+      self.assertEqual(3, sum(self.getSizes()))
+
+    self.testee.clean(['rock'])
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', b = 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+    self.fixture.tagged.invalidate('alpha', b = 'beta')
+    self.assertEqual(3, sum(self.getSizes()), '2 tags and old entry')
+
+    self.assertEqual(['ae-hl', 'aldamg'],
+      self.fixture.tagged.batch([('alpha', 'beta'), ('gamma', 'delta')]))
+    self.assertEqual(4, self.fixture.calls)
+
+  def testTaggedColocated(self):
+    calls = []
+
+    @self.testee(tags = ('{user:1}', '{user:1}:profile'),
+      key = lambda fn, a: 'user:{{user:1}}:{0}'.format(a))
+    def foo(a):
+      calls.append(a)
+      return a * 2
+
+    node = self.testee.backend.node('user:1')
+    for _ in range(2):
+      self.assertEqual(4, foo(2))
+      self.assertEqual([2], calls)
+      self.assertEqual(3, node.client.dbsize())
+      self.assertEqual(3, sum(self.getSizes()))
+
+    self.assertIs(node, self.testee.backend._tagNode(foo._tagKeys, 'user:{user:1}:2'))
+    self.assertIsNone(self.testee.backend._tagNode(foo._tagKeys, 'user:2'))
+
+    foo.invalidate(2)
+    self.assertEqual(2, node.client.dbsize())
+
+    self.testee.clean(['{user:1}'])
+    self.assertEqual(4, foo(2))
+    self.assertEqual([2, 2], calls)
+
+  def testLock(self):
+    lock = self.testee.backend.lock('cache:entry:foo')
+    node = self.testee.backend.node('cache:lock:foo')
+    self.assertEqual(node.client, lock.client)
+    self.assertTrue(lock.acquire())
+    self.assertFalse(self.testee.backend.lock('cache:entry:foo').acquire(False))
+    lock.release()
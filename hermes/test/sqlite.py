@@ -0,0 +1,209 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+
+from .. import test, Hermes, Mangler
+from ..backend import sqlite
+
+
+class TestSqlite(test.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path      = os.path.join(self.directory, 'cache.sqlite')
+
+    self.testee  = Hermes(sqlite.Backend, ttl = 360, path = self.path)
+    self.fixture = test.createFixture(self.testee)
+
+  def tearDown(self):
+    for name in os.listdir(self.directory):
+      os.remove(os.path.join(self.directory, name))
+    os.rmdir(self.directory)
+
+  def testSimple(self):
+    for _ in range(4):
+      self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+      self.assertEqual(1, self.fixture.calls)
+
+      key = 'cache:entry:hermes.test:Fixture:simple:' + self._arghash('alpha', 'beta')
+      self.assertEqual({key : 'ateb+ahpla'}, self.testee.backend.dump())
+
+    self.fixture.simple.invalidate('alpha', 'beta')
+    self.assertEqual({}, self.testee.backend.dump())
+
+  def testTagged(self):
+    for _ in range(4):
+      self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+      self.assertEqual(1, self.fixture.calls)
+      self.assertEqual(3, len(self.testee.backend.dump()))
+
+    self.testee.clean(['rock'])
+    self.assertEqual('ae-hl', self.fixture.tagged('alpha', 'beta'))
+    self.assertEqual(2, self.fixture.calls)
+
+  def testBatch(self):
+    result = self.fixture.simple.batch([('alpha', 'beta'), ('gamma', 'delta')])
+    self.assertEqual(['ateb+ahpla', 'atled+ammag'], result)
+    self.assertEqual(2, self.fixture.calls)
+    self.assertEqual(2, len(self.testee.backend.dump()))
+
+  def testPersistence(self):
+    self.assertEqual('ateb+ahpla', self.fixture.simple('alpha', 'beta'))
+
+    testee  = Hermes(sqlite.Backend, ttl = 360, path = self.path)
+    fixture = test.createFixture(testee)
+    self.assertEqual('ateb+ahpla', fixture.simple('alpha', 'beta'))
+    self.assertEqual(0, fixture.calls)
+
+    connection = sqlite3.connect(self.path)
+    self.assertEqual('wal', connection.execute('PRAGMA journal_mode').fetchone()[0])
+    connection.close()
+
+
+class TestSqliteBackend(test.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path      = os.path.join(self.directory, 'cache.sqlite')
+    self.testee    = sqlite.Backend(Mangler(), path = self.path, batchSize = 2)
+
+  def tearDown(self):
+    for name in os.listdir(self.directory):
+      os.remove(os.path.join(self.directory, name))
+    os.rmdir(self.directory)
+
+  def testExpiry(self):
+    self.testee.save('a', 1, ttl = 0.05)
+    self.testee.save('b', 2)
+    self.assertEqual(1, self.testee.load('a'))
+    self.assertEqual({'a' : 1, 'b' : 2}, self.testee.dump())
+
+    time.sleep(0.1)
+
+    self.assertIsNone(self.testee.load('a'))
+    self.assertEqual({'b' : 2}, self.testee.load(['a', 'b']))
+    self.assertEqual({'b' : 2}, self.testee.dump())
+
+  def testPrune(self):
+    self.testee.pruneLimit = 4
+    self.testee.save(mapping = {str(i) : i for i in range(10)}, ttl = 0.05)
+
+    time.sleep(0.1)
+
+    count = lambda: self.testee.connection.execute('SELECT COUNT(*) FROM entry').fetchone()[0]
+    self.testee.save('a', 1)
+    self.assertEqual(7, count())
+    self.testee.save(mapping = {'b' : 2, 'c' : 3})
+    self.assertEqual(5, count())
+    self.assertEqual({'a' : 1, 'b' : 2, 'c' : 3}, self.testee.dump())
+
+  def testBatch(self):
+    self.testee.save(mapping = {str(i) : i for i in range(5)})
+    self.assertEqual({'0' : 0, '2' : 2, '4' : 4}, self.testee.load(['0', '2', '4', '5', '6']))
+
+    self.testee.remove(['0', '1', '5'])
+    self.testee.remove('2')
+    self.assertEqual({'3' : 3, '4' : 4}, self.testee.dump())
+
+    self.testee.clean()
+    self.assertEqual({}, self.testee.dump())
+
+  def testThreads(self):
+    self.testee.save('a', 1)
+    connections = [self.testee.connection]
+
+    def target():
+      connections.append(self.testee.connection)
+      self.testee.save('b', self.testee.load('a') + 1)
+
+    thread = threading.Thread(target = target)
+    thread.start()
+    thread.join()
+
+    self.assertIsNot(connections[0], connections[1])
+    self.assertEqual({'a' : 1, 'b' : 2}, self.testee.dump())
+
+  def testProcess(self):
+    self.testee.save('a', 1)
+
+    pid = os.fork()
+    if not pid:
+      self.testee.save('b', self.testee.load('a') + 1)
+      os._exit(0)
+
+    os.waitpid(pid, 0)
+    self.assertEqual({'a' : 1, 'b' : 2}, self.testee.dump())
+
+
+class TestSqliteLock(test.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.backend   = sqlite.Backend(Mangler(), path = os.path.join(self.directory, 'lock'))
+    self.testee    = self.backend.lock('123')
+
+  def tearDown(self):
+    for name in os.listdir(self.directory):
+      os.remove(os.path.join(self.directory, name))
+    os.rmdir(self.directory)
+
+  def testAcquire(self):
+    for _ in range(2):
+      try:
+        self.assertTrue(self.testee.acquire(True))
+        self.assertFalse(self.testee.acquire(False))
+        self.assertEqual('cache:lock:123', self.testee.key)
+      finally:
+        self.testee.release()
+
+  def testWith(self):
+    with self.testee:
+      another = self.backend.lock('234')
+      with another:
+        self.assertFalse(another.acquire(False))
+        self.assertFalse(self.backend.lock('123').acquire(False))
+
+  def testOwnership(self):
+    self.assertTrue(self.testee.acquire(False))
+    with self.backend.connection as connection:
+      connection.execute('UPDATE lock SET token = ?', ('another',))
+
+    self.assertFalse(self.testee.extend())
+    self.testee.release()
+    self.assertFalse(self.backend.lock('123').acquire(False))
+
+  def testExpiry(self):
+    testee = sqlite.Lock(self.testee.key, self.backend, lockTimeout = 0.1, lockRenew = 0)
+    self.assertTrue(testee.acquire(False))
+    self.assertFalse(self.testee.acquire(False))
+
+    time.sleep(0.15)
+
+    self.assertTrue(self.testee.acquire(False))
+    self.testee.release()
+
+  def testNoExpiry(self):
+    testee = sqlite.Lock(self.testee.key, self.backend, lockTimeout = None)
+    self.assertEqual(0, testee.timeout)
+    self.assertEqual(0, testee.renew)
+    try:
+      self.assertTrue(testee.acquire(False))
+      self.assertTrue(testee.extend())
+      row = self.backend.connection.execute('SELECT expiry FROM lock').fetchone()
+      self.assertEqual((None,), row)
+      self.assertFalse(self.testee.acquire(False))
+    finally:
+      testee.release()
+
+    self.assertTrue(self.testee.acquire(False))
+    self.testee.release()
+
+  def testWait(self):
+    waiter = self.backend.lock('123')
+    waiter.wait = 0.25
+    with self.testee:
+      start = time.time()
+      self.assertFalse(waiter.acquire(True))
+      self.assertTrue(0.25 <= time.time() - start < 0.5)